@@ -5,8 +5,24 @@ Final Project
 """
 
 
+import math
+import numbers
+import queue
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import Future, TimeoutError
+from contextlib import contextmanager
+
+import numpy as np
+
 from arduino import Arduino, serial_transaction
-from byte_packing import pack_values, unpack_values
+from byte_packing import Codec, pack_values, unpack_values
+from cobs_encoder import cobs_encode
+from framing import FrameError, unframe
+from pipeline import SEQUENCED, STREAM, RequestTable
+from serial_engine import SerialEngine
+from shadow_state import ShadowState
 
 
 class BadCommandError(Exception):
@@ -20,33 +36,786 @@ class Command:
     REQUEST_ENCODER = 2
     SET_PID = 3
     SET_POSITION = 4
+    SUBSCRIBE_TELEMETRY = 5
+    REQUEST_ENCODER_HISTORY = 6
+    SET_FRAMING = 7
+    NEGOTIATE_BAUD = 8
+    HELLO = 9
+    BATCH = 10
+
+
+# commands that address motors take an optional trailing bitmask byte of
+# the motors to apply to; without one they apply to motor 0
+DEFAULT_MOTOR_MASK = 0x01
+MAX_MOTORS = 8
+
+# precompiled codecs for fixed command signatures
+SET_PID_CODEC = Codec("ffffffff", Command.SET_PID)
+
+# encoder replies: one count per motor
+ENCODER_DTYPE = np.dtype("<i4")
+
+# telemetry frames: device time (us), then encoder, setpoint and PID output per motor
+TELEMETRY_TIME_CODEC = Codec("I")
+TELEMETRY_DTYPE = np.dtype([("encoder", "<i4"), ("setpoint", "<i4"), ("output", "<f4")])
+
+# resend subscriptions this often (s) so the Arduino's heartbeat doesn't time out
+TELEMETRY_KEEPALIVE = 0.2
+
+# HELLO replies: the command, PROTOCOL_VERSION in firmware.ino and MOTOR_COUNT
+HELLO_CODEC = Codec("BBB")
+
+# seconds between HELLOs while waiting for the Arduino to boot
+HELLO_INTERVAL = 0.05
+
+# matches TIMEOUT_MS in firmware.ino: the Arduino stops every motor after
+# this long (s) without hearing from the host
+HEARTBEAT_TIMEOUT = 0.5
+
+# rates NEGOTIATE_BAUD can switch to, fastest first; all divide a 16 MHz
+# clock exactly, and match BAUD_RATES in firmware.ino
+BAUD_RATES = (2000000, 1000000, 500000, 250000)
+BAUD_CODEC = Codec("I")
+
+# the Arduino goes back to its boot rate if no ping arrives this long (s)
+# after switching, matching BAUD_VERIFY_MS in firmware.ino
+BAUD_VERIFY_TIME = 0.5
+
+# time (s) for the Arduino to finish its reply and switch, about a control loop
+BAUD_SETTLE_TIME = 0.02
+
+# history replies: start cursor and sample count, then packed samples
+HISTORY_HEADER_CODEC = Codec("II")
+HISTORY_DTYPE = np.dtype([("time", "<u4"), ("encoder", "<i4"), ("output", "<f4")])
+
+# commands a BATCH frame can carry: those with short replies and no effect
+# on the link, matching batchable() in firmware.ino
+BATCHABLE = frozenset((
+    Command.SET_MOTOR, Command.REQUEST_ENCODER, Command.SET_PID, Command.SET_POSITION, Command.SUBSCRIBE_TELEMETRY,
+))
+
+# first PROTOCOL_VERSION in firmware.ino that understands BATCH
+BATCH_VERSION = 2
+
+# longest batch of length prefixed commands that fits INCOMING_BUFFER in
+# firmware.ino, after COBS, framing and the command and sequence ID bytes
+MAX_BATCH_LENGTH = 192
+
+# most commands per batch whose replies, an encoder count per motor at
+# most, are sure to fit REPLY_LENGTH in firmware.ino
+MAX_BATCH_COMMANDS = 24
+
+
+def motor_mask(motors):
+    """Build the bitmask byte addressing some motors.
+
+    Args:
+        motors: A motor index, or an iterable of indices.
+
+    Returns:
+        The mask byte, or b"" for motor 0 alone, which needs no mask.
+
+    Raises:
+        BadCommandError: If an index is out of range.
+    """
+    if isinstance(motors, numbers.Integral):
+        motors = (motors,)
+
+    mask = 0
+    for motor in motors:
+        if not 0 <= motor < MAX_MOTORS:
+            raise BadCommandError(f"Invalid motor index {repr(motor)}")
+        mask |= 1 << motor
+
+    if mask == DEFAULT_MOTOR_MASK:
+        return b""
+    return bytes([mask])
+
+
+def motor_indices(motors):
+    """List the motors a motor argument or mask byte addresses.
+
+    Args:
+        motors: A motor index, an iterable of indices, or a mask from motor_mask().
+
+    Returns:
+        List of motor indices.
+    """
+    if isinstance(motors, numbers.Integral):
+        return [motors]
+    if isinstance(motors, bytes):
+        mask = motors[0] if motors else DEFAULT_MOTOR_MASK
+        return [motor for motor in range(MAX_MOTORS) if mask & (1 << motor)]
+    return list(motors)
+
+
+# commands that change a setting the shadow state tracks
+SETTINGS = (Command.SET_MOTOR, Command.SET_POSITION, Command.SET_PID)
+
+
+def setting_fields(command, args):
+    """Name the per-motor values a setting command writes, for the shadow state.
+
+    Args:
+        command: SET_MOTOR, SET_POSITION or SET_PID.
+        args: The command's arguments, without the motor mask.
+
+    Returns:
+        Dictionary of field name to value.
+    """
+    if command == Command.SET_MOTOR:
+        return {"mode": "analog", "speed": args[0]}
+    if command == Command.SET_POSITION:
+        return {"mode": "position", "setpoint": args[0]}
+    return {"pid": args[0]}
+
+
+def decode_encoders(frame):
+    """Decode an encoder reply without copying it.
+
+    Args:
+        frame: Reply to REQUEST_ENCODER.
+
+    Returns:
+        Array of encoder counts, one per motor.
+    """
+    return np.frombuffer(frame, dtype=ENCODER_DTYPE)
+
+
+def decode_telemetry(frame):
+    """Decode a telemetry frame without copying the motor states.
+
+    Args:
+        frame: Streamed telemetry frame, including its first byte.
 
+    Returns:
+        A tuple of (raw device time in microseconds, structured array with
+        "encoder", "setpoint" and "output" fields, one row per motor).
+    """
+    (raw,) = TELEMETRY_TIME_CODEC.unpack(frame[1:])
+    motors = np.frombuffer(frame, dtype=TELEMETRY_DTYPE, offset=1 + TELEMETRY_TIME_CODEC.size)
+    return raw, motors
+
+
+def decode_history(frame):
+    """Decode a history reply without copying the samples.
+
+    Args:
+        frame: Reply to REQUEST_ENCODER_HISTORY.
+
+    Returns:
+        A tuple of (cursor of the first sample, samples structured array).
+    """
+    start, count = HISTORY_HEADER_CODEC.unpack(frame)
+    samples = np.frombuffer(frame, dtype=HISTORY_DTYPE, count=count, offset=HISTORY_HEADER_CODEC.size)
+    return start, samples
+
+
+def split_batch(frame):
+    """Split a BATCH reply into the replies of its commands.
+
+    Args:
+        frame: Reply to BATCH, each reply after its length byte.
+
+    Returns:
+        List of reply bytes, in the order the commands were batched.
+
+    Raises:
+        ValueError: If a reply runs past the end of the frame.
+    """
+    replies = []
+    offset = 0
+    while offset < len(frame):
+        end = offset + 1 + frame[offset]
+        if end > len(frame):
+            raise ValueError(f"Batch reply cut short: {len(frame)} bytes")
+        replies.append(bytes(frame[offset + 1:end]))
+        offset = end
+    return replies
+
+
+TelemetrySample = namedtuple("TelemetrySample", ["time", "encoder", "setpoint", "output"])
+
+# a command collected by ArduController.batch(): its ID, arguments (without
+# the motor mask) and motors, its bytes in the batch, how to decode its
+# reply, and its Future
+BatchedCommand = namedtuple("BatchedCommand", ["command", "args", "motor", "message", "decode", "future"])
+
+
+def no_reply(frame):
+    """Decode the empty reply of a command with no return value."""
+    return None
+
+
+class CommandBatch:
+    """Commands collected by ArduController.batch(), sent together once
+    the with block ends.
+
+    Each call returns a Future that resolves to what the command's own
+    method would return, once the batch's reply arrives.
+    """
+    def __init__(self, controller):
+        """
+        Args:
+            controller: The ArduController to send the batch with.
+        """
+        self.controller = controller
+        self.commands = []
+        # the reply to each command in order, once sent
+        self.results = None
+
+    def add(self, command, args=(), motor=0, decode=no_reply):
+        """Add a command to the batch.
+
+        Args:
+            command: Instruction ID from BATCHABLE.
+            args: values to send, without the motor mask.
+            motor: motor index, or iterable of indices. Default is 0.
+            decode: function decoding the command's raw reply.
+
+        Returns:
+            Future resolving to the decoded reply.
+
+        Raises:
+            BadCommandError: If the command can't be batched.
+        """
+        if command not in BATCHABLE:
+            raise BadCommandError(f"Command {repr(command)} can't be batched")
+        try:
+            message = bytes([command]) + pack_values(args) + motor_mask(motor)
+        except ValueError:
+            raise BadCommandError(f"Invalid command argument list {repr(args)}")
+
+        future = Future()
+        self.commands.append(BatchedCommand(command, tuple(args), motor, message, decode, future))
+        return future
+
+    def set_motor(self, speed, motor=0):
+        """Set the motor speed.
+
+        Args:
+            speed: between -255 and 255, inclusive.
+            motor: motor index, or iterable of indices. Default is 0.
+
+        Returns:
+            Future resolving to None.
+        """
+        assert -255 <= speed <= 255
+        return self.add(Command.SET_MOTOR, (int(speed),), motor)
+
+    def set_pid(self, KP, KI, KD, zero_output, min_output, max_output, I_region, I_max, motor=0):
+        """Set the PID parameters.
+
+        Args:
+            KP: Proportional gain.
+            KI: Integral gain.
+            KD: Derivative gain.
+            zero_output: Output cutoff.
+            min_output: Minimum output.
+            max_output: Maximum output.
+            I_region: Integration region.
+            I_max: Integration max.
+            motor: motor index, or iterable of indices. Default is 0.
+
+        Returns:
+            Future resolving to None.
+        """
+        packed = SET_PID_CODEC.pack(
+            float(KP),
+            float(KI),
+            float(KD),
+            float(zero_output),
+            float(min_output),
+            float(max_output),
+            float(I_region),
+            float(I_max),
+        )
+        return self.add(Command.SET_PID, (packed[1:],), motor)
+
+    def set_position(self, position, motor=0):
+        """Set PID setpoint.
+
+        Args:
+            position: new setpoint
+            motor: motor index, or iterable of indices. Default is 0.
+
+        Returns:
+            Future resolving to a list holding the echoed back position.
+        """
+        return self.add(Command.SET_POSITION, (int(position),), motor, lambda frame: unpack_values(frame, "i")[0])
+
+    def request_encoder(self):
+        """Request encoder counts.
+
+        Returns:
+            Future resolving to a list of all encoders positions.
+        """
+        return self.add(Command.REQUEST_ENCODER, decode=lambda frame: decode_encoders(frame).tolist())
+
+    def request_encoders(self):
+        """Request every motor's encoder count.
+
+        Returns:
+            Future resolving to a NumPy array of encoder counts, indexed by motor.
+        """
+        return self.add(Command.REQUEST_ENCODER, decode=decode_encoders)
+
+    def subscribe_telemetry(self, rate):
+        """Ask the Arduino to stream telemetry. Needs pipelined mode.
+
+        Args:
+            rate: samples per second. 0 stops streaming.
+
+        Returns:
+            Future resolving to None.
+        """
+        assert self.controller.pipelined, "telemetry needs pipelined=True"
+        return self.add(Command.SUBSCRIBE_TELEMETRY, (int(1e6 / rate) if rate else 0,))
+
+    def cancel(self):
+        """Drop every command without sending it."""
+        for batched in self.commands:
+            batched.future.cancel()
+        self.commands = []
 
 
 class ArduController(Arduino):
     """Handles communication between Arduino and Jetson."""
-    def __init__(self, port="/dev/ttyACM0", baud_rate=115200):
+    command_names = {value: name for name, value in vars(Command).items() if name.isupper()}
+
+    def __init__(self, port="/dev/ttyACM0", baud_rate=115200, pipelined=False, max_baud=None, startup_delay=None,
+                 write_interval=0.0, **kwargs):
         """
         Initializes the Arduino object with the specified serial port and baud rate.
 
         Args:
             port (str): The serial port to connect to. Default is "/dev/ttyACM0".
             baud_rate (int): The baud rate for the serial connection. Default is 115200.
+            pipelined (bool): Tag every request with a sequence ID so many can be
+                in flight at once. Needs firmware that echoes sequence IDs. Default is False.
+            max_baud (int): Switch to the fastest rate in BAUD_RATES up to this
+                once connected, falling back to baud_rate if the faster link
+                doesn't work. Default is None (stay at baud_rate).
+            startup_delay (float): Seconds to sleep after opening the port
+                instead of waiting for a HELLO reply, for firmware without
+                HELLO. Default is None (handshake).
+            write_interval (float): Least seconds between writes of the same
+                setting. Updates in between are held, and only the latest is
+                written once the interval is up. Default is 0 (write every
+                change straight away).
+            **kwargs: Additional keyword arguments for Arduino.
+        """
+        self.pipelined = pipelined
+        self.max_baud = max_baud
+        self.write_interval = write_interval
+        # what the Arduino is known to be set to, so writes that change
+        # nothing can be skipped
+        self.shadow = ShadowState()
+        self.write_lock = threading.Lock()
+        # held updates by (command, motor mask), as functions writing them,
+        # the timers that write them, and when each setting was last written
+        self.held_writes = {}
+        self.write_timers = {}
+        self.last_written = {}
+        # when the last frame went out, to tell when the heartbeat lapsed
+        self.last_sent = time.monotonic()
+        # rate negotiated last time, to look for the Arduino at on reconnect
+        self.link_baud = None
+        # from the HELLO reply
+        self.firmware_version = None
+        self.motor_count = None
+        # last settings sent, by (command, motor mask), to restore on reconnect
+        self.link_state = OrderedDict()
+        self.requests = RequestTable()
+        self.telemetry_queue = queue.Queue()
+        self.history_cursor = 0
+        # encoded frames of sequenced requests awaiting replies, by sequence ID
+        self.in_flight = {}
+        if pipelined:
+            kwargs["engine"] = True
+        super().__init__(port, baud_rate, startup_delay=startup_delay, **kwargs)
+
+    def make_engine(self):
+        """Create the I/O engine, routing sequenced replies in pipelined mode.
+
+        Returns:
+            A SerialEngine that is not started yet.
+        """
+        if self.pipelined:
+            return SerialEngine(self.ser, on_frame=self.handle_frame, stats=self.stats, on_error=self.link_lost)
+        return super().make_engine()
+
+    def wait_ready(self):
+        """Send HELLO until the Arduino answers, instead of sleeping through its boot.
+
+        The firmware answers as soon as setup() finishes. HELLO also puts it
+        back to unframed mode with telemetry off, so a board that wasn't
+        reset by the reconnect starts from the same state as one that was.
+        Sleeps for startup_delay instead if it was given.
+
+        Raises:
+            ConnectionError: If no answer comes within connect_timeout.
+        """
+        if self.startup_delay is not None:
+            super().wait_ready()
+            return
+
+        # a board that kept running may still be at the negotiated rate
+        rates = [self.ser.baudrate]
+        if self.link_baud not in (None, self.ser.baudrate):
+            rates.append(self.link_baud)
+
+        timeout = self.ser.timeout
+        self.ser.timeout = HELLO_INTERVAL
+        deadline = time.monotonic() + self.connect_timeout
+        attempt = 0
+        try:
+            while time.monotonic() < deadline:
+                self.ser.baudrate = rates[attempt % len(rates)]
+                attempt += 1
+                self.ser.reset_input_buffer()
+                self.send(cobs_encode(bytes([Command.HELLO])))
+
+                # skip anything left over from before the reconnect
+                ping_deadline = time.monotonic() + HELLO_INTERVAL
+                while time.monotonic() < ping_deadline:
+                    reply = self.receive_frame()
+                    if reply is None:
+                        break
+                    if len(reply) == HELLO_CODEC.size and reply[0] == Command.HELLO:
+                        _, self.firmware_version, self.motor_count = HELLO_CODEC.unpack(reply)
+                        return
+        finally:
+            self.ser.timeout = timeout
+
+        raise ConnectionError(
+            f"No HELLO from the Arduino on {self.port} within {self.connect_timeout} s; "
+            "is its firmware up to date? Pass startup_delay for older firmware."
+        )
+
+    def start_link(self):
+        """Switch the Arduino to framed mode and a faster baud rate if asked to.
+
+        Raises:
+            ConnectionError: If the Arduino doesn't confirm framed mode, or
+                stops answering while changing baud rate.
+        """
+        if self.framed:
+            self.start_framing()
+        if self.max_baud is not None:
+            self.link_baud = self.negotiate_baud()
+
+    def resume(self):
+        """Restore the Arduino's settings after a reconnect, then resend every
+        request still waiting for a reply.
+
+        Settings go out in the order they were last sent, so each motor
+        ends up in the mode it was last put in.
+        """
+        # the Arduino may have rebooted, so nothing it was set to is known
+        self.shadow.clear()
+        for (command, mask), args in list(self.link_state.items()):
+            with self.confirming(command, args, motor_indices(mask)):
+                args = args + (mask,) if mask else args
+                if self.pipelined:
+                    self.wait_reply(self.send_sequenced(command, args, None))
+                    continue
+
+                self.send_command(command, args)
+                # set_position echoes its setpoint, and framed mode acks everything
+                if self.framed or command == Command.SET_POSITION:
+                    self.read()
+
+        for encoded in list(self.in_flight.values()):
+            self.send(encoded)
+
+    def remember(self, command, args, motor):
+        """Keep a setting to restore on reconnect.
+
+        Args:
+            command: Instruction ID from Command.
+            args: The command's arguments, without the motor mask.
+            motor: motor index, or iterable of indices.
+        """
+        key = (command, motor_mask(motor))
+        self.link_state[key] = tuple(args)
+        self.link_state.move_to_end(key)
+
+    def skip_write(self, command, args, motor, write, hold=True):
+        """Decide whether a setting can go without being written now.
+
+        It's skipped if the Arduino already has it. Within write_interval
+        of the last write of the same setting it's held instead, replacing
+        any update already held, and written once the interval is up.
+
+        Args:
+            command: Instruction ID from Command.
+            args: The command's arguments, without the motor mask.
+            motor: motor index, or iterable of indices.
+            write: Function writing the setting, called when a held update is due.
+            hold: Hold updates within write_interval. Default is True.
+
+        Returns:
+            True if the caller shouldn't write it now.
+        """
+        key = (command, motor_mask(motor))
+        with self.write_lock:
+            self.expire_shadow()
+            if self.shadow.matches(motor_indices(motor), setting_fields(command, args)):
+                # a held older update would undo this one
+                self.drop_held(key)
+                if self.stats is not None:
+                    self.stats.skipped_writes += 1
+                return True
+
+            now = time.monotonic()
+            due = self.last_written.get(key, -math.inf) + self.write_interval
+            if hold and now < due:
+                if self.drop_held(key, cancel=False) and self.stats is not None:
+                    self.stats.coalesced_writes += 1
+                self.held_writes[key] = write
+                if key not in self.write_timers:
+                    timer = self.write_timers[key] = threading.Timer(due - now, self.write_held, (key,))
+                    timer.daemon = True
+                    timer.start()
+                return True
+
+            # written now, so anything held is out of date
+            if self.drop_held(key) and self.stats is not None:
+                self.stats.coalesced_writes += 1
+            self.last_written[key] = now
+            return False
+
+    def drop_held(self, key, cancel=True):
+        """Forget a held update.
+
+        Args:
+            key: (command, motor mask) of the setting.
+            cancel: Also cancel the timer that would write it. Default is True.
+
+        Returns:
+            True if an update was held.
         """
-        super().__init__(port, baud_rate)
+        if cancel:
+            timer = self.write_timers.pop(key, None)
+            if timer is not None:
+                timer.cancel()
+        return self.held_writes.pop(key, None) is not None
+
+    def write_held(self, key, now=False):
+        """Write a held update, from its timer or flush_writes().
+
+        Args:
+            key: (command, motor mask) of the setting.
+            now: Write it even if write_interval isn't up. Default is False.
+        """
+        with self.write_lock:
+            self.write_timers.pop(key, None)
+            write = self.held_writes.pop(key, None)
+            if now:
+                self.last_written.pop(key, None)
+        if write is None:
+            return
+        try:
+            write()
+        except (TimeoutError, ConnectionError, OSError):
+            # the shadow state forgot the setting, so the next update is written
+            pass
+
+    def flush_writes(self):
+        """Write every held update now, e.g. at the end of a tuning run."""
+        with self.write_lock:
+            keys = list(self.held_writes)
+            for key in keys:
+                timer = self.write_timers.pop(key, None)
+                if timer is not None:
+                    timer.cancel()
+        for key in keys:
+            self.write_held(key, now=True)
+
+    def expire_shadow(self):
+        """Forget every motor's mode if the link has been quiet long enough
+        for the Arduino's heartbeat to stop the motors.
+
+        Half the timeout leaves room for transit time and the Arduino's clock.
+        """
+        if time.monotonic() - self.last_sent > HEARTBEAT_TIMEOUT / 2:
+            self.shadow.forget(fields=("mode",))
+
+    @contextmanager
+    def confirming(self, command, args, motor):
+        """Forget a setting while it's written, and confirm it once the
+        Arduino acknowledges it. A failed write leaves it forgotten.
+
+        Settings the Arduino doesn't acknowledge (unframed set_motor and
+        set_pid) are confirmed once sent.
+
+        Args:
+            command: Instruction ID from Command.
+            args: The command's arguments, without the motor mask.
+            motor: motor index, or iterable of indices.
+        """
+        motors = motor_indices(motor)
+        fields = setting_fields(command, args)
+        self.shadow.forget(motors, fields)
+        yield
+        self.shadow.confirm(motors, fields)
+
+    def start_framing(self):
+        """Switch the Arduino to framed mode.
+
+        The switch is an unframed two byte frame, which the firmware
+        accepts in either mode. It replies in framed mode.
+
+        Raises:
+            ConnectionError: If the Arduino doesn't confirm the switch,
+                e.g. because its firmware predates framing.
+        """
+        self.framed = False
+        encoded = self.write(bytes([Command.SET_FRAMING, 1]))
+        self.framed = True
+        # resent if the reply goes missing
+        self.last_frame = encoded
+        if self.read() != b"\x01":
+            raise ConnectionError("Arduino didn't switch to framed mode; is its firmware up to date?")
+
+    def negotiate_baud(self):
+        """Move the link to the fastest rate both ends support, up to max_baud.
+
+        Offers the rates, and if the Arduino picks one, both ends switch
+        and a ping checks the new link. If the ping goes unanswered, both
+        ends go back to the rate the port opened at: the Arduino on its own
+        once BAUD_VERIFY_TIME passes without a ping. Runs before the engine
+        starts, while nothing else uses the port.
+
+        Returns:
+            The baud rate in use afterwards.
+
+        Raises:
+            ConnectionError: If the Arduino answers at neither rate.
+        """
+        boot = self.ser.baudrate
+        rates = [rate for rate in BAUD_RATES if boot < rate <= self.max_baud]
+        if not rates:
+            return boot
+
+        self.send_command(Command.NEGOTIATE_BAUD, rates)
+        reply = self.read()
+        # older firmware doesn't answer, and 0 means no rate in common
+        if reply is None or len(reply) != BAUD_CODEC.size:
+            return boot
+        (rate,) = BAUD_CODEC.unpack(reply)
+        if rate not in rates:
+            return boot
+
+        self.ser.baudrate = rate
+        switched = time.monotonic()
+        time.sleep(BAUD_SETTLE_TIME)
+        if self.ping_baud(rate):
+            return rate
+
+        # wait for the Arduino to give up on the new rate too
+        self.ser.baudrate = boot
+        time.sleep(max(0.0, switched + BAUD_VERIFY_TIME - time.monotonic()))
+        self.ser.reset_input_buffer()
+        if self.ping_baud(boot):
+            return boot
+
+        # only our end missed the ping's reply; the Arduino kept the new rate
+        self.ser.baudrate = rate
+        if self.ping_baud(rate):
+            return rate
+        raise ConnectionError(f"Arduino stopped answering while switching to {rate} baud")
+
+    def ping_baud(self, rate):
+        """Check the link works at a baud rate, confirming it to the Arduino.
+
+        Args:
+            rate: The rate both ends should be using.
+
+        Returns:
+            True if the Arduino answered with the same rate.
+        """
+        self.ser.reset_input_buffer()
+        self.send_command(Command.NEGOTIATE_BAUD)
+        reply = self.read()
+        return reply is not None and len(reply) == BAUD_CODEC.size and BAUD_CODEC.unpack(reply) == (rate,)
+
+    def handle_frame(self, frame):
+        """Handle a frame received in pipelined mode.
+
+        Args:
+            frame: Decoded frame from the Arduino.
+        """
+        if self.framed:
+            try:
+                frame = unframe(frame)
+            except FrameError:
+                if self.stats is not None:
+                    self.stats.bad_frames += 1
+                # it could have been any outstanding reply, so a NACK for
+                # the last one won't do; ask for them all again
+                self.retransmit()
+                return
+            if frame is None:
+                if self.stats is not None:
+                    self.stats.nacks_received += 1
+                self.retransmit()
+                return
+
+        if not frame:
+            return
+        if frame[0] & STREAM:
+            self.telemetry_queue.put(frame)
+        else:
+            self.requests.resolve(frame)
+
+    def send(self, encoded):
+        """Write an already encoded frame, noting the time for the shadow state.
+
+        Args:
+            encoded: COBS encoded bytes, including the trailing zero.
+        """
+        self.expire_shadow()
+        self.last_sent = time.monotonic()
+        super().send(encoded)
+
+    def close(self):
+        """Close the serial port, failing any requests still in flight.
+
+        Held updates are dropped.
+        """
+        with self.write_lock:
+            for key in list(self.held_writes):
+                self.drop_held(key)
+        super().close()
+        self.requests.fail_all(ConnectionError("Serial port closed"))
 
     @serial_transaction
-    def set_motor(self, speed):
+    def set_motor(self, speed, motor=0):
         """Set the motor speed.
 
         Args:
             speed: between -255 and 255, inclusive.
+            motor: motor index, or iterable of indices. Default is 0.
         """
         assert -255 <= speed <= 255
-        self.send_command(Command.SET_MOTOR, (int(speed),))
+        args = (int(speed),)
+        self.remember(Command.SET_MOTOR, args, motor)
+        if self.skip_write(Command.SET_MOTOR, args, motor, lambda: self.set_motor(speed, motor)):
+            return
+
+        with self.confirming(Command.SET_MOTOR, args, motor):
+            if self.pipelined and self.framed:
+                # sequenced, so it can be sent again if damaged
+                self.wait_reply(self.send_sequenced(Command.SET_MOTOR, args, "", motor))
+                return
+
+            self.send_command(Command.SET_MOTOR, args, motor)
+            self.read_ack()
 
     @serial_transaction
-    def set_pid(self, KP, KI, KD, zero_output, min_output, max_output, I_region, I_max):
+    def set_pid(self, KP, KI, KD, zero_output, min_output, max_output, I_region, I_max, motor=0):
         """Set the PID parameters.
 
         Args:
@@ -58,57 +827,505 @@ class ArduController(Arduino):
             max_output: Maximum output.
             I_region: Integration region.
             I_max: Integration max.
+            motor: motor index, or iterable of indices. Default is 0.
         """
-        self.send_command(Command.SET_PID,
-            (float(KP),
+        packed = SET_PID_CODEC.pack(
+            float(KP),
             float(KI),
             float(KD),
             float(zero_output),
             float(min_output),
             float(max_output),
             float(I_region),
-            float(I_max))
+            float(I_max),
         )
+        # drop the command byte
+        args = (packed[1:],)
+        self.remember(Command.SET_PID, args, motor)
+        write = lambda: self.set_pid(KP, KI, KD, zero_output, min_output, max_output, I_region, I_max, motor)
+        if self.skip_write(Command.SET_PID, args, motor, write):
+            return
+
+        with self.confirming(Command.SET_PID, args, motor):
+            if self.pipelined and self.framed:
+                # sequenced, so it can be sent again if damaged
+                self.wait_reply(self.send_sequenced(Command.SET_PID, args, "", motor))
+                return
+
+            self.write(packed + motor_mask(motor))
+            self.read_ack()
 
     @serial_transaction
-    def set_position(self, position):
+    def set_position(self, position, motor=0):
         """Set PID setpoint.
 
         Args:
             position: new setpoint
+            motor: motor index, or iterable of indices. Default is 0.
 
         Returns:
-            echoed back position for confirmation
+            list holding the echoed back position for confirmation, in
+            every mode, or the same reply made up here if the Arduino
+            already had it or the write is held
         """
-        self.send_command(Command.SET_POSITION, (int(position),))
-        reply = self.read_pattern("i")[0]
+        if self.pipelined:
+            return self.wait_reply(self.set_position_async(position, motor))
+
+        args = (int(position),)
+        self.remember(Command.SET_POSITION, args, motor)
+        if self.skip_write(Command.SET_POSITION, args, motor, lambda: self.set_position(position, motor)):
+            return list(args)
+
+        with self.confirming(Command.SET_POSITION, args, motor):
+            self.send_command(Command.SET_POSITION, args, motor)
+            reply = self.read_pattern("i")[0]
         return reply
 
-    @serial_transaction
     def request_encoder(self):
         """Request encoder counts from arduino.
 
         Returns:
             List of all encoders positions.
+
+        Raises:
+            TimeoutError: If the reply doesn't arrive in time.
         """
+        encoders = self.request_encoders()
+        if encoders is None:
+            return None
+        return encoders.tolist()
+
+    def request_encoders(self):
+        """Request every motor's encoder count in one round trip.
+
+        Returns:
+            NumPy array of encoder counts, indexed by motor, or None if
+            the port is closed.
+
+        Raises:
+            TimeoutError: If the reply doesn't arrive in time.
+        """
+        if self.closed:
+            return None
+        if self.pipelined:
+            return self.wait_reply(self.request_encoders_async())
+
+        reply = self.encoder_transaction()
+        if reply is None:
+            # closed mid-transaction
+            return None
+        if not reply:
+            # read() counted the timeout
+            raise TimeoutError("No encoder reply from the Arduino")
+        return decode_encoders(reply)
+
+    @serial_transaction
+    def encoder_transaction(self):
+        """Send an encoder request and read back the raw reply."""
         self.send_command(Command.REQUEST_ENCODER)
-        results, msg = self.read_pattern("i")
-        return results
+        reply = self.read()
+        return None if reply is None else bytes(reply)
+
+
+    def request_history(self, cursor=None):
+        """Request the samples the Arduino recorded since a cursor.
+
+        The Arduino records one sample of motor 0 per control loop in a
+        ring buffer; the other motors aren't recorded. Samples older than
+        the buffer are lost; compare the returned cursor with the requested
+        one to detect gaps. At most 64 samples come back per call, so call
+        again if the reply is full.
+
+        Args:
+            cursor: Index of the first sample wanted. Defaults to just
+                after the last sample returned by the previous call.
+
+        Returns:
+            A tuple of (cursor of the first returned sample, samples), or
+            None if the port is closed. samples is a NumPy structured array
+            with motor 0's "time" (device microseconds, wrapping),
+            "encoder" and "output" fields.
+
+        Raises:
+            TimeoutError: If the reply doesn't arrive in time.
+        """
+        if self.closed:
+            return None
+        if cursor is None:
+            cursor = self.history_cursor
+
+        if self.pipelined:
+            frame = self.wait_reply(self.send_sequenced(
+                Command.REQUEST_ENCODER_HISTORY, (cursor,), None
+            ))
+        else:
+            frame = self.history_transaction(cursor)
+            if frame is None:
+                # closed mid-transaction
+                return None
+            if not frame:
+                # read() counted the timeout
+                raise TimeoutError("No history reply from the Arduino")
+
+        start, samples = decode_history(frame)
+        self.history_cursor = start + len(samples)
+        return start, samples
+
+    @serial_transaction
+    def history_transaction(self, cursor):
+        """Send a history request and read back the raw reply."""
+        self.send_command(Command.REQUEST_ENCODER_HISTORY, (int(cursor),))
+        reply = self.read()
+        return None if reply is None else bytes(reply)
+
+    def set_position_async(self, position, motor=0):
+        """Set PID setpoint without waiting for the reply. Needs pipelined mode.
+
+        Args:
+            position: new setpoint
+            motor: motor index, or iterable of indices. Default is 0.
+
+        Returns:
+            Future resolving to a list holding the echoed back position. It
+            is already resolved if the Arduino had the position or the
+            write is held.
+        """
+        args = (int(position),)
+        self.remember(Command.SET_POSITION, args, motor)
+        if self.skip_write(Command.SET_POSITION, args, motor, lambda: self.set_position(position, motor)):
+            future = Future()
+            future.set_result(list(args))
+            return future
+
+        motors = motor_indices(motor)
+        fields = setting_fields(Command.SET_POSITION, args)
+        self.shadow.forget(motors, fields)
+        future = self.send_sequenced(Command.SET_POSITION, args, "i", motor)
+
+        def confirm(done):
+            if not done.cancelled() and done.exception() is None:
+                self.shadow.confirm(motors, fields)
+
+        future.add_done_callback(confirm)
+        return future
+
+    @contextmanager
+    def batch(self):
+        """Collect commands and send them in one frame, with one reply for
+        them all, instead of a round trip each.
+
+        Commands are sent in the order they were added once the with block
+        ends, split over more frames only if they don't fit the Arduino's
+        buffers. Nothing is sent if the block raises. Settings the Arduino
+        already has are skipped as usual, but never held for write_interval.
+
+        Example usage:
+            with ard.batch() as batch:
+                batch.set_pid(2, 0, 0.5, 0, -100, 100, 0, 0)
+                batch.set_position(1000)
+                encoders = batch.request_encoders()
+            print(encoders.result(), batch.results)
+
+        Yields:
+            A CommandBatch. Its results are every command's reply, in
+            order, once the block ends.
+
+        Raises:
+            BadCommandError: If the Arduino's firmware predates BATCH.
+            ConnectionError: If the Arduino doesn't answer every command.
+        """
+        if self.firmware_version is not None and self.firmware_version < BATCH_VERSION:
+            raise BadCommandError(
+                f"Arduino firmware protocol {self.firmware_version} can't batch commands; {BATCH_VERSION} is needed"
+            )
+
+        batch = CommandBatch(self)
+        try:
+            yield batch
+        except BaseException:
+            batch.cancel()
+            raise
+        batch.results = self.send_batch(batch.commands)
+
+    def send_batch(self, commands):
+        """Send batched commands and resolve their Futures from the replies.
+
+        Args:
+            commands: List of BatchedCommand.
+
+        Returns:
+            List of every command's decoded reply, in order.
+
+        Raises:
+            TimeoutError: If a reply doesn't arrive in time.
+            ConnectionError: If the port is closed, or the Arduino doesn't
+                answer every command, e.g. because its firmware predates BATCH.
+        """
+        # (message, commands in it) per frame, each fitting the Arduino's buffers
+        chunks = []
+        message = b""
+        pending = []
+        for batched in commands:
+            if batched.command in SETTINGS:
+                self.remember(batched.command, batched.args, batched.motor)
+                if self.skip_write(batched.command, batched.args, batched.motor, None, hold=False):
+                    # the same reply the Arduino would give
+                    batched.future.set_result(batched.decode(pack_values(batched.args)))
+                    continue
+
+            if pending and (len(message) + 1 + len(batched.message) > MAX_BATCH_LENGTH
+                            or len(pending) == MAX_BATCH_COMMANDS):
+                chunks.append((message, pending))
+                message = b""
+                pending = []
+            message += bytes([len(batched.message)]) + batched.message
+            pending.append(batched)
+        if pending:
+            chunks.append((message, pending))
+
+        sent = [batched for _, pending in chunks for batched in pending]
+        try:
+            if sent and self.closed:
+                raise ConnectionError("Serial port closed")
+            for batched in sent:
+                if batched.command in SETTINGS:
+                    self.shadow.forget(motor_indices(batched.motor), setting_fields(batched.command, batched.args))
+
+            if self.pipelined:
+                futures = [self.send_sequenced(Command.BATCH, (message,), None) for message, _ in chunks]
+                frames = [self.wait_reply(future) for future in futures]
+            else:
+                frames = [self.batch_transaction(message) for message, _ in chunks]
+
+            for frame, (_, pending) in zip(frames, chunks):
+                if frame is None:
+                    raise ConnectionError("Serial port closed")
+                if not frame:
+                    # read() counted the timeout; a batch reply is never empty
+                    raise TimeoutError("No batch reply from the Arduino")
+                try:
+                    replies = split_batch(frame)
+                except ValueError:
+                    replies = []
+                if len(replies) != len(pending):
+                    raise ConnectionError(
+                        f"Arduino answered {len(replies)} of {len(pending)} batched commands; "
+                        "is its firmware up to date?"
+                    )
+
+                for batched, reply in zip(pending, replies):
+                    if batched.command in SETTINGS:
+                        self.shadow.confirm(motor_indices(batched.motor), setting_fields(batched.command, batched.args))
+                    batched.future.set_result(batched.decode(reply))
+        except BaseException as e:
+            for batched in sent:
+                if not batched.future.done():
+                    batched.future.set_exception(e)
+            raise
+
+        return [batched.future.result() for batched in commands]
+
+    @serial_transaction
+    def batch_transaction(self, message):
+        """Send a batch's commands and read back the raw reply."""
+        self.send_command(Command.BATCH, (message,))
+        reply = self.read()
+        return None if reply is None else bytes(reply)
+
+    def request_encoder_async(self):
+        """Request encoder counts without waiting for the reply. Needs pipelined mode.
+
+        Returns:
+            Future resolving to a list of all encoders positions.
+        """
+        return self.send_sequenced(Command.REQUEST_ENCODER, (), lambda frame: decode_encoders(frame).tolist())
+
+    def request_encoders_async(self):
+        """Request every motor's encoder count without waiting. Needs pipelined mode.
+
+        Returns:
+            Future resolving to a NumPy array of encoder counts, indexed by motor.
+        """
+        return self.send_sequenced(Command.REQUEST_ENCODER, (), decode_encoders)
+
+    def subscribe_telemetry(self, rate):
+        """Ask the Arduino to stream telemetry. Needs pipelined mode.
+
+        Args:
+            rate: samples per second. 0 stops streaming.
+
+        Returns:
+            Future resolving when the Arduino acknowledges.
+        """
+        period_us = int(1e6 / rate) if rate else 0
+        return self.send_sequenced(Command.SUBSCRIBE_TELEMETRY, (period_us,))
+
+    def unsubscribe_telemetry(self):
+        """Ask the Arduino to stop streaming telemetry. Needs pipelined mode.
+
+        Returns:
+            Future resolving when the Arduino acknowledges.
+        """
+        return self.subscribe_telemetry(0)
+
+    def telemetry(self, rate=200):
+        """Stream telemetry samples from the Arduino. Needs pipelined mode.
+
+        Streaming stops when the generator is closed or the port closes.
+
+        Example usage:
+            for sample in ard.telemetry(100):
+                print(sample.time, sample.encoder[0])
+
+        Args:
+            rate: samples per second. Default is 200.
+
+        Yields:
+            TelemetrySample with the device time in seconds, and NumPy arrays
+            of the encoder counts, setpoints and PID outputs, indexed by motor.
+        """
+        # start from a clean slate
+        while not self.telemetry_queue.empty():
+            self.telemetry_queue.get_nowait()
+
+        self.subscribe_telemetry(rate)
+        last_subscribe = time.monotonic()
+
+        # device time is a wrapping 32 bit microsecond counter
+        last_raw = None
+        offset = 0
+
+        try:
+            while not self.closed:
+                # no use subscribing while reconnecting; resume() doesn't, so do it after
+                if self.connected.is_set() and time.monotonic() - last_subscribe > TELEMETRY_KEEPALIVE:
+                    self.subscribe_telemetry(rate)
+                    last_subscribe = time.monotonic()
+
+                try:
+                    frame = self.telemetry_queue.get(timeout=TELEMETRY_KEEPALIVE)
+                except queue.Empty:
+                    continue
+
+                raw, motors = decode_telemetry(frame)
+                if last_raw is not None and raw < last_raw:
+                    offset += 1 << 32
+                last_raw = raw
+
+                yield TelemetrySample(
+                    (raw + offset) / 1e6, motors["encoder"], motors["setpoint"], motors["output"]
+                )
+        finally:
+            if not self.closed:
+                self.unsubscribe_telemetry()
+
+    def send_sequenced(self, command, args=(), pattern="", motor=0):
+        """Send a command tagged with a sequence ID. Needs pipelined mode.
+
+        The Arduino echoes the ID at the start of its reply, and always
+        replies, even to commands with no return value.
+
+        Args:
+            command: Instruction ID from Command
+            args: values to send
+            pattern: pattern to unpack the reply with, a function to decode
+                the raw reply with, or None for the raw reply
+            motor: motor index, or iterable of indices. Default is 0.
+
+        Returns:
+            Future resolving to the list of reply values.
+        """
+        assert self.pipelined, "sequenced commands need pipelined=True"
+
+        try:
+            message = pack_values(args) + motor_mask(motor)
+        except ValueError:
+            raise BadCommandError(f"Invalid command argument list {repr(args)}")
+
+        future = Future()
+        seq = self.requests.add(future, pattern)
+        # forget the ID if the caller gives up on it
+        future.add_done_callback(lambda f: f.cancelled() and self.requests.discard(seq))
+        if self.stats is not None:
+            future.add_done_callback(self.stats.timer(command))
+
+        message = bytes([command | SEQUENCED, seq]) + message
+
+        # keep the frame to send again if it or its reply is damaged or lost
+        encoded = self.encode(message)
+        self.in_flight[seq] = encoded
+        future.add_done_callback(lambda f: self.in_flight.pop(seq, None))
+        self.send(encoded)
+        return future
+
+    def retransmit(self):
+        """Send the last frame again, or in pipelined mode every request still in flight.
+
+        Every command is safe to repeat, so resending a request whose
+        reply is on its way only costs a stray reply.
+        """
+        if not self.pipelined:
+            super().retransmit()
+            return
+
+        for encoded in list(self.in_flight.values()):
+            if self.stats is not None:
+                self.stats.retransmits += 1
+            self.send(encoded)
+
+    def read_ack(self):
+        """Read the empty reply framed mode gives commands with no reply."""
+        if self.framed and not self.pipelined:
+            self.read()
+
+    def wait_reply(self, future):
+        """Wait for a sequenced reply, giving up after the timeout given to __init__.
+
+        Args:
+            future: Future from send_sequenced.
+
+        Returns:
+            The decoded reply.
+
+        Raises:
+            TimeoutError: If the reply doesn't arrive in time. The request
+                is forgotten.
+        """
+        deadline = time.monotonic() + self.timeout
+        # a framed reply that lost its delimiter never completes, so ask again
+        step = self.retry_timeout if self.framed else self.timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                return future.result(max(0.0, min(step, remaining)))
+            except TimeoutError:
+                # resume() itself waits here too, and mustn't wait for itself
+                if not self.connected.is_set() and not self.closed and self.reconnecting != threading.get_ident():
+                    # resume() resends the request once the link is back
+                    if self.connected.wait(self.connect_timeout):
+                        deadline = time.monotonic() + self.timeout
+                        continue
+                if remaining <= step:
+                    future.cancel()
+                    if self.stats is not None:
+                        self.stats.timeouts += 1
+                    raise
+                self.retransmit()
 
-    
-    def send_command(self, command, args=()):
+    def send_command(self, command, args=(), motor=0):
         """Send a command to the Arduino.
 
         Args:
             command: Instruction ID from Command
             args: values to send
+            motor: motor index, or iterable of indices. Default is 0.
         """
         message = bytes([command])
         try:
             message += pack_values(args)
-            self.write(message)
         except ValueError:
             raise BadCommandError(f"Invalid command argument list {repr(args)}")
+        self.write(message + motor_mask(motor))
 
     def read_pattern(self, pattern):
         """Read values from the Arduino given a pattern.
@@ -5,10 +5,24 @@ Final Project
 """
 
 
-from cobs_encoder import cobs_encode, cobs_decode
+from cobs_encoder import cobs_check, cobs_encode, cobs_decode
+from fair_lock import FairLock
+from framing import NACK, FrameError, frame, unframe
+from link_stats import LinkStats
+from serial_engine import SerialEngine
 import serial
+import threading
 import time
 
+# seconds between attempts to open a port that has gone away
+RECONNECT_INTERVAL = 0.1
+
+
+class LockTimeoutError(Exception):
+    """Exception raised when a transaction can't get the serial port in time."""
+    pass
+
+
 def serial_transaction(method):
     """
     Decorator for thread-safe serial communication.
@@ -22,31 +36,85 @@ def serial_transaction(method):
     def f(self, *args, **kwargs):
         # let current transaction finish
         self.wait_for_unlock()
-        
-        # make sure Arduino is open
-        if self.closed:
-            return
-        
-        # call method
-        msg = method(self, *args, **kwargs)
-        
-        # unlock it for next transaction
-        self.unlock()
-        return msg
+
+        try:
+            # make sure Arduino is open
+            if self.closed:
+                return
+
+            # call method
+            generation = self.generation
+            try:
+                return method(self, *args, **kwargs)
+            except TimeoutError:
+                # a lost reply, not a lost port; TimeoutError is an OSError
+                raise
+            except (serial.SerialException, OSError):
+                if not self.auto_reconnect or self.closed:
+                    raise
+            # the port went away mid-transaction; every command is safe to
+            # repeat, so try once more on a fresh connection
+            self.reconnect(generation)
+            return method(self, *args, **kwargs)
+        finally:
+            # unlock it for next transaction
+            self.unlock()
 
     return f
 
 
 class Arduino:
     """An interface for Arduino communication through COBS encoding."""
-    def __init__(self, port="/dev/ttyACM0", baud_rate=115200):
+    # command ID to name, for labelling statistics
+    command_names = {}
+
+    def __init__(self, port="/dev/ttyACM0", baud_rate=115200, engine=False, lock_timeout=None, stats=True,
+                 framed=False, timeout=1, retry_timeout=0.1, startup_delay=3, auto_reconnect=True,
+                 connect_timeout=5):
         """
         Initializes the Arduino object with the specified serial port and baud rate.
 
         Args:
             port (str): The serial port to connect to. Default is "/dev/ttyACM0".
             baud_rate (int): The baud rate for the serial connection. Default is 115200.
+            engine (bool): Run I/O on dedicated reader/writer threads. Default is False.
+            lock_timeout (float): Seconds a transaction waits for the port before
+                raising LockTimeoutError. Default is None (wait forever).
+            stats (bool): Keep link statistics in self.stats. Default is True.
+            framed (bool): Check every frame with a length and CRC, asking for
+                damaged frames again. Default is False.
+            timeout (float): Seconds to wait for a reply. Default is 1.
+            retry_timeout (float): In framed mode, seconds without a whole reply
+                before sending the request again. Must be longer than the
+                slowest reply takes to arrive. Default is 0.1.
+            startup_delay (float): Seconds to give the Arduino to boot after
+                the port opens. Default is 3.
+            auto_reconnect (bool): If the port fails, e.g. after a USB glitch,
+                open it again and resume. Default is True.
+            connect_timeout (float): Seconds to keep trying to reconnect.
+                Default is 5.
         """
+        self.stats = LinkStats(self.command_names) if stats else None
+        self.lock = FairLock()
+        self.lock_timeout = lock_timeout
+        self.framed = framed
+        self.timeout = timeout
+        self.retry_timeout = retry_timeout
+        self.startup_delay = startup_delay
+        self.auto_reconnect = auto_reconnect
+        self.connect_timeout = connect_timeout
+        # set while the port is up; cleared while reconnecting
+        self.connected = threading.Event()
+        self.reconnect_lock = threading.Lock()
+        # thread ID of the reconnect in progress, which holds connected
+        # clear until the Arduino's settings are restored
+        self.reconnecting = None
+        # counts successful opens, so a failure is only handled once
+        self.generation = 0
+        # last frame written, kept in framed mode to send again on request
+        self.last_frame = None
+        self.use_engine = engine
+        self.engine = None
         self.reopen(port, baud_rate)
     
     def reopen(self, port="/dev/ttyACM0", baud_rate=115200):
@@ -57,28 +125,159 @@ class Arduino:
             port (str): The serial port to connect to. Default is "/dev/ttyACM0".
             baud_rate (int): The baud rate for the serial connection. Default is 115200.
         """
-        self.ser = serial.Serial(port, baud_rate, timeout=1, write_timeout=1)
+        if self.engine is not None:
+            self.engine.stop()
+            self.engine = None
+
+        self.port = port
+        self.baud_rate = baud_rate
+
+        # framed reads give up early and ask again instead of waiting out the timeout
+        timeout = self.retry_timeout if self.framed else self.timeout
+        self.ser = serial.Serial(port, baud_rate, timeout=timeout, write_timeout=1)
         if not self.ser.isOpen():
             self.ser.open()
 
-        time.sleep(3)
-
-        self.locked = False
+        self.wait_ready()
         self.closed = False
 
-    def wait_for_unlock(self):
-        """Wait until the serial port is unlocked, then relock it.s"""
-        while self.locked:
-            continue
-        self.locked = True
+        self.start_link()
+
+        if self.use_engine:
+            self.engine = self.make_engine()
+            self.engine.start()
+        self.generation += 1
+        if self.reconnecting is None:
+            self.connected.set()
+
+    def wait_ready(self):
+        """Wait for the Arduino to boot once the port opens.
+
+        Sleeps for startup_delay. Subclasses whose firmware answers a
+        handshake wait for that instead.
+        """
+        time.sleep(self.startup_delay)
+
+    def start_link(self):
+        """Prepare the link once the port is open, before the engine starts.
+
+        Subclasses switch the Arduino's protocol here. Does nothing by default.
+        """
+        pass
+
+    def wait_for_unlock(self, timeout=None):
+        """Wait until the serial port is unlocked, then relock it.
+
+        Waiting threads get the port in the order they asked for it.
+
+        Args:
+            timeout: Seconds to wait. Defaults to the lock_timeout given to __init__.
+
+        Raises:
+            LockTimeoutError: If the port isn't free before the timeout.
+        """
+        if timeout is None:
+            timeout = self.lock_timeout
+        if not self.lock.acquire(timeout):
+            if self.stats is not None:
+                self.stats.lock_timeouts += 1
+            raise LockTimeoutError(f"Serial port still busy after {timeout} s")
+        if self.stats is not None:
+            # the lock timed the wait; nobody else can add one until we release
+            self.stats.lock_wait.record(self.lock.wait_times[-1][1])
 
     def unlock(self):
         """Unlock the serial port."""
-        self.locked = False
+        self.lock.release()
+
+    def make_engine(self):
+        """Create the I/O engine for the open port.
+
+        Returns:
+            A SerialEngine that is not started yet.
+        """
+        return SerialEngine(self.ser, stats=self.stats, on_error=self.link_lost)
+
+    def link_lost(self, error):
+        """Reconnect in the background after the engine's port fails.
+
+        Args:
+            error: The exception the read or write raised.
+        """
+        if not self.auto_reconnect or self.closed:
+            return
+        threading.Thread(target=self.reconnect, args=(self.generation,), daemon=True).start()
+
+    def reconnect(self, generation=None):
+        """Open the port again after it failed, and resume where the link left off.
+
+        Keeps trying for connect_timeout, since a USB device takes a moment
+        to come back. Only one thread reconnects at a time.
+
+        Args:
+            generation: self.generation when the failure happened. If the
+                link has been reopened since, there is nothing to do.
+                Default is None, which always reconnects.
+
+        Raises:
+            ConnectionError: If the port can't be opened again in time. The
+                Arduino is closed.
+        """
+        with self.reconnect_lock:
+            if self.closed or generation is not None and generation != self.generation:
+                # closed on purpose, or another thread already reconnected
+                return
+            # hold other requests until resume() has restored the settings,
+            # so the board doesn't answer them in the state it rebooted into
+            self.reconnecting = threading.get_ident()
+            self.connected.clear()
+            try:
+                if self.engine is not None:
+                    self.engine.stop()
+                    self.engine = None
+                try:
+                    self.ser.close()
+                except (serial.SerialException, OSError):
+                    pass
+
+                deadline = time.monotonic() + self.connect_timeout
+                while True:
+                    if self.closed:
+                        # closed on purpose while we were trying
+                        return
+                    try:
+                        self.reopen(self.port, self.baud_rate)
+                        break
+                    except (serial.SerialException, OSError, ConnectionError) as e:
+                        try:
+                            self.ser.close()
+                        except (serial.SerialException, OSError):
+                            pass
+                        if time.monotonic() > deadline:
+                            self.close()
+                            raise ConnectionError(f"Couldn't reconnect to {self.port}") from e
+                    time.sleep(RECONNECT_INTERVAL)
+
+                if self.stats is not None:
+                    self.stats.reconnects += 1
+                self.resume()
+            finally:
+                self.reconnecting = None
+            self.connected.set()
+
+    def resume(self):
+        """Restore what the Arduino lost after a reconnect.
+
+        Subclasses resend settings and requests still waiting for a reply.
+        Does nothing by default.
+        """
+        pass
 
     def close(self):
         """Close the serial port."""
         self.closed = True
+        if self.engine is not None:
+            self.engine.stop()
         self.ser.close()
 
     def open(self):
@@ -95,22 +294,142 @@ class Arduino:
         Returns:
             True if the port is available, False otherwise.
         """
+        if self.engine is not None:
+            return self.engine.incoming.qsize()
         return self.ser.inWaiting()
 
     def read(self):
         """Read a COBS packet from the serial port.
 
+        In framed mode, damaged replies are asked for again and lost ones
+        are requested again, until a good reply arrives or the timeout passes.
+
         Returns:
-            Read bytes.
+            Read bytes. Empty if nothing arrived before the timeout.
         """
         if self.closed:
             return None
-        return cobs_decode(self.ser.read_until(b"\00"))
+        if self.framed:
+            return self.read_framed()
+
+        frame = self.receive_frame()
+        if self.stats is not None:
+            self.stats.end(frame is not None)
+        return bytearray() if frame is None else frame
+
+    def read_framed(self):
+        """Read a framed packet, recovering from damaged and lost frames.
+
+        Returns:
+            The payload. Empty if no good reply arrived before the timeout.
+        """
+        deadline = time.monotonic() + self.timeout
+        while time.monotonic() < deadline:
+            data = self.receive_frame()
+            if data is None:
+                # the request or its reply went missing; ask again
+                self.retransmit()
+                continue
+
+            try:
+                payload = unframe(data)
+            except FrameError:
+                if self.stats is not None:
+                    self.stats.bad_frames += 1
+                self.send_nack()
+                continue
+
+            if payload is None:
+                # the Arduino got a damaged frame from us
+                if self.stats is not None:
+                    self.stats.nacks_received += 1
+                self.retransmit()
+                continue
+
+            if self.stats is not None:
+                self.stats.end()
+            return payload
+
+        if self.stats is not None:
+            self.stats.end(False)
+        return bytearray()
+
+    def receive_frame(self):
+        """Wait for one whole COBS frame.
+
+        Returns:
+            The decoded frame, or None if no whole frame arrived before the
+            serial port's timeout.
+        """
+        if self.engine is not None:
+            return self.engine.receive(self.ser.timeout)
+
+        raw = self.ser.read_until(b"\00")
+        complete = raw.endswith(b"\00")
+        if self.stats is not None:
+            self.stats.bytes_in += len(raw)
+            if complete:
+                self.stats.frames_in += 1
+                if not cobs_check(raw[:-1]):
+                    self.stats.decode_failures += 1
+        # a frame cut off by the timeout is only noise
+        return cobs_decode(raw) if complete else None
 
     def write(self, data):
         """Write a COBS packet to the serial port.
 
         Args:
             data: data to be written to the serial port.
+
+        Returns:
+            The encoded frame as written.
+        """
+        if self.stats is not None:
+            self.stats.begin(data[0] & 0x7F)
+
+        encoded = self.encode(data)
+        if self.framed:
+            self.last_frame = encoded
+        self.send(encoded)
+        return encoded
+
+    def encode(self, data):
+        """Encode a packet for the wire, framing it in framed mode.
+
+        Args:
+            data: The packet.
+
+        Returns:
+            COBS encoded bytes, including the trailing zero.
+        """
+        if self.framed:
+            data = frame(data)
+        return cobs_encode(data)
+
+    def send(self, encoded):
+        """Write an already encoded frame.
+
+        Args:
+            encoded: COBS encoded bytes, including the trailing zero.
         """
-        self.ser.write(cobs_encode(data))
+        if self.engine is not None:
+            self.engine.send(encoded)
+            return
+
+        self.ser.write(encoded)
+        if self.stats is not None:
+            self.stats.frames_out += 1
+            self.stats.bytes_out += len(encoded)
+
+    def send_nack(self):
+        """Ask the Arduino to send its last frame again."""
+        if self.stats is not None:
+            self.stats.nacks_sent += 1
+        self.send(cobs_encode(NACK))
+
+    def retransmit(self):
+        """Send the last frame again, e.g. after a NACK."""
+        if self.last_frame is not None:
+            if self.stats is not None:
+                self.stats.retransmits += 1
+            self.send(self.last_frame)
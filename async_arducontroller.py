@@ -0,0 +1,288 @@
+"""Communicate to an Arduino running ArduController firmware from asyncio.
+
+Jackson Smith
+Final Project
+"""
+
+import asyncio
+import os
+
+import serial
+
+from arducontroller import Command, SET_PID_CODEC, decode_encoders, motor_mask
+from byte_packing import pack_values, unpack_values
+from cobs_encoder import CobsStreamDecoder, cobs_encode
+from pipeline import SEQUENCED, RequestTable
+from serial_engine import MAX_FRAME
+
+
+class AsyncArduController:
+    """Drive an ArduController board from the event loop, without threads.
+
+    The serial file descriptor is watched with the loop's reader and
+    writer callbacks. Frames and command IDs are the same as ArduController.
+
+    Example usage:
+        async with AsyncArduController("/dev/ttyACM0") as ard:
+            enc = await ard.request_encoder()
+    """
+    def __init__(self, port="/dev/ttyACM0", baud_rate=115200, sequenced=True, timeout=1):
+        """
+        Initialize an AsyncArduController. Call connect() before using it.
+
+        Args:
+            port (str): The serial port to connect to. Default is "/dev/ttyACM0".
+            baud_rate (int): The baud rate for the serial connection. Default is 115200.
+            sequenced (bool): Tag requests with sequence IDs so many coroutines can
+                have requests in flight at once. Needs firmware that echoes sequence IDs.
+                Otherwise requests take turns. Default is True.
+            timeout (float): Default seconds to wait for a reply. Default is 1.
+        """
+        self.port = port
+        self.baud_rate = baud_rate
+        self.sequenced = sequenced
+        self.timeout = timeout
+
+        self.ser = None
+        self.fd = None
+        self.loop = None
+        self.closed = True
+
+        self.decoder = CobsStreamDecoder(MAX_FRAME)
+        self.out_buffer = bytearray()
+        self.requests = RequestTable()
+
+        # stop-and-wait state for unsequenced mode
+        self.lock = asyncio.Lock()
+        self.waiter = None
+
+    async def connect(self, startup_delay=3):
+        """Open the serial port and start watching it.
+
+        Args:
+            startup_delay: Seconds to give the Arduino to boot. Default is 3.
+        """
+        self.loop = asyncio.get_running_loop()
+        self.ser = serial.Serial(self.port, self.baud_rate, timeout=0, write_timeout=0)
+        self.fd = self.ser.fileno()
+        self.closed = False
+
+        await asyncio.sleep(startup_delay)
+        self.ser.reset_input_buffer()
+        self.loop.add_reader(self.fd, self._on_readable)
+
+    def close(self, error=None):
+        """Stop watching and close the serial port, failing pending requests.
+
+        Args:
+            error: Exception to fail them with. Defaults to a ConnectionError.
+        """
+        if self.closed:
+            return
+        self.closed = True
+
+        self.loop.remove_reader(self.fd)
+        self.loop.remove_writer(self.fd)
+        self.ser.close()
+
+        error = error or ConnectionError("Serial port closed")
+        self.requests.fail_all(error)
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_exception(error)
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    async def set_motor(self, speed, motor=0, timeout=None):
+        """Set the motor speed.
+
+        Args:
+            speed: between -255 and 255, inclusive.
+            motor: motor index, or iterable of indices. Default is 0.
+            timeout: Seconds to wait for the acknowledgement.
+        """
+        assert -255 <= speed <= 255
+        data = pack_values([int(speed)]) + motor_mask(motor)
+        await self.request(Command.SET_MOTOR, data, None, timeout)
+
+    async def set_pid(self, KP, KI, KD, zero_output, min_output, max_output, I_region, I_max,
+                      motor=0, timeout=None):
+        """Set the PID parameters.
+
+        Args:
+            KP: Proportional gain.
+            KI: Integral gain.
+            KD: Derivative gain.
+            zero_output: Output cutoff.
+            min_output: Minimum output.
+            max_output: Maximum output.
+            I_region: Integration region.
+            I_max: Integration max.
+            motor: motor index, or iterable of indices. Default is 0.
+            timeout: Seconds to wait for the acknowledgement.
+        """
+        # reuse the precompiled codec, minus its command byte
+        data = SET_PID_CODEC.pack(
+            float(KP),
+            float(KI),
+            float(KD),
+            float(zero_output),
+            float(min_output),
+            float(max_output),
+            float(I_region),
+            float(I_max),
+        )[1:] + motor_mask(motor)
+        await self.request(Command.SET_PID, data, None, timeout)
+
+    async def set_position(self, position, motor=0, timeout=None):
+        """Set PID setpoint.
+
+        Args:
+            position: new setpoint
+            motor: motor index, or iterable of indices. Default is 0.
+            timeout: Seconds to wait for the reply.
+
+        Returns:
+            echoed back position for confirmation
+        """
+        data = pack_values([int(position)]) + motor_mask(motor)
+        results = await self.request(Command.SET_POSITION, data, "i", timeout)
+        return results[0]
+
+    async def request_encoder(self, timeout=None):
+        """Request encoder counts from arduino.
+
+        Args:
+            timeout: Seconds to wait for the reply.
+
+        Returns:
+            List of all encoders positions.
+        """
+        return (await self.request_encoders(timeout)).tolist()
+
+    async def request_encoders(self, timeout=None):
+        """Request every motor's encoder count in one round trip.
+
+        Args:
+            timeout: Seconds to wait for the reply.
+
+        Returns:
+            NumPy array of encoder counts, indexed by motor.
+        """
+        return await self.request(Command.REQUEST_ENCODER, b"", decode_encoders, timeout)
+
+    async def request(self, command, data=b"", pattern=None, timeout=None):
+        """Send a command and wait for its reply.
+
+        Cancelling the awaiting task or timing out forgets the request; a
+        reply that turns up later is dropped.
+
+        Args:
+            command: Instruction ID from Command
+            data: packed arguments
+            pattern: pattern to unpack the reply with, or a function to decode
+                the raw reply with. None if the command has no reply (in
+                sequenced mode its acknowledgement is still awaited).
+            timeout: Seconds to wait. Defaults to the timeout given to __init__.
+
+        Returns:
+            List of reply values, or the decoding function's result.
+
+        Raises:
+            asyncio.TimeoutError: If no reply comes in time.
+            ConnectionError: If the port is closed.
+        """
+        if self.closed:
+            raise ConnectionError("Serial port closed")
+        if timeout is None:
+            timeout = self.timeout
+
+        if self.sequenced:
+            future = self.loop.create_future()
+            seq = self.requests.add(future, pattern or "")
+            future.add_done_callback(lambda f: f.cancelled() and self.requests.discard(seq))
+            self._write(cobs_encode(bytes([command | SEQUENCED, seq]) + data))
+            return await asyncio.wait_for(future, timeout)
+
+        if pattern is None:
+            self._write(cobs_encode(bytes([command]) + data))
+            if self.closed:
+                raise ConnectionError("Serial port closed")
+            return []
+
+        async with self.lock:
+            self.waiter = self.loop.create_future()
+            try:
+                self._write(cobs_encode(bytes([command]) + data))
+                frame = await asyncio.wait_for(self.waiter, timeout)
+            finally:
+                self.waiter = None
+        if callable(pattern):
+            return pattern(bytes(frame))
+        results, _ = unpack_values(frame, pattern)
+        return results
+
+    def _write(self, frame):
+        """Write a frame now, or queue it until the port is writable."""
+        if not self.out_buffer:
+            try:
+                written = os.write(self.fd, frame)
+            except BlockingIOError:
+                written = 0
+            except OSError as e:
+                # fails whatever is waiting on this frame
+                self._disconnected(e)
+                return
+            if written == len(frame):
+                return
+            frame = frame[written:]
+            self.loop.add_writer(self.fd, self._on_writable)
+        self.out_buffer += frame
+
+    def _on_writable(self):
+        """Flush queued output when the port can take it."""
+        try:
+            written = os.write(self.fd, self.out_buffer)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            self._disconnected(e)
+            return
+        del self.out_buffer[:written]
+        if not self.out_buffer:
+            self.loop.remove_writer(self.fd)
+
+    def _on_readable(self):
+        """Read everything waiting and hand out complete frames."""
+        try:
+            chunk = os.read(self.fd, 4096)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            self._disconnected(e)
+            return
+        if not chunk:
+            # end of file: the port went away
+            self._disconnected(EOFError("Serial port closed by the other end"))
+            return
+
+        for frame in self.decoder.feed(chunk):
+            if not frame:
+                continue
+            if self.sequenced:
+                self.requests.resolve(frame)
+            elif self.waiter is not None and not self.waiter.done():
+                self.waiter.set_result(frame)
+
+    def _disconnected(self, error):
+        """Close after the port went away, which would otherwise keep the
+        reader callback firing.
+
+        Args:
+            error: What reading or writing the port raised.
+        """
+        self.close(ConnectionError(f"{self.port} disconnected: {error}"))
@@ -0,0 +1,80 @@
+"""Benchmark the sustained sample rate of the acquisition loop.
+
+Jackson Smith
+Final Project
+"""
+
+import queue
+import threading
+import time
+
+from arducontroller import ArduController
+from main import POLL_RATE, plot_encoders, plot_telemetry
+from scheduler import RateScheduler
+from simulator import HARDWARE_PROFILE, simulator_process
+
+
+class CountingGUI:
+    """Stands in for GUI, counting the samples it is asked to plot."""
+    def __init__(self, motor_count=1):
+        self.motors = [None] * motor_count
+        self.samples = 0
+
+    def plot(self, encoders, setpoints, timestamp=None):
+        self.samples += 1
+
+
+def measure(ard, target, args, duration):
+    """Run an acquisition loop for a while.
+
+    Returns:
+        Tuple of (samples per second, process CPU use in percent).
+    """
+    gui = CountingGUI()
+    thread = threading.Thread(target=target, args=(ard, gui) + args, daemon=True)
+
+    cpu_start = time.process_time()
+    thread.start()
+    time.sleep(duration)
+    samples = gui.samples
+    cpu = time.process_time() - cpu_start
+
+    ard.wait_for_unlock()
+    ard.close()
+    ard.unlock()
+    thread.join(2)
+    return samples / duration, 100 * cpu / duration
+
+
+def run(duration=3):
+    """Run the benchmark.
+
+    Args:
+        duration: Seconds per measurement.
+
+    Returns:
+        Dictionary of metric name to value.
+    """
+    results = {}
+    with simulator_process(**HARDWARE_PROFILE) as port:
+        ard = ArduController(port)
+        scheduler = RateScheduler(POLL_RATE)
+        rate, cpu = measure(ard, plot_encoders, (queue.Queue(), None, scheduler), duration)
+        stats = scheduler.stats()
+        results["poll_samples_per_s"] = rate
+        results["poll_cpu_percent"] = cpu
+        results["poll_achieved_hz"] = stats["achieved_rate"]
+        results["poll_jitter_p50_us"] = stats["jitter_p50_us"]
+        results["poll_jitter_p99_us"] = stats["jitter_p99_us"]
+        results["poll_missed_deadlines"] = stats["missed"]
+
+        ard = ArduController(port, pipelined=True)
+        rate, cpu = measure(ard, plot_telemetry, (), duration)
+        results["telemetry_samples_per_s"] = rate
+        results["telemetry_cpu_percent"] = cpu
+    return results
+
+
+if __name__ == "__main__":
+    for name, value in run().items():
+        print(f"{name:32s} {value:12.1f}")
@@ -0,0 +1,86 @@
+"""Benchmark many coroutines sharing one board.
+
+Compares AsyncArduController against wrapping the blocking ArduController
+in run_in_executor.
+
+Jackson Smith
+Final Project
+"""
+
+import asyncio
+import time
+
+from arducontroller import ArduController
+from async_arducontroller import AsyncArduController
+from simulator import simulator_process
+
+
+async def drive(request, coroutines, requests_each):
+    """Have many coroutines make requests at once.
+
+    Args:
+        request: Coroutine function making one request.
+        coroutines: Number of concurrent coroutines.
+        requests_each: Requests per coroutine.
+
+    Returns:
+        Tuple of (requests per second, mean latency in microseconds).
+    """
+    latencies = []
+
+    async def worker():
+        for _ in range(requests_each):
+            start = time.perf_counter()
+            await request()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(coroutines)))
+    elapsed = time.perf_counter() - start
+
+    return len(latencies) / elapsed, sum(latencies) / len(latencies) * 1e6
+
+
+async def bench(port, coroutine_counts, requests_each):
+    results = {}
+
+    for sequenced in (True, False):
+        name = "async_sequenced" if sequenced else "async_serial"
+        ard = AsyncArduController(port, sequenced=sequenced)
+        await ard.connect()
+        for count in coroutine_counts:
+            rate, latency = await drive(ard.request_encoder, count, requests_each)
+            results[f"{name}_{count}_per_s"] = rate
+            results[f"{name}_{count}_latency_us"] = latency
+        ard.close()
+
+    loop = asyncio.get_running_loop()
+    ard = ArduController(port)
+    for count in coroutine_counts:
+        rate, latency = await drive(
+            lambda: loop.run_in_executor(None, ard.request_encoder), count, requests_each
+        )
+        results[f"executor_{count}_per_s"] = rate
+        results[f"executor_{count}_latency_us"] = latency
+    ard.close()
+
+    return results
+
+
+def run(coroutine_counts=(1, 16, 64), requests_each=200):
+    """Run the benchmark.
+
+    Args:
+        coroutine_counts: Numbers of concurrent coroutines to try.
+        requests_each: Requests per coroutine.
+
+    Returns:
+        Dictionary of metric name to value.
+    """
+    with simulator_process() as port:
+        return asyncio.run(bench(port, coroutine_counts, requests_each))
+
+
+if __name__ == "__main__":
+    for name, value in run().items():
+        print(f"{name:32s} {value:12.1f}")
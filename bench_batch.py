@@ -0,0 +1,71 @@
+"""Benchmark a scripted tuning loop sent as separate commands and as batches.
+
+Every iteration sets new PID gains and a new setpoint, then polls the
+encoder, as tuning scripts do. Separately that's three frames and three
+reply waits; batched it's one of each.
+
+Jackson Smith
+Final Project
+"""
+
+import time
+
+from arducontroller import ArduController
+from simulator import HARDWARE_PROFILE, simulator_process
+
+PID = (2, 0, 0.5, 0, -100, 100, 0, 0)
+
+
+def loop_rate(ard, duration, batched):
+    """Run the loop for a while.
+
+    Args:
+        ard: An ArduController.
+        duration: Seconds to run.
+        batched: Send each iteration's commands as one batch.
+
+    Returns:
+        Iterations per second.
+    """
+    count = 0
+    end = time.perf_counter() + duration
+    start = time.perf_counter()
+    while time.perf_counter() < end:
+        # new values every time, so none are skipped
+        KP = PID[0] + count % 2
+        if batched:
+            with ard.batch() as batch:
+                batch.set_pid(KP, *PID[1:])
+                batch.set_position(count)
+                batch.request_encoder()
+        else:
+            ard.set_pid(KP, *PID[1:])
+            ard.set_position(count)
+            ard.request_encoder()
+        count += 1
+    return count / (time.perf_counter() - start)
+
+
+def run(duration=1):
+    """Run the benchmark.
+
+    Args:
+        duration: Seconds per measurement.
+
+    Returns:
+        Dictionary of metric name to value.
+    """
+    results = {}
+    with simulator_process(**HARDWARE_PROFILE) as port:
+        for pipelined in (False, True):
+            ard = ArduController(port, pipelined=pipelined, framed=pipelined)
+            name = "pipelined" if pipelined else "blocking"
+            results[f"{name}_separate_loop_per_s"] = loop_rate(ard, duration, batched=False)
+            results[f"{name}_batched_loop_per_s"] = loop_rate(ard, duration, batched=True)
+            ard.close()
+    return results
+
+
+if __name__ == "__main__":
+    for name, value in run().items():
+        print(f"{name:32s} {value:12.0f}")
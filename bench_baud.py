@@ -0,0 +1,65 @@
+"""Benchmark link throughput at each baud rate NEGOTIATE_BAUD can reach.
+
+The simulator throttles its pseudo-terminal to the negotiated rate, so the
+numbers follow the rate as a real serial link would.
+
+Jackson Smith
+Final Project
+"""
+
+import time
+
+from arducontroller import BAUD_RATES, ArduController
+from simulator import BOOT_BAUD, simulator_process
+
+
+def throughput(ard, duration):
+    """Pull full history replies and encoder counts as fast as possible.
+
+    Returns:
+        Tuple of (history payload bytes per second, encoder reads per second).
+    """
+    received = 0
+    end = time.perf_counter() + duration
+    start = time.perf_counter()
+    while time.perf_counter() < end:
+        # cursor 0 is clamped to the oldest sample, so every reply is full
+        _, samples = ard.request_history(0)
+        received += samples.nbytes
+    history = received / (time.perf_counter() - start)
+
+    count = 0
+    end = time.perf_counter() + duration
+    start = time.perf_counter()
+    while time.perf_counter() < end:
+        ard.request_encoder()
+        count += 1
+    return history, count / (time.perf_counter() - start)
+
+
+def run(duration=1):
+    """Run the benchmark.
+
+    Args:
+        duration: Seconds per measurement.
+
+    Returns:
+        Dictionary of metric name to value.
+    """
+    results = {}
+    for rate in (BOOT_BAUD,) + tuple(sorted(BAUD_RATES)):
+        with simulator_process(baud_rate=BOOT_BAUD) as port:
+            ard = ArduController(port, max_baud=rate)
+            # let the history fill up
+            time.sleep(0.7)
+            assert ard.ser.baudrate == rate, f"negotiated {ard.ser.baudrate} instead of {rate}"
+            history, reads = throughput(ard, duration)
+            results[f"baud_{rate}_history_bytes_per_s"] = history
+            results[f"baud_{rate}_encoder_reads_per_s"] = reads
+            ard.close()
+    return results
+
+
+if __name__ == "__main__":
+    for name, value in run().items():
+        print(f"{name:40s} {value:12.0f}")
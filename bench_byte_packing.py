@@ -0,0 +1,117 @@
+"""Benchmark byte packing against the original recursive implementation.
+
+Jackson Smith
+Final Project
+"""
+
+import struct
+import timeit
+
+from byte_packing import Codec, pack_values, unpack_values
+
+
+def legacy_pack_values(args, message=b""):
+    """The original recursive pack_values, kept for comparison."""
+    if len(args) == 0:
+        return message
+
+    arg, *rest = args
+
+    if isinstance(arg, int):
+        message += struct.pack("i", arg)
+    elif isinstance(arg, float):
+        message += struct.pack("f", arg)
+    elif isinstance(arg, bytes) or isinstance(arg, bytearray):
+        message += arg
+    else:
+        raise ValueError(f"Can't pack value of datatype {type(arg)}")
+
+    return legacy_pack_values(rest, message)
+
+
+def legacy_unpack_values(msg, pattern, results=None):
+    """The original recursive unpack_values, kept for comparison."""
+    if results == None:
+        results = []
+
+    if len(pattern) == 0:
+        return results, msg
+
+    char, *pattern = pattern
+
+    value = msg[:4]
+    msg = msg[4:]
+    if char == "i":
+        results.append(struct.unpack("i", value)[0])
+    elif char == "f":
+        results.append(struct.unpack("f", value)[0])
+
+    return legacy_unpack_values(msg, pattern, results)
+
+
+def check_identical():
+    """Make sure the new code produces the same bytes as the old code."""
+    cases = [
+        ([1, 2.5, 2], "ifi"),
+        ([0.1, 0.001, 12.0, 0.0, 0.0, 150.0, 255.0, 40.0], "ffffffff"),
+        ([-2**31, 2**31 - 1, -1], "iii"),
+        ([], ""),
+    ]
+    for values, pattern in cases:
+        legacy = legacy_pack_values(values)
+        assert pack_values(values) == legacy
+        if pattern:
+            assert Codec(pattern).pack(*values) == legacy
+        assert unpack_values(legacy, pattern) == legacy_unpack_values(legacy, pattern)
+
+    # raw bytes mixed in with numbers
+    mixed = [b"\x03", 1.5, bytearray(b"ab"), 7]
+    assert pack_values(mixed) == legacy_pack_values(mixed)
+
+
+def time_call(stmt, number):
+    """Time a callable.
+
+    Args:
+        stmt: Callable to time.
+        number: How many times to call it.
+
+    Returns:
+        Microseconds per call.
+    """
+    return min(timeit.repeat(stmt, number=number, repeat=5)) / number * 1e6
+
+
+def run(number=20000):
+    """Run the benchmark.
+
+    Args:
+        number: Calls per measurement.
+
+    Returns:
+        Dictionary of metric name to value.
+    """
+    check_identical()
+
+    pid = [0.1, 0.001, 12.0, 0.0, 0.0, 150.0, 255.0, 40.0]
+    packed_pid = pack_values(pid)
+    codec = Codec("ffffffff")
+    command_codec = Codec("ffffffff", command=3)
+    buffer = bytearray(64)
+
+    return {
+        "legacy_pack_values_us": time_call(lambda: legacy_pack_values(pid), number),
+        "pack_values_us": time_call(lambda: pack_values(pid), number),
+        "codec_pack_us": time_call(lambda: codec.pack(*pid), number),
+        "codec_pack_into_us": time_call(lambda: command_codec.pack_into(buffer, 0, *pid), number),
+        "legacy_unpack_values_us": time_call(
+            lambda: legacy_unpack_values(packed_pid, "ffffffff"), number
+        ),
+        "unpack_values_us": time_call(lambda: unpack_values(packed_pid, "ffffffff"), number),
+        "codec_unpack_from_us": time_call(lambda: codec.unpack_from(packed_pid), number),
+    }
+
+
+if __name__ == "__main__":
+    for name, value in run().items():
+        print(f"{name:28s} {value:10.3f}")
@@ -0,0 +1,123 @@
+"""Benchmark COBS encoding against the original byte-at-a-time implementation.
+
+Jackson Smith
+Final Project
+"""
+
+import random
+import time
+import timeit
+
+from cobs_encoder import CobsStreamDecoder, cobs_decode, cobs_encode
+
+
+def legacy_cobs_decode(in_bytes):
+    """The original byte-at-a-time cobs_decode, kept for comparison."""
+    decoded = bytearray()
+    i = 0
+    while i < len(in_bytes):
+        next_zero = in_bytes[i]
+        i += 1
+
+        j = 1
+        while j < next_zero and i < len(in_bytes):
+            decoded.append(in_bytes[i])
+            i += 1
+            j += 1
+
+        if next_zero != 0xFF and i < len(in_bytes) - 1:
+            decoded.append(0)
+    return decoded
+
+
+def legacy_cobs_encode(in_bytes):
+    """The original byte-at-a-time cobs_encode, kept for comparison."""
+    encoded = bytearray(b"\00")
+
+    next_zero = 1
+    write_index = 1
+    next_zero_index = 0
+
+    i = 0
+    while i < len(in_bytes):
+        val = in_bytes[i]
+        encoded.append(0)
+
+        if val == 0:
+            encoded[next_zero_index] = next_zero
+            next_zero = 1
+            next_zero_index = write_index
+            write_index += 1
+
+        else:
+            encoded[-1] = val
+            write_index += 1
+            next_zero += 1
+            if next_zero == 0xFF:
+                encoded[next_zero_index] = next_zero
+                next_zero = 1
+                next_zero_index = write_index
+                write_index += 1
+
+        i += 1
+
+    encoded[next_zero_index] = next_zero
+    encoded.append(0)
+    return encoded
+
+
+def make_frames(count, seed=0):
+    """Make small frames shaped like real traffic (command byte + packed ints)."""
+    rng = random.Random(seed)
+    return [bytes([rng.randint(1, 4)]) + rng.randbytes(4 * rng.randint(1, 8)) for _ in range(count)]
+
+
+def check_identical(frames):
+    """Make sure the new code produces the same bytes as the old code."""
+    for frame in frames:
+        encoded = cobs_encode(frame)
+        assert encoded == legacy_cobs_encode(frame)
+        assert cobs_decode(encoded) == legacy_cobs_decode(encoded)
+
+
+def run(frame_count=5000):
+    """Run the benchmark.
+
+    Args:
+        frame_count: Number of frames in the simulated burst.
+
+    Returns:
+        Dictionary of metric name to value.
+    """
+    frames = make_frames(frame_count)
+    check_identical(frames)
+
+    encoded = [cobs_encode(frame) for frame in frames]
+    stream = b"".join(encoded)
+    total = len(stream)
+
+    def per_byte(stmt):
+        return min(timeit.repeat(stmt, number=1, repeat=5)) / total * 1e9
+
+    def stream_decode():
+        decoder = CobsStreamDecoder()
+        for i in range(0, total, 64):
+            decoder.feed(stream[i:i + 64])
+
+    start = time.perf_counter()
+    stream_decode()
+    elapsed = time.perf_counter() - start
+
+    return {
+        "legacy_encode_ns_per_byte": per_byte(lambda: [legacy_cobs_encode(f) for f in frames]),
+        "encode_ns_per_byte": per_byte(lambda: [cobs_encode(f) for f in frames]),
+        "legacy_decode_ns_per_byte": per_byte(lambda: [legacy_cobs_decode(f) for f in encoded]),
+        "decode_ns_per_byte": per_byte(lambda: [cobs_decode(f) for f in encoded]),
+        "stream_decode_ns_per_byte": per_byte(stream_decode),
+        "stream_decode_mb_per_s": total / elapsed / 1e6,
+    }
+
+
+if __name__ == "__main__":
+    for name, value in run().items():
+        print(f"{name:28s} {value:10.3f}")
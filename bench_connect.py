@@ -0,0 +1,81 @@
+"""Benchmark the time from starting up, or losing the port, to the first sample.
+
+Jackson Smith
+Final Project
+"""
+
+import subprocess
+import sys
+import time
+
+from arducontroller import ArduController
+from simulator import simulator_process
+
+# like a Mega's bootloader after the port opens
+BOOT_TIME = 0.5
+
+
+def first_sample(port, **kwargs):
+    """Connect and read the encoders once.
+
+    Returns:
+        Tuple of (seconds to the first sample, the ArduController).
+    """
+    start = time.perf_counter()
+    ard = ArduController(port, **kwargs)
+    ard.request_encoder()
+    return time.perf_counter() - start, ard
+
+
+def import_time(module):
+    """Seconds to import a module in a fresh interpreter."""
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    return float(subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout)
+
+
+def run(count=5):
+    """Run the benchmark.
+
+    Args:
+        count: Reconnects to time.
+
+    Returns:
+        Dictionary of metric name to value.
+    """
+    results = {
+        # what the window waits for before it shows, and what now loads
+        # while the Arduino connects
+        "gui_import_ms": import_time("gui") * 1e3,
+        "plotting_import_ms": import_time("liveplot") * 1e3,
+    }
+
+    with simulator_process(boot_time=BOOT_TIME) as port:
+        seconds, ard = first_sample(port)
+        results["handshake_time_to_first_sample_ms"] = seconds * 1e3
+        ard.close()
+
+    with simulator_process(boot_time=BOOT_TIME) as port:
+        seconds, ard = first_sample(port, startup_delay=3)
+        results["sleep_time_to_first_sample_ms"] = seconds * 1e3
+        ard.close()
+
+    for pipelined in (False, True):
+        with simulator_process() as port:
+            ard = ArduController(port, pipelined=pipelined)
+            ard.set_position(100)
+            times = []
+            for _ in range(count):
+                # the port drops out, like a USB glitch
+                ard.ser.close()
+                start = time.perf_counter()
+                ard.request_encoder()
+                times.append(time.perf_counter() - start)
+            name = "pipelined" if pipelined else "blocking"
+            results[f"{name}_reconnect_to_sample_ms"] = sorted(times)[len(times) // 2] * 1e3
+            ard.close()
+    return results
+
+
+if __name__ == "__main__":
+    for name, value in run().items():
+        print(f"{name:36s} {value:12.2f}")
@@ -0,0 +1,57 @@
+"""Benchmark fitting motor models to a long recorded run.
+
+Jackson Smith
+Final Project
+"""
+
+import time
+
+import numpy as np
+
+from identification import fit_fopdt, fit_second_order
+from pid import write_analog
+from simulator import CYCLE_DELAY, MotorPlant
+
+
+def record_run(seconds, seed=0):
+    """Drive the simulator's motor with held random speeds, sampling every cycle.
+
+    Returns:
+        Tuple of (time, command, encoder) arrays.
+    """
+    rng = np.random.default_rng(seed)
+    count = round(seconds / CYCLE_DELAY)
+    speeds = np.repeat(rng.integers(-120, 121, count), rng.integers(20, 200, count))[:count]
+    plant = MotorPlant(dead_time=0.01)
+    encoders = np.empty(count)
+    for k, speed in enumerate(speeds):
+        encoders[k] = plant.encoder
+        plant.step(write_analog(speed), CYCLE_DELAY)
+    return np.arange(count) * CYCLE_DELAY, speeds, encoders
+
+
+def run(seconds=300, repeats=3):
+    """Run the benchmark.
+
+    Args:
+        seconds: Length of the recorded run. Default is five minutes.
+        repeats: Fits to time; the fastest counts.
+
+    Returns:
+        Dictionary of metric name to value.
+    """
+    recording = record_run(seconds)
+    results = {}
+    for name, fit in (("fopdt", fit_fopdt), ("second_order", fit_second_order)):
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            fit(*recording)
+            times.append(time.perf_counter() - start)
+        results[f"{name}_fit_{seconds}s_run_ms"] = min(times) * 1e3
+    return results
+
+
+if __name__ == "__main__":
+    for name, value in run().items():
+        print(f"{name:32s} {value:12.2f}")
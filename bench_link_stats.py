@@ -0,0 +1,94 @@
+"""Benchmark what link statistics cost a transaction.
+
+Jackson Smith
+Final Project
+"""
+
+import statistics
+import time
+
+from arducontroller import ArduController
+from cobs_encoder import cobs_encode
+from link_stats import LatencyHistogram
+from simulator import simulator_process
+
+
+class CannedPort:
+    """Stand-in serial port that answers every read at once with one encoder count."""
+    timeout = 1
+    reply = bytes(cobs_encode(b"\x05\x00\x00\x00"))
+
+    def write(self, data):
+        return len(data)
+
+    def read_until(self, terminator):
+        return self.reply
+
+
+def alternate(ard, blocks, count):
+    """Time request_encoder with statistics on and off.
+
+    Blocks of each alternate, so drift hits both the same, and the
+    medians are compared.
+
+    Returns:
+        Tuple of median seconds per call with statistics on and off.
+    """
+    stats = ard.stats
+    times = {True: [], False: []}
+    for block in range(blocks):
+        # swap which goes first so neither always follows the other
+        for enabled in (True, False) if block % 2 else (False, True):
+            ard.stats = stats if enabled else None
+            start = time.perf_counter()
+            for _ in range(count):
+                ard.request_encoder()
+            times[enabled].append((time.perf_counter() - start) / count)
+    ard.stats = stats
+    return statistics.median(times[True]), statistics.median(times[False])
+
+
+def run(count=100, blocks=40):
+    """Run the benchmark.
+
+    Args:
+        count: Round trips per block.
+        blocks: Blocks per setting.
+
+    Returns:
+        Dictionary of metric name to value.
+    """
+    histogram = LatencyHistogram()
+    start = time.perf_counter()
+    for _ in range(100000):
+        histogram.record(123e-6)
+    results = {"histogram_record_us": (time.perf_counter() - start) / 100000 * 1e6}
+
+    with simulator_process() as port:
+        ard = ArduController(port)
+
+        # the whole transaction path minus the I/O, so only the statistics differ
+        ser = ard.ser
+        ard.ser = CannedPort()
+        on, off = alternate(ard, blocks, count * 10)
+        ard.ser = ser
+        results["transaction_stats_on_us"] = on * 1e6
+        results["transaction_stats_off_us"] = off * 1e6
+
+        # on a pty the extra microsecond can also decide whether the
+        # simulator has gone back to sleep before the next request, so
+        # these two differ by more than the statistics themselves cost
+        on, off = alternate(ard, blocks, count)
+        results["round_trip_stats_on_us"] = on * 1e6
+        results["round_trip_stats_off_us"] = off * 1e6
+        results["stats_share_of_round_trip_percent"] = (
+            (results["transaction_stats_on_us"] - results["transaction_stats_off_us"])
+            / results["round_trip_stats_off_us"] * 100
+        )
+        ard.close()
+    return results
+
+
+if __name__ == "__main__":
+    for name, value in run().items():
+        print(f"{name:36s} {value:12.2f}")
@@ -0,0 +1,237 @@
+"""Benchmark LivePlotter.update_plot.
+
+The data path (windowing and y limits) runs anywhere. Timing the real
+LivePlotter needs a display for Tk and is skipped without one.
+
+Jackson Smith
+Final Project
+"""
+
+import queue
+import time
+import tkinter as tk
+
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from decimation import minmax_decimate
+from ring_buffer import TimeRingBuffer, WindowedExtrema
+from sample_channel import SampleChannel
+
+# matches LivePlotter's defaults and GUI's time scale
+TIME_SCALE = 5
+UPDATE_INTERVAL = 0.05
+
+
+def legacy_update(x_data, y_data, new_points, time_scale):
+    """The original list-based update_plot data path, kept for comparison."""
+    for x, y_points in new_points:
+        x_data.append(x)
+        for i, y in enumerate(y_points):
+            y_data[i].append(y)
+
+    while max(x_data) - min(x_data) > time_scale:
+        x_data.pop(0)
+        for y_list in y_data:
+            y_list.pop(0)
+
+    all_y_data = [y for y_list in y_data for y in y_list]
+    return min(all_y_data), max(all_y_data)
+
+
+def ring_update(history, extrema, new_points, time_scale):
+    """The ring buffer update_plot data path."""
+    for x, y_points in new_points:
+        extrema.push(history.end, min(y_points), max(y_points))
+        history.append(x, y_points)
+
+    history.evict_before(history.newest_time - time_scale)
+    extrema.evict_before(history.start)
+    return extrema.min, extrema.max
+
+
+def time_data_path(update, state, rate, frames):
+    """Time one data path over a full window of samples.
+
+    Returns:
+        Microseconds per animation frame.
+    """
+    per_frame = max(1, int(rate * UPDATE_INTERVAL))
+    now = 0.0
+
+    def points(count):
+        nonlocal now
+        result = []
+        for _ in range(count):
+            now += 1 / rate
+            result.append((now, (0, now)))
+        return result
+
+    # fill a whole window first
+    update(*state, points(int(rate * TIME_SCALE)), TIME_SCALE)
+
+    elapsed = 0.0
+    for _ in range(frames):
+        new_points = points(per_frame)
+        start = time.perf_counter()
+        update(*state, new_points, TIME_SCALE)
+        elapsed += time.perf_counter() - start
+    return elapsed / frames * 1e6
+
+
+def time_queue_handoff(samples):
+    """Time the original handoff: a Queue per plotter, drained one get() at a time.
+
+    Returns:
+        Tuple of (producer, consumer) microseconds per sample.
+    """
+    queues = [queue.Queue(), queue.Queue()]
+
+    start = time.perf_counter()
+    for i in range(samples):
+        for q in queues:
+            q.put((i, (0, i)))
+    produce = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for q in queues:
+        while not q.empty():
+            q.get()
+    consume = time.perf_counter() - start
+    return produce / samples * 1e6, consume / samples * 1e6
+
+
+def time_channel_handoff(samples):
+    """Time the SampleChannel handoff shared by both plotters.
+
+    Returns:
+        Tuple of (producer, consumer) microseconds per sample.
+    """
+    channel = SampleChannel(2, capacity=samples)
+
+    start = time.perf_counter()
+    for i in range(samples):
+        channel.push(i, (0,), (i,))
+    produce = time.perf_counter() - start
+
+    start = time.perf_counter()
+    times, values = channel.swap()
+    # what GUI.drain does with a batch
+    values[:, 1:] - values[:, :1]
+    consume = time.perf_counter() - start
+    return produce / samples * 1e6, consume / samples * 1e6
+
+
+def time_render(rate, frames, decimate):
+    """Time drawing a full window of two lines on an offscreen canvas.
+
+    Args:
+        rate: Samples per second in the window.
+        frames: Number of draws to time.
+        decimate: Thin the lines to the plot's pixel columns first.
+
+    Returns:
+        Milliseconds per draw.
+    """
+    figure = Figure(figsize=(6, 3), dpi=100)
+    canvas = FigureCanvasAgg(figure)
+    ax = figure.add_subplot(111)
+    ax.set_xlim(0, TIME_SCALE)
+    ax.set_ylim(-1.5, 1.5)
+    lines = [ax.plot([], [])[0] for _ in range(2)]
+
+    times = np.arange(int(rate * TIME_SCALE)) / rate
+    ys = [np.sin(times), np.sin(times) + np.random.default_rng(0).normal(0, 0.1, len(times))]
+
+    elapsed = 0.0
+    for _ in range(frames):
+        start = time.perf_counter()
+        x, y_lines = times, ys
+        if decimate:
+            x, y_lines = minmax_decimate(times, ys, 0, TIME_SCALE, ax.bbox.width)
+        for line, y in zip(lines, y_lines):
+            line.set_data(x, y)
+        canvas.draw()
+        elapsed += time.perf_counter() - start
+    return elapsed / frames * 1e3
+
+
+def time_live_plotter(rate, frames):
+    """Time the real LivePlotter's update_plot and redraw.
+
+    Returns:
+        Dictionary of metrics, empty without a display.
+    """
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        return {}
+    root.withdraw()
+
+    from liveplot import LivePlotter
+
+    plotter = LivePlotter(root, TIME_SCALE, ["Setpoint", "Encoder"], ["black", "red"])
+    plotter.ani.event_source.stop()
+
+    per_frame = max(1, int(rate * UPDATE_INTERVAL))
+    now = 0.0
+    for _ in range(int(rate * TIME_SCALE)):
+        now += 1 / rate
+        plotter.value_queue.put((now, (0, now)))
+    plotter.update_plot(0)
+
+    update_time = 0.0
+    draw_time = 0.0
+    for frame in range(frames):
+        for _ in range(per_frame):
+            now += 1 / rate
+            plotter.value_queue.put((now, (0, now)))
+
+        start = time.perf_counter()
+        plotter.update_plot(frame)
+        update_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        plotter.canvas.draw()
+        draw_time += time.perf_counter() - start
+
+    root.destroy()
+    return {
+        "update_plot_us": update_time / frames * 1e6,
+        "draw_ms": draw_time / frames * 1e3,
+    }
+
+
+def run(rates=(200, 2000), frames=200):
+    """Run the benchmark.
+
+    Args:
+        rates: Samples per second fed to the plotter.
+        frames: Animation frames to time.
+
+    Returns:
+        Dictionary of metric name to value.
+    """
+    results = {}
+    for rate in rates:
+        results[f"legacy_data_path_{rate}hz_us"] = time_data_path(
+            legacy_update, ([], [[], []]), rate, frames
+        )
+        results[f"ring_data_path_{rate}hz_us"] = time_data_path(
+            ring_update, (TimeRingBuffer(2), WindowedExtrema()), rate, frames
+        )
+        results[f"full_render_{rate}hz_ms"] = time_render(rate, frames // 10, False)
+        results[f"decimated_render_{rate}hz_ms"] = time_render(rate, frames // 10, True)
+    samples = int(rates[-1] * UPDATE_INTERVAL) * frames
+    for name, handoff in (("queue", time_queue_handoff), ("channel", time_channel_handoff)):
+        produce, consume = handoff(samples)
+        results[f"{name}_handoff_push_us"] = produce
+        results[f"{name}_handoff_drain_us"] = consume
+    results.update(time_live_plotter(rates[0], frames))
+    return results
+
+
+if __name__ == "__main__":
+    for name, value in run().items():
+        print(f"{name:32s} {value:12.1f}")
@@ -0,0 +1,95 @@
+"""Benchmark several threads sharing one ArduController.
+
+Jackson Smith
+Final Project
+"""
+
+import threading
+import time
+
+from arducontroller import ArduController
+from simulator import simulator_process
+
+
+class SpinLockController(ArduController):
+    """ArduController with the original busy-waiting lock, for comparison."""
+    spin_locked = False
+
+    def wait_for_unlock(self, timeout=None):
+        while self.spin_locked:
+            continue
+        self.spin_locked = True
+
+    def unlock(self):
+        self.spin_locked = False
+
+
+def hammer(ard, thread_count, duration):
+    """Have several threads request encoder counts as fast as they can.
+
+    Args:
+        ard: The controller to share.
+        thread_count: Number of threads.
+        duration: Seconds to run for.
+
+    Returns:
+        Tuple of (transactions per second, process CPU use in percent).
+    """
+    counts = [0] * thread_count
+    stop = threading.Event()
+
+    def worker(index):
+        while not stop.is_set():
+            try:
+                ard.request_encoder()
+            except Exception:
+                # the spin lock can let two threads in at once
+                pass
+            counts[index] += 1
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(thread_count)]
+
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    return sum(counts) / wall, 100 * cpu / wall
+
+
+def run(thread_counts=(1, 2, 4, 8), duration=2):
+    """Run the benchmark.
+
+    Args:
+        thread_counts: Thread counts to try.
+        duration: Seconds per measurement.
+
+    Returns:
+        Dictionary of metric name to value.
+    """
+    results = {}
+    with simulator_process() as port:
+        for name, cls in (("fair", ArduController), ("spin", SpinLockController)):
+            ard = cls(port)
+            for thread_count in thread_counts:
+                rate, cpu = hammer(ard, thread_count, duration)
+                results[f"{name}_{thread_count}_threads_per_s"] = rate
+                results[f"{name}_{thread_count}_threads_cpu_percent"] = cpu
+
+            if name == "fair":
+                waits = [wait for _, wait in ard.lock.wait_times]
+                results["fair_mean_lock_wait_us"] = sum(waits) / len(waits) * 1e6
+                results["fair_max_lock_wait_us"] = max(waits) * 1e6
+            ard.close()
+    return results
+
+
+if __name__ == "__main__":
+    for name, value in run().items():
+        print(f"{name:32s} {value:12.1f}")
@@ -0,0 +1,121 @@
+"""Benchmark driving many boards: one ControllerPool vs a thread per board.
+
+Each board is a simulator in its own process. The pool polls every board
+with one fan-out request per round; the threaded version runs the old
+main.py pattern of one ArduController and polling thread per board.
+
+Jackson Smith
+Final Project
+"""
+
+import threading
+import time
+from contextlib import ExitStack
+
+from arducontroller import ArduController
+from controller_pool import ControllerPool
+from simulator import simulator_process
+
+
+def measure_pool(ports, duration):
+    """Poll every board in fan-out rounds for a while.
+
+    Returns:
+        Tuple of (mean round latency in ms, requests per second, CPU percent).
+    """
+    with ControllerPool() as pool:
+        for port in ports:
+            pool.add(port)
+        pool.start()
+
+        rounds = 0
+        requests = 0
+        cpu_start = time.process_time()
+        start = time.perf_counter()
+        while time.perf_counter() - start < duration:
+            results = pool.request_encoders()
+            requests += sum(not isinstance(result, Exception) for result in results.values())
+            rounds += 1
+        elapsed = time.perf_counter() - start
+        cpu = time.process_time() - cpu_start
+
+    return elapsed / rounds * 1e3, requests / elapsed, cpu / elapsed * 100
+
+
+def measure_threads(ports, duration):
+    """Poll every board from its own thread and ArduController for a while.
+
+    Returns:
+        Tuple of (mean request latency in ms, requests per second, CPU percent).
+    """
+    # open in parallel so the boot delays overlap
+    ards = [None] * len(ports)
+
+    def connect(i):
+        ards[i] = ArduController(ports[i])
+
+    connectors = [threading.Thread(target=connect, args=(i,)) for i in range(len(ports))]
+    for thread in connectors:
+        thread.start()
+    for thread in connectors:
+        thread.join()
+
+    counts = [0] * len(ports)
+    stop = threading.Event()
+
+    def poll(i):
+        while not stop.is_set():
+            ards[i].request_encoders()
+            counts[i] += 1
+
+    pollers = [threading.Thread(target=poll, args=(i,)) for i in range(len(ports))]
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    for thread in pollers:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in pollers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+
+    for ard in ards:
+        ard.close()
+
+    requests = sum(counts)
+    # each thread has one request outstanding at a time
+    latency = elapsed * len(ports) / requests
+    return latency * 1e3, requests / elapsed, cpu / elapsed * 100
+
+
+def run(device_counts=(1, 4, 16), duration=1.0):
+    """Run the benchmark.
+
+    Args:
+        device_counts: Numbers of boards to try.
+        duration: Seconds to poll for at each count.
+
+    Returns:
+        Dictionary of metric name to value.
+    """
+    results = {}
+    for count in device_counts:
+        with ExitStack() as stack:
+            ports = [stack.enter_context(simulator_process()) for _ in range(count)]
+
+            latency, rate, cpu = measure_pool(ports, duration)
+            results[f"pool_{count}_devices_round_ms"] = latency
+            results[f"pool_{count}_devices_per_s"] = rate
+            results[f"pool_{count}_devices_cpu_percent"] = cpu
+
+            latency, rate, cpu = measure_threads(ports, duration)
+            results[f"threads_{count}_devices_latency_ms"] = latency
+            results[f"threads_{count}_devices_per_s"] = rate
+            results[f"threads_{count}_devices_cpu_percent"] = cpu
+    return results
+
+
+if __name__ == "__main__":
+    for name, value in run().items():
+        print(f"{name:36s} {value:12.1f}")
@@ -0,0 +1,59 @@
+"""Benchmark recording telemetry and seeking in a long log.
+
+Jackson Smith
+Final Project
+"""
+
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from recorder import TelemetryLog, TelemetryRecorder
+
+
+def run(records=200_000, seeks=1000):
+    """Run the benchmark.
+
+    Args:
+        records: Samples to record, about 17 minutes at 200 Hz.
+        seeks: Time range lookups to time.
+
+    Returns:
+        Dictionary of metric name to value.
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.arlog")
+
+        encoders = np.zeros(1, dtype=np.int32)
+        setpoints = np.zeros(1, dtype=np.int32)
+        commands = np.zeros(1, dtype=np.float32)
+
+        start = time.perf_counter()
+        with TelemetryRecorder(path) as recorder:
+            for i in range(records):
+                encoders[0] = i
+                recorder.record(i * 0.005, encoders, setpoints, commands)
+        elapsed = time.perf_counter() - start
+        results["record_per_s"] = records / elapsed
+
+        start = time.perf_counter()
+        log = TelemetryLog(path)
+        results["open_us"] = (time.perf_counter() - start) * 1e6
+
+        rng = np.random.default_rng(0)
+        starts = rng.uniform(0, records * 0.005, seeks)
+        start = time.perf_counter()
+        for t in starts:
+            log.between(t, t + 5)
+        results["seek_us"] = (time.perf_counter() - start) / seeks * 1e6
+
+        del log
+    return results
+
+
+if __name__ == "__main__":
+    for name, value in run().items():
+        print(f"{name:32s} {value:12.1f}")
@@ -0,0 +1,65 @@
+"""Benchmark a scripted tuning loop that keeps resending the same settings.
+
+Every iteration sends the PID gains and setpoint, then polls the encoder,
+as tuning scripts do. Without the shadow state every setting is a frame
+and a reply wait; with it only the poll goes out.
+
+Jackson Smith
+Final Project
+"""
+
+import time
+
+from arducontroller import ArduController
+from simulator import HARDWARE_PROFILE, simulator_process
+
+PID = (2, 0, 0.5, 0, -100, 100, 0, 0)
+
+
+def loop_rate(ard, duration, forget):
+    """Run the loop for a while.
+
+    Args:
+        ard: An ArduController.
+        duration: Seconds to run.
+        forget: Clear the shadow state every iteration, like before it existed.
+
+    Returns:
+        Iterations per second.
+    """
+    count = 0
+    end = time.perf_counter() + duration
+    start = time.perf_counter()
+    while time.perf_counter() < end:
+        if forget:
+            ard.shadow.clear()
+        ard.set_pid(*PID)
+        ard.set_position(100)
+        ard.request_encoder()
+        count += 1
+    return count / (time.perf_counter() - start)
+
+
+def run(duration=1):
+    """Run the benchmark.
+
+    Args:
+        duration: Seconds per measurement.
+
+    Returns:
+        Dictionary of metric name to value.
+    """
+    results = {}
+    with simulator_process(**HARDWARE_PROFILE) as port:
+        for pipelined in (False, True):
+            ard = ArduController(port, pipelined=pipelined)
+            name = "pipelined" if pipelined else "blocking"
+            results[f"{name}_resend_loop_per_s"] = loop_rate(ard, duration, forget=True)
+            results[f"{name}_shadow_loop_per_s"] = loop_rate(ard, duration, forget=False)
+            ard.close()
+    return results
+
+
+if __name__ == "__main__":
+    for name, value in run().items():
+        print(f"{name:32s} {value:12.0f}")
@@ -0,0 +1,73 @@
+"""Benchmark streamed telemetry against polling REQUEST_ENCODER.
+
+Jackson Smith
+Final Project
+"""
+
+import time
+
+from arducontroller import ArduController
+from simulator import simulator_process
+
+
+def poll(ard, duration):
+    """Sample like main.plot_encoders does.
+
+    Returns:
+        Tuple of (samples per second, process CPU seconds per sample).
+    """
+    count = 0
+    cpu_start = time.process_time()
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        ard.request_encoder()
+        count += 1
+        time.sleep(0.005)
+    return count / duration, (time.process_time() - cpu_start) / count
+
+
+def stream(ard, rate, duration):
+    """Sample like main.plot_telemetry does.
+
+    Returns:
+        Tuple of (samples per second, process CPU seconds per sample).
+    """
+    count = 0
+    cpu_start = time.process_time()
+    end = time.perf_counter() + duration
+    samples = ard.telemetry(rate)
+    for _ in samples:
+        count += 1
+        if time.perf_counter() >= end:
+            break
+    samples.close()
+    return count / duration, (time.process_time() - cpu_start) / count
+
+
+def run(duration=3, rate=200):
+    """Run the benchmark.
+
+    Args:
+        duration: Seconds per measurement.
+        rate: Telemetry rate to ask for.
+
+    Returns:
+        Dictionary of metric name to value.
+    """
+    results = {}
+    with simulator_process() as port:
+        ard = ArduController(port)
+        results["poll_samples_per_s"], cpu = poll(ard, duration)
+        results["poll_cpu_us_per_sample"] = cpu * 1e6
+        ard.close()
+
+        ard = ArduController(port, pipelined=True)
+        results["telemetry_samples_per_s"], cpu = stream(ard, rate, duration)
+        results["telemetry_cpu_us_per_sample"] = cpu * 1e6
+        ard.close()
+    return results
+
+
+if __name__ == "__main__":
+    for name, value in run().items():
+        print(f"{name:32s} {value:12.1f}")
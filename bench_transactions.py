@@ -0,0 +1,86 @@
+"""Benchmark ArduController round trips against the simulator.
+
+Jackson Smith
+Final Project
+"""
+
+import time
+
+from arducontroller import ArduController
+from simulator import HARDWARE_PROFILE, simulator_process
+
+
+def percentile(values, fraction):
+    """Pick a percentile from a list of values."""
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def round_trips(ard, count):
+    """Time request_encoder round trips.
+
+    Returns:
+        Dictionary of latency and rate metrics.
+    """
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(count):
+        request_start = time.perf_counter()
+        ard.request_encoder()
+        latencies.append(time.perf_counter() - request_start)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "round_trip_p50_us": percentile(latencies, 0.5) * 1e6,
+        "round_trip_p99_us": percentile(latencies, 0.99) * 1e6,
+        "commands_per_s": count / elapsed,
+    }
+
+
+def pipelined(ard, count):
+    """Time many request_encoder_async calls in flight at once.
+
+    Returns:
+        Dictionary of rate metrics.
+    """
+    start = time.perf_counter()
+    futures = []
+    for _ in range(count):
+        futures.append(ard.request_encoder_async())
+        # keep within the 7 bit sequence ID space
+        if len(futures) >= 64:
+            futures.pop(0).result(1)
+    for future in futures:
+        future.result(1)
+    return {"pipelined_commands_per_s": count / (time.perf_counter() - start)}
+
+
+def run(count=500):
+    """Run the benchmark.
+
+    Args:
+        count: Requests per measurement.
+
+    Returns:
+        Dictionary of metric name to value.
+    """
+    results = {}
+    for profile, kwargs in (("fast", {}), ("hardware", HARDWARE_PROFILE)):
+        # the hardware profile answers once per 5 ms loop, so ask for fewer
+        profile_count = count if profile == "fast" else count // 10
+        with simulator_process(**kwargs) as port:
+            ard = ArduController(port)
+            for name, value in round_trips(ard, profile_count).items():
+                results[f"{profile}_{name}"] = value
+            ard.close()
+
+            ard = ArduController(port, pipelined=True)
+            for name, value in pipelined(ard, profile_count).items():
+                results[f"{profile}_{name}"] = value
+            ard.close()
+    return results
+
+
+if __name__ == "__main__":
+    for name, value in run().items():
+        print(f"{name:36s} {value:12.1f}")
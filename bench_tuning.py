@@ -0,0 +1,62 @@
+"""Benchmark simulating PID candidates one at a time against all at once.
+
+Jackson Smith
+Final Project
+"""
+
+import time
+
+from pid import PID, write_analog
+from simulator import CYCLE_DELAY, MotorPlant
+from tuning import as_kwargs, random_candidates, search
+
+# the step every candidate is scored on
+TARGET = 1000
+DURATION = 1.0
+
+
+def simulate_one(params, plant, steps):
+    """Step one candidate through pid.PID and MotorPlant, like SimulatedMotor."""
+    cycle = [0]
+    pid = PID(**as_kwargs(params), clock=lambda: cycle[0] * CYCLE_DELAY * 1000.0)
+    for _ in range(steps):
+        cycle[0] += 1
+        plant.step(write_analog(pid.calculate(float(plant.encoder), float(TARGET))), CYCLE_DELAY)
+
+
+def run(count=20000, scalar_count=50):
+    """Run the benchmark.
+
+    Args:
+        count: Candidates for the vectorized and pooled searches.
+        scalar_count: Candidates to time through pid.PID one at a time.
+
+    Returns:
+        Dictionary of metric name to value.
+    """
+    candidates = random_candidates(count, seed=0, log_scale=True, KP=(0.01, 10), KI=(1e-6, 1e-2), KD=(1e-3, 10))
+    steps = round(DURATION / CYCLE_DELAY)
+
+    start = time.perf_counter()
+    for params in candidates[:scalar_count]:
+        simulate_one(params, MotorPlant(), steps)
+    scalar = scalar_count / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    search(candidates, MotorPlant(), TARGET, processes=1, duration=DURATION)
+    vectorized = count / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    search(candidates, MotorPlant(), TARGET, duration=DURATION)
+    pooled = count / (time.perf_counter() - start)
+
+    return {
+        "scalar_candidates_per_s": scalar,
+        "vectorized_candidates_per_s": vectorized,
+        "pooled_candidates_per_s": pooled,
+    }
+
+
+if __name__ == "__main__":
+    for name, value in run().items():
+        print(f"{name:32s} {value:12.0f}")
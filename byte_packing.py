@@ -6,6 +6,129 @@ Final Project
 
 
 import struct
+from functools import lru_cache
+
+# Wire types understood by patterns. Everything is little endian with no
+# padding, which matches the Arduino's memory layout.
+#   b/B: int8/uint8    h/H: int16/uint16    i/I: int32/uint32
+#   q/Q: int64/uint64  f: float32           d: float64
+TYPE_CODES = "bBhHiIqQfd"
+
+
+@lru_cache(maxsize=None)
+def compile_pattern(pattern):
+    """Compile a pattern into a cached struct.Struct.
+
+    Args:
+        pattern: A string of type codes from TYPE_CODES, e.g. "ifi".
+
+    Returns:
+        A struct.Struct for the pattern. The same object is returned for
+        every call with the same pattern.
+
+    Raises:
+        ValueError: If the pattern contains an unknown type code.
+    """
+    for char in pattern:
+        if char not in TYPE_CODES:
+            raise ValueError(f"Unknown type code {repr(char)} in pattern {repr(pattern)}")
+    return struct.Struct("<" + pattern)
+
+
+class Codec:
+    """A precompiled packer/unpacker for a fixed pattern.
+
+    A codec may also carry a command ID, in which case packed messages
+    start with that ID as a single byte, just like ArduController commands.
+    """
+    def __init__(self, pattern, command=None):
+        """
+        Initialize a Codec.
+
+        Args:
+            pattern: A string of type codes from TYPE_CODES.
+            command: Optional command ID prepended to every packed message.
+        """
+        self.pattern = pattern
+        self.command = command
+
+        self.values = compile_pattern(pattern)
+        if command is None:
+            self.struct = self.values
+        else:
+            self.struct = compile_pattern("B" + pattern)
+
+        self.size = self.struct.size
+        self.buffer = bytearray(self.size)
+
+    def pack(self, *values):
+        """Pack values into a new bytes object.
+
+        Args:
+            *values: Values matching the pattern.
+
+        Returns:
+            The packed message.
+        """
+        if self.command is None:
+            return self.struct.pack(*values)
+        return self.struct.pack(self.command, *values)
+
+    def pack_into(self, buffer, offset, *values):
+        """Pack values into a writable buffer.
+
+        Args:
+            buffer: A writable buffer, e.g. a bytearray.
+            offset: Where in the buffer to start writing.
+            *values: Values matching the pattern.
+
+        Returns:
+            The offset just past the written values.
+        """
+        if self.command is None:
+            self.struct.pack_into(buffer, offset, *values)
+        else:
+            self.struct.pack_into(buffer, offset, self.command, *values)
+        return offset + self.size
+
+    def pack_buffer(self, *values):
+        """Pack values into the codec's reusable buffer.
+
+        The buffer is overwritten by the next call, so copy it if it
+        needs to outlive that.
+
+        Args:
+            *values: Values matching the pattern.
+
+        Returns:
+            The codec's internal bytearray.
+        """
+        self.pack_into(self.buffer, 0, *values)
+        return self.buffer
+
+    def unpack(self, msg):
+        """Unpack values from the start of a message.
+
+        Args:
+            msg: A binary message (without the command byte).
+
+        Returns:
+            A tuple of unpacked values.
+        """
+        return self.values.unpack_from(msg)
+
+    def unpack_from(self, msg, offset=0):
+        """Unpack values from a message at an offset.
+
+        Args:
+            msg: A binary message (without the command byte).
+            offset: Where in the message the values start. Defaults to 0.
+
+        Returns:
+            A tuple of the unpacked values and the offset just past them.
+        """
+        return self.values.unpack_from(msg, offset), offset + self.values.size
+
 
 def pack_values(args, message=b""):
     """
@@ -18,22 +141,33 @@ def pack_values(args, message=b""):
     Returns:
         A binary message containing the packed values.
     """
-    if len(args) == 0:
-        return message
-
-    arg, *rest = args
-    
-    # pack known datatypes
-    if isinstance(arg, int):
-        message += struct.pack("i", arg)
-    elif isinstance(arg, float):
-        message += struct.pack("f", arg)
-    elif isinstance(arg, bytes) or isinstance(arg, bytearray):
-        message += arg
-    else:
-        raise ValueError(f"Can't pack value of datatype {type(arg)}")
-        
-    return pack_values(rest, message)
+    parts = [message]
+    pattern = ""
+    values = []
+
+    for arg in args:
+        # pack known datatypes
+        if isinstance(arg, int):
+            pattern += "i"
+            values.append(arg)
+        elif isinstance(arg, float):
+            pattern += "f"
+            values.append(arg)
+        elif isinstance(arg, bytes) or isinstance(arg, bytearray):
+            # flush pending numbers before the raw bytes
+            if pattern:
+                parts.append(compile_pattern(pattern).pack(*values))
+                pattern = ""
+                values = []
+            parts.append(arg)
+        else:
+            raise ValueError(f"Can't pack value of datatype {type(arg)}")
+
+    if pattern:
+        parts.append(compile_pattern(pattern).pack(*values))
+
+    return b"".join(parts)
+
 
 def unpack_values(msg, pattern, results=None):
     """
@@ -47,21 +181,10 @@ def unpack_values(msg, pattern, results=None):
     Returns:
         A tuple containing the list of unpacked values and the remaining bytes in the message.
     """
-    if results == None:
+    if results is None:
         results = []
-        
-    if len(pattern) == 0:
-        return results, msg
-
-    char, *pattern = pattern
-
-    # grab first 4 bytes
-    value = msg[:4]
-    msg = msg[4:]
-    if char == "i":
-        results.append(struct.unpack("i", value)[0])
-    elif char == "f":
-        results.append(struct.unpack("f", value)[0])
-
-    return unpack_values(msg, pattern, results)
-    
+
+    compiled = compile_pattern(pattern)
+    results.extend(compiled.unpack_from(msg))
+
+    return results, msg[compiled.size:]
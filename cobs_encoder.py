@@ -7,78 +7,183 @@ Final Project
 # basic idea is to replace every zero with the distance to the next zero
 # so we can use zeroes as message terminators.
 
-def cobs_decode(in_bytes):
-    """Decodes a COBS  encoded byte array.
+# longest run of non-zero bytes a single block can hold
+MAX_BLOCK = 0xFE
+
+# one-byte block codes, built once
+_CODES = [bytes([code]) for code in range(256)]
+
+
+def _decode(in_bytes, end):
+    """Decode COBS blocks, patching in zeroes between blocks.
 
     Args:
-        in_bytes: The COBS encoded byte array to be decoded.
+        in_bytes: The COBS encoded bytes.
+        end: Index of the last data byte. A zero is only patched in after
+            a block that stops before this index.
 
     Returns:
         The decoded byte array.
     """
-    
     decoded = bytearray()
+    length = len(in_bytes)
     i = 0
-    while i < len(in_bytes):
+    while i < length:
         # beginning will alway be distance to next zero
         next_zero = in_bytes[i]
         i += 1
 
-        j = 1
-        # grab bytes until zero
-        while j < next_zero and i < len(in_bytes):
-            decoded.append(in_bytes[i])
-            i += 1
-            j += 1
+        # grab the whole block at once
+        block_end = min(i + next_zero - 1, length)
+        if block_end > i:
+            decoded += in_bytes[i:block_end]
+            i = block_end
 
         # patch in zero (unless at an endpoint, then ignore)
-        if next_zero != 0xFF and i < len(in_bytes) - 1:
+        if next_zero != 0xFF and i < end:
             decoded.append(0)
     return decoded
 
 
+def cobs_decode(in_bytes):
+    """Decodes a COBS  encoded byte array.
+
+    Args:
+        in_bytes: The COBS encoded byte array to be decoded, including
+            its trailing zero.
+
+    Returns:
+        The decoded byte array.
+    """
+    return _decode(in_bytes, len(in_bytes) - 1)
+
+
+def cobs_check(frame):
+    """Check that a frame is well formed COBS.
+
+    The decoders accept anything, so this is how damaged frames are spotted.
+
+    Args:
+        frame: The COBS encoded bytes, without the trailing zero.
+
+    Returns:
+        True if the block codes exactly span the frame.
+    """
+    length = len(frame)
+    i = 0
+    while i < length:
+        code = frame[i]
+        if code == 0:
+            return False
+        i += code
+    return i == length
+
+
 def cobs_encode(in_bytes):
     """Encodes a byte array into a COBS encoded byte array.
 
     Args:
         in_bytes: The byte array to be encoded.
-        
+
     Returns:
         The COBS encoded byte array.
     """
+    parts = []
 
-    encoded = bytearray(b"\00")
+    # each zero-free run becomes one or more blocks
+    for run in bytes(in_bytes).split(b"\00"):
+        start = 0
+        # full blocks get a placeholder code and no zero
+        while len(run) - start >= MAX_BLOCK:
+            parts.append(b"\xff")
+            parts.append(run[start:start + MAX_BLOCK])
+            start += MAX_BLOCK
 
-    next_zero = 1
-    write_index = 1
-    next_zero_index = 0
+        parts.append(_CODES[len(run) - start + 1])
+        parts.append(run[start:] if start else run)
 
-    i = 0
-    while i < len(in_bytes):
-        val = in_bytes[i]
-        encoded.append(0)
+    # trailing zero
+    parts.append(b"\00")
+    return bytearray(b"".join(parts))
 
-        if val == 0:
-            # patch in distance to this zero
-            encoded[next_zero_index] = next_zero
-            next_zero = 1
-            next_zero_index = write_index
-            write_index += 1
 
-        else:
-            # write in data normally
-            encoded[-1] = val
-            write_index += 1
-            next_zero += 1
-            # patch in distance if at an endpoint
-            if next_zero == 0xFF:
-                encoded[next_zero_index] = next_zero
-                next_zero = 1
-                next_zero_index = write_index
-                write_index += 1
+class CobsStreamDecoder:
+    """Split a byte stream into COBS frames and decode them.
 
-        i += 1
-
-    encoded[next_zero_index] = next_zero
-    encoded.append(0)
-    return encoded
+    Chunks can be any size. Partial frames are kept until the rest of them
+    arrives in a later chunk.
+    """
+    def __init__(self, max_frame=None):
+        """
+        Initialize a CobsStreamDecoder.
+
+        Args:
+            max_frame: Optional limit on a pending frame's length. Longer
+                frames are dropped, since they can only be line noise.
+        """
+        self.max_frame = max_frame
+        self.pending = bytearray()
+        self.dropped = 0
+        # skipping the rest of a dropped frame, up to its delimiter
+        self.discarding = False
+
+    def feed(self, chunk):
+        """Add bytes to the stream.
+
+        Args:
+            chunk: Bytes read from the serial port.
+
+        Returns:
+            A list of decoded frames completed by this chunk.
+        """
+        frames = []
+
+        if self.discarding:
+            end = chunk.find(b"\00")
+            if end == -1:
+                return frames
+            self.discarding = False
+            chunk = chunk[end + 1:]
+
+        start = 0
+        end = chunk.find(b"\00")
+        if end == -1:
+            self.pending += chunk
+            self._check_overflow()
+            return frames
+
+        # finish the frame left over from the last chunk
+        if self.pending:
+            self.pending += chunk[:end]
+            frame = self.pending
+            self.pending = bytearray()
+        else:
+            frame = chunk[:end]
+
+        while True:
+            # empty frames are just back-to-back delimiters
+            if frame:
+                frames.append(_decode(frame, len(frame)))
+
+            start = end + 1
+            end = chunk.find(b"\00", start)
+            if end == -1:
+                break
+            frame = chunk[start:end]
+
+        self.pending += chunk[start:]
+        self._check_overflow()
+        return frames
+
+    def reset(self):
+        """Forget any partially received frame."""
+        self.pending = bytearray()
+        self.discarding = False
+
+    def _check_overflow(self):
+        """Drop the pending frame if it has grown too long, and the rest of
+        it as it arrives."""
+        if self.max_frame is not None and len(self.pending) > self.max_frame:
+            self.pending = bytearray()
+            self.dropped += 1
+            self.discarding = True
@@ -0,0 +1,486 @@
+"""Drive many ArduController boards from a single I/O thread.
+
+Jackson Smith
+Final Project
+"""
+
+import os
+import queue
+import selectors
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+
+import serial
+
+from arducontroller import (
+    BadCommandError,
+    Command,
+    SET_PID_CODEC,
+    decode_encoders,
+    motor_mask,
+)
+from byte_packing import pack_values
+from cobs_encoder import CobsStreamDecoder, cobs_encode
+from pipeline import SEQUENCED, STREAM, RequestTable
+from serial_engine import MAX_FRAME
+
+
+class PooledController:
+    """One board in a ControllerPool.
+
+    Every command is sequenced and returns a Future, so it never blocks
+    the caller or the pool's I/O thread. Create these with ControllerPool.add().
+    """
+    def __init__(self, pool, name, port, baud_rate, on_stream=None):
+        """
+        Initialize a PooledController and open its port.
+
+        Args:
+            pool: The ControllerPool driving this board.
+            name: Name the pool reports this board's results under.
+            port: The serial port to connect to.
+            baud_rate: The baud rate for the serial connection.
+            on_stream: Optional callback run on the I/O thread with each
+                streamed frame. If not given, streamed frames go to stream_queue.
+        """
+        self.pool = pool
+        self.name = name
+        self.port = port
+        self.on_stream = on_stream
+
+        self.ser = serial.Serial(port, baud_rate, timeout=0, write_timeout=0)
+        self.fd = self.ser.fileno()
+        self.closed = False
+
+        self.decoder = CobsStreamDecoder(MAX_FRAME)
+        self.requests = RequestTable()
+        self.stream_queue = queue.Queue()
+
+        self.write_lock = threading.Lock()
+        self.out_buffer = bytearray()
+
+    def set_motor(self, speed, motor=0):
+        """Set the motor speed.
+
+        Args:
+            speed: between -255 and 255, inclusive.
+            motor: motor index, or iterable of indices. Default is 0.
+
+        Returns:
+            Future resolving when the board acknowledges.
+        """
+        assert -255 <= speed <= 255
+        return self.send_sequenced(Command.SET_MOTOR, (int(speed),), "", motor)
+
+    def set_pid(self, KP, KI, KD, zero_output, min_output, max_output, I_region, I_max, motor=0):
+        """Set the PID parameters.
+
+        Args:
+            KP: Proportional gain.
+            KI: Integral gain.
+            KD: Derivative gain.
+            zero_output: Output cutoff.
+            min_output: Minimum output.
+            max_output: Maximum output.
+            I_region: Integration region.
+            I_max: Integration max.
+            motor: motor index, or iterable of indices. Default is 0.
+
+        Returns:
+            Future resolving when the board acknowledges.
+        """
+        # reuse the precompiled codec, minus its command byte
+        data = SET_PID_CODEC.pack(
+            float(KP),
+            float(KI),
+            float(KD),
+            float(zero_output),
+            float(min_output),
+            float(max_output),
+            float(I_region),
+            float(I_max),
+        )[1:] + motor_mask(motor)
+        return self.request(Command.SET_PID, data)
+
+    def set_position(self, position, motor=0):
+        """Set PID setpoint.
+
+        Args:
+            position: new setpoint
+            motor: motor index, or iterable of indices. Default is 0.
+
+        Returns:
+            Future resolving to a list holding the echoed back position.
+        """
+        return self.send_sequenced(Command.SET_POSITION, (int(position),), "i", motor)
+
+    def request_encoders(self):
+        """Request every motor's encoder count.
+
+        Returns:
+            Future resolving to a NumPy array of encoder counts, indexed by motor.
+        """
+        return self.request(Command.REQUEST_ENCODER, b"", decode_encoders)
+
+    def subscribe_telemetry(self, rate):
+        """Ask the board to stream telemetry to on_stream or stream_queue.
+
+        The board stops streaming if it hears nothing for half a second,
+        so resubscribe (or send anything else) regularly.
+
+        Args:
+            rate: samples per second. 0 stops streaming.
+
+        Returns:
+            Future resolving when the board acknowledges.
+        """
+        period_us = int(1e6 / rate) if rate else 0
+        return self.send_sequenced(Command.SUBSCRIBE_TELEMETRY, (period_us,))
+
+    def send_sequenced(self, command, args=(), pattern="", motor=0):
+        """Send a command with packed arguments tagged with a sequence ID.
+
+        Args:
+            command: Instruction ID from Command
+            args: values to send
+            pattern: pattern to unpack the reply with, a function to decode
+                the raw reply with, or None for the raw reply
+            motor: motor index, or iterable of indices. Default is 0.
+
+        Returns:
+            Future resolving to the decoded reply.
+        """
+        try:
+            data = pack_values(args) + motor_mask(motor)
+        except ValueError:
+            raise BadCommandError(f"Invalid command argument list {repr(args)}")
+        return self.request(command, data, pattern)
+
+    def request(self, command, data=b"", pattern=""):
+        """Send a command tagged with a sequence ID.
+
+        Args:
+            command: Instruction ID from Command
+            data: packed arguments
+            pattern: pattern to unpack the reply with, a function to decode
+                the raw reply with, or None for the raw reply
+
+        Returns:
+            Future resolving to the decoded reply. Cancelling it forgets
+            the request.
+        """
+        future = Future()
+        if self.closed:
+            future.set_exception(ConnectionError("Serial port closed"))
+            return future
+
+        seq = self.requests.add(future, pattern)
+        # forget the ID if the caller gives up on it
+        future.add_done_callback(lambda f: f.cancelled() and self.requests.discard(seq))
+        try:
+            self._write(cobs_encode(bytes([command | SEQUENCED, seq]) + data))
+        except OSError as e:
+            # the board went away; the I/O thread closes it once it notices
+            self.requests.discard(seq)
+            future.set_exception(e)
+        return future
+
+    def close(self, error=None):
+        """Close the port, failing any requests still in flight.
+
+        Args:
+            error: Exception to fail them with. Defaults to a ConnectionError.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self.ser.close()
+        self.requests.fail_all(error or ConnectionError("Serial port closed"))
+
+    def _write(self, frame):
+        """Write a frame now, or queue it for the I/O thread if the port is full."""
+        with self.write_lock:
+            if not self.out_buffer:
+                try:
+                    written = os.write(self.fd, frame)
+                except BlockingIOError:
+                    written = 0
+                if written == len(frame):
+                    return
+                frame = frame[written:]
+                self.pool._want_write(self)
+            self.out_buffer += frame
+
+    def _on_writable(self):
+        """Flush queued output. Runs on the I/O thread.
+
+        Returns:
+            True once everything queued has been written.
+        """
+        with self.write_lock:
+            try:
+                written = os.write(self.fd, self.out_buffer)
+            except BlockingIOError:
+                return False
+            except OSError as e:
+                self.pool._disconnected(self, e)
+                return False
+            del self.out_buffer[:written]
+            return not self.out_buffer
+
+    def _on_readable(self):
+        """Read everything waiting and route complete frames. Runs on the I/O thread."""
+        try:
+            chunk = os.read(self.fd, 4096)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            self.pool._disconnected(self, e)
+            return
+        if not chunk:
+            # end of file: the port went away
+            self.pool._disconnected(self, EOFError("Serial port closed by the other end"))
+            return
+
+        for frame in self.decoder.feed(chunk):
+            if not frame:
+                continue
+            if frame[0] & STREAM:
+                if self.on_stream is not None:
+                    self.on_stream(self, frame)
+                else:
+                    self.stream_queue.put(frame)
+            else:
+                self.requests.resolve(frame)
+
+
+class ControllerPool:
+    """Multiplex many boards from one selectors loop on one thread.
+
+    Replies are matched to futures by sequence ID, so any thread can send
+    to any board without taking turns, and a slow board never holds up
+    the others.
+
+    Example usage:
+        with ControllerPool() as pool:
+            for port in ports:
+                pool.add(port)
+            pool.start()
+            encoders = pool.gather(pool.map(lambda board: board.request_encoders()))
+    """
+    def __init__(self):
+        """Initialize an empty ControllerPool."""
+        self.selector = selectors.DefaultSelector()
+        self.devices = {}
+
+        # wakes the I/O thread to pick up new devices and pending writes
+        self.wake_read, self.wake_write = os.pipe()
+        os.set_blocking(self.wake_read, False)
+        os.set_blocking(self.wake_write, False)
+        self.selector.register(self.wake_read, selectors.EVENT_READ, None)
+
+        self.changes = queue.Queue()
+        self.running = False
+        self.thread = None
+
+    def add(self, port, baud_rate=115200, name=None, on_stream=None):
+        """Open a board's port and start driving it.
+
+        Boards added before start() share its startup delay.
+
+        Args:
+            port: The serial port to connect to.
+            baud_rate: The baud rate for the serial connection. Default is 115200.
+            name: Name to report results under. Defaults to the port.
+            on_stream: Optional callback run on the I/O thread with
+                (device, frame) for each streamed frame.
+
+        Returns:
+            The new PooledController.
+        """
+        name = port if name is None else name
+        if name in self.devices:
+            raise ValueError(f"A device named {repr(name)} is already in the pool")
+
+        device = PooledController(self, name, port, baud_rate, on_stream)
+        self.devices[name] = device
+        self.changes.put(("add", device))
+        self._wake()
+        return device
+
+    def remove(self, name):
+        """Stop driving a board and close its port.
+
+        Args:
+            name: The board's name.
+        """
+        device = self.devices.pop(name)
+        self.changes.put(("remove", device))
+        self._wake()
+
+    def start(self, startup_delay=3):
+        """Start the I/O thread.
+
+        Args:
+            startup_delay: Seconds to give the boards to boot after their
+                ports open. They boot in parallel, so this is paid once. Default is 3.
+        """
+        time.sleep(startup_delay)
+        for device in self.devices.values():
+            device.ser.reset_input_buffer()
+
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        """Stop the I/O thread and close every port."""
+        if self.running:
+            self.running = False
+            self._wake()
+            self.thread.join()
+
+        # close boards removed since the I/O thread last looked
+        self._apply_changes()
+        for device in self.devices.values():
+            device.close()
+        self.devices.clear()
+        self.selector.close()
+        os.close(self.wake_read)
+        os.close(self.wake_write)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self.devices)
+
+    def __getitem__(self, name):
+        return self.devices[name]
+
+    def __iter__(self):
+        return iter(self.devices.values())
+
+    def map(self, call):
+        """Fan a call out to every board.
+
+        Args:
+            call: Function taking a PooledController and returning a Future.
+
+        Returns:
+            Dictionary of device name to Future.
+        """
+        return {name: call(device) for name, device in self.devices.items()}
+
+    def gather(self, futures, timeout=1):
+        """Wait for fanned out calls to finish.
+
+        Args:
+            futures: Dictionary of device name to Future, e.g. from map().
+            timeout: Seconds to wait for all of them together. Default is 1.
+
+        Returns:
+            Dictionary of device name to result. Boards that failed or
+            didn't answer in time map to the exception instead.
+        """
+        deadline = time.monotonic() + timeout
+        results = {}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result(max(0.0, deadline - time.monotonic()))
+            except TimeoutError as e:
+                future.cancel()
+                results[name] = e
+            except Exception as e:
+                results[name] = e
+        return results
+
+    def request_encoders(self, timeout=1):
+        """Request encoder counts from every board at once.
+
+        Args:
+            timeout: Seconds to wait for the replies. Default is 1.
+
+        Returns:
+            Dictionary of device name to an array of encoder counts, or the
+            exception for boards that failed.
+        """
+        return self.gather(self.map(lambda device: device.request_encoders()), timeout)
+
+    def run(self):
+        """Serve every board until closed. Runs on the I/O thread."""
+        while self.running:
+            for key, events in self.selector.select(timeout=0.1):
+                device = key.data
+                if device is None:
+                    self._drain_wakeups()
+                    continue
+                if device.closed:
+                    continue
+                if events & selectors.EVENT_READ:
+                    device._on_readable()
+                if events & selectors.EVENT_WRITE and not device.closed and device._on_writable():
+                    self.selector.modify(device.fd, selectors.EVENT_READ, device)
+            self._apply_changes()
+
+    def _apply_changes(self):
+        """Register new devices and write interest. Runs on the I/O thread."""
+        while True:
+            try:
+                change, device = self.changes.get_nowait()
+            except queue.Empty:
+                return
+
+            if change == "add":
+                self.selector.register(device.fd, selectors.EVENT_READ, device)
+            elif change == "remove":
+                self._unregister(device)
+                device.close()
+            elif change == "write" and not device.closed:
+                self.selector.modify(device.fd, selectors.EVENT_READ | selectors.EVENT_WRITE, device)
+
+    def _unregister(self, device):
+        """Stop watching a device's port, if it's still watched. Runs on the I/O thread."""
+        try:
+            self.selector.unregister(device.fd)
+        except KeyError:
+            pass
+
+    def _disconnected(self, device, error):
+        """Stop driving a board whose port went away, failing its requests.
+
+        A gone port keeps reporting readable, so it has to come out of the
+        selector. The board stays in the pool, so calls to it fail straight
+        away. Runs on the I/O thread.
+
+        Args:
+            device: The PooledController.
+            error: What reading or writing its port raised.
+        """
+        self._unregister(device)
+        device.close(ConnectionError(f"{device.name} disconnected: {error}"))
+
+    def _want_write(self, device):
+        """Ask the I/O thread to flush a device's queued output."""
+        self.changes.put(("write", device))
+        self._wake()
+
+    def _wake(self):
+        """Interrupt the I/O thread's select."""
+        try:
+            os.write(self.wake_write, b"\0")
+        except BlockingIOError:
+            # already plenty of wakeups pending
+            pass
+
+    def _drain_wakeups(self):
+        """Clear pending wakeups."""
+        try:
+            while os.read(self.wake_read, 4096):
+                pass
+        except BlockingIOError:
+            pass
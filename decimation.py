@@ -0,0 +1,50 @@
+"""Thin out line data to what a plot can actually show.
+
+Jackson Smith
+Final Project
+"""
+
+import numpy as np
+
+
+def minmax_decimate(x, ys, x0, x1, columns):
+    """Reduce lines to their minimum and maximum in each pixel column.
+
+    A line drawn through the two extremes of every column looks the same as
+    one drawn through every point, spikes included.
+
+    Args:
+        x: Sorted x values shared by every line.
+        ys: List of y value arrays, one per line.
+        x0: x value at the left edge of the plot.
+        x1: x value at the right edge of the plot.
+        columns: Width of the plot in pixels.
+
+    Returns:
+        A tuple of (x, ys) with at most two points per column. The inputs
+        are returned unchanged if they are already small enough.
+    """
+    columns = max(1, int(columns))
+    if len(x) <= 2 * columns or x1 <= x0:
+        return x, ys
+
+    # pixel column of every point; x is sorted so these are too
+    bins = ((np.asarray(x) - x0) * (columns / (x1 - x0))).astype(np.int64)
+    np.clip(bins, 0, columns - 1, out=bins)
+
+    starts = np.flatnonzero(np.diff(bins)) + 1
+    starts = np.concatenate(([0], starts))
+    ends = np.append(starts[1:], len(x)) - 1
+
+    out_x = np.empty(2 * len(starts))
+    out_x[0::2] = x[starts]
+    out_x[1::2] = x[ends]
+
+    out_ys = []
+    for y in ys:
+        out_y = np.empty(2 * len(starts))
+        out_y[0::2] = np.minimum.reduceat(y, starts)
+        out_y[1::2] = np.maximum.reduceat(y, starts)
+        out_ys.append(out_y)
+
+    return out_x, out_ys
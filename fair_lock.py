@@ -0,0 +1,91 @@
+"""A first-come, first-served lock that records wait times.
+
+Jackson Smith
+Final Project
+"""
+
+import threading
+import time
+from collections import deque
+
+
+class FairLock:
+    """A ticket lock: threads get the lock in the order they asked for it.
+
+    Waiting threads sleep on a condition variable instead of spinning.
+    """
+    def __init__(self, history=1000):
+        """
+        Initialize a FairLock.
+
+        Args:
+            history: How many recent wait times to keep. Default is 1000.
+        """
+        self.condition = threading.Condition(threading.Lock())
+        self.next_ticket = 0
+        self.now_serving = 0
+        self.abandoned = set()
+
+        # (thread name, seconds waited) for recent acquisitions
+        self.wait_times = deque(maxlen=history)
+        self.total_wait = 0.0
+        self.acquisitions = 0
+        self.timeouts = 0
+
+    def acquire(self, timeout=None):
+        """Wait for the lock.
+
+        Args:
+            timeout: Seconds to wait before giving up. None waits forever.
+
+        Returns:
+            True if the lock was acquired, False on timeout.
+        """
+        start = time.perf_counter()
+        with self.condition:
+            ticket = self.next_ticket
+            self.next_ticket += 1
+
+            while ticket != self.now_serving:
+                if timeout is None:
+                    self.condition.wait()
+                    continue
+
+                remaining = timeout - (time.perf_counter() - start)
+                if remaining <= 0:
+                    # let the holder skip over this ticket
+                    self.abandoned.add(ticket)
+                    self.timeouts += 1
+                    return False
+                self.condition.wait(remaining)
+
+            waited = time.perf_counter() - start
+            self.wait_times.append((threading.current_thread().name, waited))
+            self.total_wait += waited
+            self.acquisitions += 1
+            return True
+
+    def release(self):
+        """Pass the lock to the next thread in line."""
+        with self.condition:
+            self.now_serving += 1
+            while self.now_serving in self.abandoned:
+                self.abandoned.remove(self.now_serving)
+                self.now_serving += 1
+            self.condition.notify_all()
+
+    def locked(self):
+        """Check if some thread holds the lock.
+
+        Returns:
+            True if the lock is held, False otherwise.
+        """
+        with self.condition:
+            return self.now_serving < self.next_ticket
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
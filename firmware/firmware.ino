@@ -2,31 +2,59 @@
 #include "motor.h"
 #include "pid.h"
 
-#define ENCODER_PIN_A 50
-#define ENCODER_PIN_B 52
-
-#define MOTOR_RPWM_PIN 2
-#define MOTOR_LPWM_PIN 3
+// add a row to each table below per extra motor (at most 8, one per mask bit)
+#define MOTOR_COUNT 1
 
 // stop all motors after this long without communication
 #define TIMEOUT_MS 500
 
 #define CYCLE_DELAY_MS 5
 
-Encoders encoder(ENCODER_PIN_A, ENCODER_PIN_B);
-PID pid{0, 0, 0, 0, 0, 0, 0, 0};
+// encoder pin A, pin B
+Encoders encoders[MOTOR_COUNT] = {
+  Encoders(50, 52),
+};
 
-Motor motor(MOTOR_LPWM_PIN, MOTOR_RPWM_PIN, -1, &encoder, &pid);
+PID pids[MOTOR_COUNT] = {
+  PID(0, 0, 0, 0, 0, 0, 0, 0),
+};
 
-typedef size_t (*EventFn)(uint8_t *, uint8_t *);
+// LPWM pin, RPWM pin, polarity
+Motor motors[MOTOR_COUNT] = {
+  Motor(3, 2, -1, &encoders[0], &pids[0]),
+};
+
+// commands that address motors take an optional trailing bitmask of the
+// motors to apply to; without one they apply to motor 0
+#define DEFAULT_MOTOR_MASK 0x01
+
+// handlers get the reply buffer, the command data and its length
+typedef size_t (*EventFn)(uint8_t *, uint8_t *, size_t);
 
 enum Command {
   SET_SPEED = 1,
   ENCODER_REQUEST = 2,
   SET_PID = 3,
-  SET_POSITION = 4
+  SET_POSITION = 4,
+  SUBSCRIBE_TELEMETRY = 5,
+  REQUEST_ENCODER_HISTORY = 6,
+  SET_FRAMING = 7,
+  NEGOTIATE_BAUD = 8,
+  HELLO = 9,
+  BATCH = 10
 };
 
+// sent in the HELLO reply; bump when the protocol changes
+#define PROTOCOL_VERSION 2
+
+// set on the command byte of a sequenced frame; the next byte is the
+// sequence ID, which is echoed at the start of the reply
+#define SEQUENCED 0x80
+
+// set on the first byte of frames sent without a request (sequence IDs are
+// only 7 bits, so replies never have it set)
+#define STREAM 0x80
+
 struct EventHandler
 {
   Command command;
@@ -40,16 +68,109 @@ EventHandler event_handlers[MAX_EVENTS];
 
 long int time_of_last_heartbeat = 0;
 
+// framed mode wraps every frame in a 2 byte length and a 2 byte CRC16;
+// a length of 0xFFFF with no payload is a NACK, asking for the last frame again
+#define FRAME_HEADER 2
+#define FRAME_OVERHEAD 4
+#define NACK_LENGTH 0xFFFF
+bool framed = false;
+unsigned long bad_frames = 0;
+
+// big enough for a full history reply, with room for the framing
+#define REPLY_LENGTH 800
+uint8_t reply_buffer[REPLY_LENGTH + FRAME_OVERHEAD];
+uint8_t *reply = reply_buffer + FRAME_HEADER;
+
+// COBS adds a byte per 254 plus the first code and trailing zero;
+// holds the last reply, to send again on a NACK
+uint8_t encoded_reply[REPLY_LENGTH + FRAME_OVERHEAD + (REPLY_LENGTH + FRAME_OVERHEAD) / 254 + 2];
+size_t encoded_reply_len = 0;
+
+// CRC-16/CCITT-FALSE lookup table, polynomial 0x1021
+const uint16_t CRC16_TABLE[256] PROGMEM = {
+  0x0000, 0x1021, 0x2042, 0x3063, 0x4084, 0x50A5, 0x60C6, 0x70E7,
+  0x8108, 0x9129, 0xA14A, 0xB16B, 0xC18C, 0xD1AD, 0xE1CE, 0xF1EF,
+  0x1231, 0x0210, 0x3273, 0x2252, 0x52B5, 0x4294, 0x72F7, 0x62D6,
+  0x9339, 0x8318, 0xB37B, 0xA35A, 0xD3BD, 0xC39C, 0xF3FF, 0xE3DE,
+  0x2462, 0x3443, 0x0420, 0x1401, 0x64E6, 0x74C7, 0x44A4, 0x5485,
+  0xA56A, 0xB54B, 0x8528, 0x9509, 0xE5EE, 0xF5CF, 0xC5AC, 0xD58D,
+  0x3653, 0x2672, 0x1611, 0x0630, 0x76D7, 0x66F6, 0x5695, 0x46B4,
+  0xB75B, 0xA77A, 0x9719, 0x8738, 0xF7DF, 0xE7FE, 0xD79D, 0xC7BC,
+  0x48C4, 0x58E5, 0x6886, 0x78A7, 0x0840, 0x1861, 0x2802, 0x3823,
+  0xC9CC, 0xD9ED, 0xE98E, 0xF9AF, 0x8948, 0x9969, 0xA90A, 0xB92B,
+  0x5AF5, 0x4AD4, 0x7AB7, 0x6A96, 0x1A71, 0x0A50, 0x3A33, 0x2A12,
+  0xDBFD, 0xCBDC, 0xFBBF, 0xEB9E, 0x9B79, 0x8B58, 0xBB3B, 0xAB1A,
+  0x6CA6, 0x7C87, 0x4CE4, 0x5CC5, 0x2C22, 0x3C03, 0x0C60, 0x1C41,
+  0xEDAE, 0xFD8F, 0xCDEC, 0xDDCD, 0xAD2A, 0xBD0B, 0x8D68, 0x9D49,
+  0x7E97, 0x6EB6, 0x5ED5, 0x4EF4, 0x3E13, 0x2E32, 0x1E51, 0x0E70,
+  0xFF9F, 0xEFBE, 0xDFDD, 0xCFFC, 0xBF1B, 0xAF3A, 0x9F59, 0x8F78,
+  0x9188, 0x81A9, 0xB1CA, 0xA1EB, 0xD10C, 0xC12D, 0xF14E, 0xE16F,
+  0x1080, 0x00A1, 0x30C2, 0x20E3, 0x5004, 0x4025, 0x7046, 0x6067,
+  0x83B9, 0x9398, 0xA3FB, 0xB3DA, 0xC33D, 0xD31C, 0xE37F, 0xF35E,
+  0x02B1, 0x1290, 0x22F3, 0x32D2, 0x4235, 0x5214, 0x6277, 0x7256,
+  0xB5EA, 0xA5CB, 0x95A8, 0x8589, 0xF56E, 0xE54F, 0xD52C, 0xC50D,
+  0x34E2, 0x24C3, 0x14A0, 0x0481, 0x7466, 0x6447, 0x5424, 0x4405,
+  0xA7DB, 0xB7FA, 0x8799, 0x97B8, 0xE75F, 0xF77E, 0xC71D, 0xD73C,
+  0x26D3, 0x36F2, 0x0691, 0x16B0, 0x6657, 0x7676, 0x4615, 0x5634,
+  0xD94C, 0xC96D, 0xF90E, 0xE92F, 0x99C8, 0x89E9, 0xB98A, 0xA9AB,
+  0x5844, 0x4865, 0x7806, 0x6827, 0x18C0, 0x08E1, 0x3882, 0x28A3,
+  0xCB7D, 0xDB5C, 0xEB3F, 0xFB1E, 0x8BF9, 0x9BD8, 0xABBB, 0xBB9A,
+  0x4A75, 0x5A54, 0x6A37, 0x7A16, 0x0AF1, 0x1AD0, 0x2AB3, 0x3A92,
+  0xFD2E, 0xED0F, 0xDD6C, 0xCD4D, 0xBDAA, 0xAD8B, 0x9DE8, 0x8DC9,
+  0x7C26, 0x6C07, 0x5C64, 0x4C45, 0x3CA2, 0x2C83, 0x1CE0, 0x0CC1,
+  0xEF1F, 0xFF3E, 0xCF5D, 0xDF7C, 0xAF9B, 0xBFBA, 0x8FD9, 0x9FF8,
+  0x6E17, 0x7E36, 0x4E55, 0x5E74, 0x2E93, 0x3EB2, 0x0ED1, 0x1EF0,
+};
+
+// the link starts at BOOT_BAUD; NEGOTIATE_BAUD may move it to one of
+// BAUD_RATES (exact divisors of the 16 MHz clock), and it goes back if the
+// host's ping doesn't arrive within BAUD_VERIFY_MS of switching
+#define BOOT_BAUD 115200
+#define BAUD_VERIFY_MS 500
+const unsigned long BAUD_RATES[] = {2000000, 1000000, 500000, 250000};
+#define BAUD_RATE_COUNT (sizeof(BAUD_RATES) / sizeof(BAUD_RATES[0]))
+
+unsigned long current_baud = BOOT_BAUD;
+// rate to switch to once the reply has gone out, 0 for none
+unsigned long pending_baud = 0;
+bool baud_unverified = false;
+unsigned long baud_switch_ms = 0;
+
+// recent samples, one per loop, kept in a ring buffer
+#define HISTORY_LENGTH 128
+// most samples sent in one reply: 8 byte header + 12 bytes per sample
+#define HISTORY_PER_REPLY 64
+
+struct Sample
+{
+  unsigned long time_us;
+  long int encoder;
+  float output;
+};
+
+Sample history[HISTORY_LENGTH];
+// total samples ever recorded; sample n lives at history[n % HISTORY_LENGTH]
+unsigned long history_count = 0;
+
+// telemetry streaming, off while the period is 0
+unsigned long telemetry_period_us = 0;
+unsigned long last_telemetry_us = 0;
+
 void setup()
 {
   register_event(SET_SPEED, handle_speed_change);
   register_event(ENCODER_REQUEST, handle_encoder_request);
   register_event(SET_PID, handle_set_pid);
   register_event(SET_POSITION, handle_set_position);
-  motor.setup();
-  Serial.begin(115200);
-  // Startup delay for Arduino oddness
-  delay(500);
+  register_event(SUBSCRIBE_TELEMETRY, handle_subscribe_telemetry);
+  register_event(REQUEST_ENCODER_HISTORY, handle_history_request);
+  register_event(NEGOTIATE_BAUD, handle_negotiate_baud);
+  register_event(BATCH, handle_batch);
+  for (size_t i = 0; i < MOTOR_COUNT; ++i)
+  {
+    motors[i].setup();
+  }
+  Serial.begin(BOOT_BAUD);
 
   time_of_last_heartbeat = millis();
 }
@@ -66,65 +187,330 @@ void register_event(Command instruction, EventFn callback)
   events %= MAX_EVENTS; // overwriting is better than writing to random memory
 }
 
+// Find the function registered for a command, or NULL
+EventFn find_event(Command command)
+{
+  for (size_t i = 0; i < events; ++i)
+  {
+    if (event_handlers[i].command == command)
+    {
+      return event_handlers[i].callback;
+    }
+  }
+  return NULL;
+}
+
+// Read the motor bitmask following a command's arguments
+uint8_t read_motor_mask(uint8_t *data, size_t len, size_t args_len)
+{
+  return len > args_len ? data[args_len] : DEFAULT_MOTOR_MASK;
+}
+
 // Update PID params
-size_t handle_set_pid(uint8_t *reply, uint8_t *data)
+size_t handle_set_pid(uint8_t *reply, uint8_t *data, size_t len)
 {
-  pid.KP = read_float(data, 0);
-  pid.KI = read_float(data, 4);
-  pid.KD = read_float(data, 8);
+  uint8_t mask = read_motor_mask(data, len, 32);
+
+  for (size_t i = 0; i < MOTOR_COUNT; ++i)
+  {
+    if (!(mask & (1 << i)))
+    {
+      continue;
+    }
 
-  pid.zero_output = read_float(data, 12);
-  pid.min_output = read_float(data, 16);
-  pid.max_output = read_float(data, 20);
+    PID &pid = pids[i];
+    pid.KP = read_float(data, 0);
+    pid.KI = read_float(data, 4);
+    pid.KD = read_float(data, 8);
 
-  pid.I_region = read_float(data, 24);
-  pid.I_max = read_float(data, 28);
+    pid.zero_output = read_float(data, 12);
+    pid.min_output = read_float(data, 16);
+    pid.max_output = read_float(data, 20);
+
+    pid.I_region = read_float(data, 24);
+    pid.I_max = read_float(data, 28);
+  }
 
   return 0;
 }
 
 // Update PID setpoint
-size_t handle_set_position(uint8_t *reply, uint8_t *data)
+size_t handle_set_position(uint8_t *reply, uint8_t *data, size_t len)
 {
   long int pos = read_int(data, 0);
-  motor.set_position_mode();
-  motor.set_position(pos);
+  uint8_t mask = read_motor_mask(data, len, 4);
+
+  for (size_t i = 0; i < MOTOR_COUNT; ++i)
+  {
+    if (mask & (1 << i))
+    {
+      motors[i].set_position_mode();
+      motors[i].set_position(pos);
+    }
+  }
 
   return write_int(reply, pos, 0);
 }
 
 // Change motor speed
-size_t handle_speed_change(uint8_t *reply, uint8_t *data)
+size_t handle_speed_change(uint8_t *reply, uint8_t *data, size_t len)
 {
   int speed = (int)read_int(data, 0);
-  motor.set_analog(speed);
-  motor.set_analog_mode();
+  uint8_t mask = read_motor_mask(data, len, 4);
+
+  for (size_t i = 0; i < MOTOR_COUNT; ++i)
+  {
+    if (mask & (1 << i))
+    {
+      motors[i].set_analog(speed);
+      motors[i].set_analog_mode();
+    }
+  }
   return 0;
 }
 
-// Write encoder counts to serial
-size_t handle_encoder_request(uint8_t *reply, uint8_t *data)
+// Write every motor's encoder count to serial, in motor order
+size_t handle_encoder_request(uint8_t *reply, uint8_t *data, size_t len)
 {
-  long int enc = motor.get_enc();
+  size_t written_length = 0;
 
-  size_t written_length = write_int(reply, enc, 0);
+  for (size_t i = 0; i < MOTOR_COUNT; ++i)
+  {
+    written_length = write_int(reply, motors[i].get_enc(), written_length);
+  }
 
   return written_length;
 }
 
+// Start, retime or (with a period of 0) stop telemetry streaming
+size_t handle_subscribe_telemetry(uint8_t *reply, uint8_t *data, size_t len)
+{
+  telemetry_period_us = (unsigned long)read_int(data, 0);
+  last_telemetry_us = micros();
+  return 0;
+}
+
+// command byte, time, then encoder, setpoint and PID output per motor
+#define TELEMETRY_LENGTH (1 + 4 + 3 * 4 * MOTOR_COUNT)
+
+// Stream one telemetry frame: time, then encoder, setpoint and PID output per motor
+void send_telemetry()
+{
+  uint8_t buffer[TELEMETRY_LENGTH + FRAME_OVERHEAD];
+  uint8_t encoded[TELEMETRY_LENGTH + FRAME_OVERHEAD + 2];
+  uint8_t *frame = buffer + FRAME_HEADER;
+  frame[0] = STREAM | SUBSCRIBE_TELEMETRY;
+
+  size_t len = 1;
+  len = write_int(frame, (long int)micros(), len);
+  for (size_t i = 0; i < MOTOR_COUNT; ++i)
+  {
+    len = write_int(frame, motors[i].get_enc(), len);
+    len = write_int(frame, motors[i].get_setpoint(), len);
+    len = write_float(frame, (float)motors[i].get_output(), len);
+  }
+
+  size_t enc_len = encode_frame(encoded, buffer, len);
+  Serial.write(encoded, enc_len);
+}
+
+// Send telemetry if a period has passed
+void update_telemetry()
+{
+  if (!telemetry_period_us)
+  {
+    return;
+  }
+
+  unsigned long now = micros();
+  unsigned long elapsed = now - last_telemetry_us;
+  if (elapsed < telemetry_period_us)
+  {
+    return;
+  }
+
+  // skip missed periods instead of sending a burst
+  if (elapsed >= 2 * telemetry_period_us)
+  {
+    last_telemetry_us = now;
+  }
+  else
+  {
+    last_telemetry_us += telemetry_period_us;
+  }
+
+  send_telemetry();
+}
+
+// Add motor 0's current state to the history
+void record_sample()
+{
+  Sample &sample = history[history_count % HISTORY_LENGTH];
+  sample.time_us = micros();
+  sample.encoder = motors[0].get_enc();
+  sample.output = (float)motors[0].get_output();
+  history_count++;
+}
+
+// Write every sample since a cursor: start cursor, count, then the samples
+size_t handle_history_request(uint8_t *reply, uint8_t *data, size_t len)
+{
+  unsigned long cursor = (unsigned long)read_int(data, 0);
+
+  // samples older than the ring buffer are gone
+  unsigned long oldest = history_count > HISTORY_LENGTH ? history_count - HISTORY_LENGTH : 0;
+  if (cursor < oldest)
+  {
+    cursor = oldest;
+  }
+  if (cursor > history_count)
+  {
+    cursor = history_count;
+  }
+
+  unsigned long count = history_count - cursor;
+  if (count > HISTORY_PER_REPLY)
+  {
+    count = HISTORY_PER_REPLY;
+  }
+
+  len = write_int(reply, (long int)cursor, 0);
+  len = write_int(reply, (long int)count, len);
+
+  for (unsigned long i = cursor; i < cursor + count; ++i)
+  {
+    Sample &sample = history[i % HISTORY_LENGTH];
+    len = write_int(reply, (long int)sample.time_us, len);
+    len = write_int(reply, sample.encoder, len);
+    len = write_float(reply, sample.output, len);
+  }
+
+  return len;
+}
+
+// Pick the first offered rate we support; with no offer, the host is
+// pinging at the new rate, which confirms it
+size_t handle_negotiate_baud(uint8_t *reply, uint8_t *data, size_t len)
+{
+  if (len == 0)
+  {
+    baud_unverified = false;
+    return write_int(reply, (long int)current_baud, 0);
+  }
+
+  unsigned long rate = 0;
+  for (size_t offset = 0; offset + 4 <= len && !rate; offset += 4)
+  {
+    unsigned long offered = (unsigned long)read_int(data, offset);
+    for (size_t i = 0; i < BAUD_RATE_COUNT; ++i)
+    {
+      if (BAUD_RATES[i] == offered)
+      {
+        rate = offered;
+        break;
+      }
+    }
+  }
+
+  if (rate && rate != current_baud)
+  {
+    pending_baud = rate;
+  }
+  return write_int(reply, (long int)rate, 0);
+}
+
+// a batched command's reply is at most one encoder count per motor
+#define MAX_BATCH_REPLY (4 * MOTOR_COUNT)
+
+// Only commands with short replies and no effect on the link can be batched
+bool batchable(Command command)
+{
+  return command == SET_SPEED || command == ENCODER_REQUEST || command == SET_PID ||
+         command == SET_POSITION || command == SUBSCRIBE_TELEMETRY;
+}
+
+// Run several commands from one frame. Each is a length byte, then the
+// command and its data. Each reply is a length byte, then the reply, in
+// the same order. A command that can't be batched gets an empty reply;
+// commands that don't fit in the reply buffer are dropped.
+size_t handle_batch(uint8_t *reply, uint8_t *data, size_t len)
+{
+  size_t written = 0;
+  size_t offset = 0;
+
+  // leave room for the sequence ID in front
+  while (offset < len && written + 1 + MAX_BATCH_REPLY <= REPLY_LENGTH - 1)
+  {
+    size_t command_len = data[offset++];
+    if (command_len == 0 || offset + command_len > len)
+    {
+      break;
+    }
+
+    Command command = (Command)data[offset];
+    EventFn callback = batchable(command) ? find_event(command) : NULL;
+    size_t reply_len = 0;
+    if (callback)
+    {
+      reply_len = callback(reply + written + 1, data + offset + 1, command_len - 1);
+    }
+
+    reply[written] = reply_len;
+    written += 1 + reply_len;
+    offset += command_len;
+  }
+
+  return written;
+}
+
+// Change the serial baud rate once the reply has gone out
+void set_baud(unsigned long rate)
+{
+  Serial.flush();
+  Serial.end();
+  Serial.begin(rate);
+  current_baud = rate;
+}
+
+// Switch to a negotiated rate, or back to the boot rate if no ping confirmed it
+void update_baud()
+{
+  if (pending_baud)
+  {
+    set_baud(pending_baud);
+    pending_baud = 0;
+    baud_unverified = true;
+    baud_switch_ms = millis();
+  }
+  else if (baud_unverified && millis() - baud_switch_ms > BAUD_VERIFY_MS)
+  {
+    set_baud(BOOT_BAUD);
+    baud_unverified = false;
+  }
+}
+
 void loop()
 {
-  motor.update();
+  for (size_t i = 0; i < MOTOR_COUNT; ++i)
+  {
+    motors[i].update();
+  }
+  record_sample();
   while (Serial.available())
   {
     read_serial();
   }
+  update_baud();
+
+  update_telemetry();
 
   long int time_since_heartbeat = millis() - time_of_last_heartbeat;
 
   if (time_since_heartbeat > TIMEOUT_MS)
   {
     stop_motors();
+    // nobody is listening anymore
+    telemetry_period_us = 0;
   }
 
   delay(CYCLE_DELAY_MS);
@@ -133,12 +519,17 @@ void loop()
 // Stop all motors
 void stop_motors()
 {
-  motor.stop();
+  for (size_t i = 0; i < MOTOR_COUNT; ++i)
+  {
+    motors[i].stop();
+  }
 }
 
 #define INCOMING_BUFFER 200
 int buffer_index = 0;
 uint8_t msg_buffer[INCOMING_BUFFER];
+// set when a frame outgrows msg_buffer; the rest of it is skipped
+bool overflowed = false;
 
 // Handle reading a byte from serial port
 void read_serial()
@@ -153,49 +544,194 @@ void read_serial()
 
   time_of_last_heartbeat = millis();
 
-  msg_buffer[buffer_index++] = (uint8_t)new_byte;
-
   if (new_byte != 0)
   {
+    // keep room for the delimiter
+    if (buffer_index < INCOMING_BUFFER - 1)
+    {
+      msg_buffer[buffer_index++] = (uint8_t)new_byte;
+    }
+    else
+    {
+      overflowed = true;
+    }
     // wait until full, 0-delimited message is sent
     return;
   }
 
+  // resynchronize on every delimiter, whatever came before it
+  size_t encoded_len = buffer_index;
+  buffer_index = 0;
+
+  if (overflowed)
+  {
+    overflowed = false;
+    reject_frame();
+    return;
+  }
+
+  msg_buffer[encoded_len++] = 0;
   uint8_t decoded[INCOMING_BUFFER];
+  size_t len = cobs_decode(decoded, msg_buffer, encoded_len);
+  handle_frame(decoded, len);
+}
+
+// Check a decoded frame in the current mode and dispatch it
+void handle_frame(uint8_t *decoded, size_t len)
+{
+  // HELLO is one unframed byte, understood in either mode; the host sends
+  // it until we answer, so it knows we're up without waiting out a delay
+  if (len == 1 && decoded[0] == HELLO)
+  {
+    // start from the same state whether or not the board was reset
+    framed = false;
+    telemetry_period_us = 0;
+    pending_baud = 0;
+    reply[0] = HELLO;
+    reply[1] = PROTOCOL_VERSION;
+    reply[2] = MOTOR_COUNT;
+    send_reply(3);
+    return;
+  }
+
+  // the framing switch is two unframed bytes, understood in either mode
+  if (len == 2 && decoded[0] == SET_FRAMING)
+  {
+    framed = decoded[1];
+    if (framed)
+    {
+      reply[0] = 1;
+      send_reply(1);
+    }
+    return;
+  }
+
+  if (framed)
+  {
+    if (len < FRAME_OVERHEAD || crc16(decoded, len - 2) != (uint16_t)(decoded[len - 2] | decoded[len - 1] << 8))
+    {
+      reject_frame();
+      return;
+    }
 
-  size_t len = cobs_decode(decoded, msg_buffer, buffer_index);
+    uint16_t length = decoded[0] | decoded[1] << 8;
+    if (length == NACK_LENGTH && len == FRAME_OVERHEAD)
+    {
+      // the host got a damaged reply
+      Serial.write(encoded_reply, encoded_reply_len);
+      return;
+    }
+    if (length != len - FRAME_OVERHEAD)
+    {
+      reject_frame();
+      return;
+    }
 
-  Command command = (Command)decoded[0];
-  uint8_t *data = &decoded[1];
+    decoded += FRAME_HEADER;
+    len = length;
+  }
 
-  dispatch(command, data);
+  if (len == 0 || ((decoded[0] & SEQUENCED) && len < 2))
+  {
+    return;
+  }
 
-  buffer_index = 0;
+  if (decoded[0] & SEQUENCED)
+  {
+    Command command = (Command)(decoded[0] & ~SEQUENCED);
+    dispatch(command, &decoded[2], len - 2, true, decoded[1]);
+  }
+  else
+  {
+    Command command = (Command)decoded[0];
+    dispatch(command, &decoded[1], len - 1, false, 0);
+  }
 }
 
-#define REPLY_LENGTH 200
-uint8_t reply[REPLY_LENGTH];
+// Count a damaged frame and, in framed mode, ask for it again
+void reject_frame()
+{
+  bad_frames++;
+  if (!framed)
+  {
+    return;
+  }
 
-uint8_t encoded_reply[REPLY_LENGTH + 2];
+  uint8_t nack[FRAME_OVERHEAD];
+  uint8_t encoded[FRAME_OVERHEAD + 2];
+  nack[0] = NACK_LENGTH & 0xFF;
+  nack[1] = NACK_LENGTH >> 8;
+  uint16_t crc = crc16(nack, 2);
+  nack[2] = crc & 0xFF;
+  nack[3] = crc >> 8;
+  size_t enc_len = cobs_encode(encoded, nack, FRAME_OVERHEAD);
+  Serial.write(encoded, enc_len);
+}
 
 // Dispatch a command to a function
-void dispatch(Command command, uint8_t *data)
+// sequenced commands always get a reply, prefixed with their sequence ID;
+// in framed mode every command does, so the host knows it arrived
+void dispatch(Command command, uint8_t *data, size_t len, bool sequenced, uint8_t seq)
 {
+  size_t header_len = sequenced ? 1 : 0;
+  reply[0] = seq;
+  bool handled = false;
+
   for (size_t i = 0; i < events; ++i)
   {
     EventHandler handler = event_handlers[i];
 
     if (handler.command == command)
     {
-      size_t reply_len = handler.callback(reply, data);
+      handled = true;
+      size_t reply_len = handler.callback(reply + header_len, data, len);
 
-      if (reply_len)
+      if (reply_len || sequenced || framed)
       {
-        size_t enc_reply_len = cobs_encode(encoded_reply, reply, reply_len);
-        Serial.write(encoded_reply, enc_reply_len);
+        send_reply(reply_len + header_len);
       }
     }
   }
+
+  if (!handled && framed)
+  {
+    send_reply(0);
+  }
+}
+
+// Encode and send the reply, keeping it to send again on a NACK
+void send_reply(size_t len)
+{
+  encoded_reply_len = encode_frame(encoded_reply, reply_buffer, len);
+  Serial.write(encoded_reply, encoded_reply_len);
+}
+
+// COBS encode a payload held FRAME_HEADER bytes into buffer, which has room
+// for the framing around it; in framed mode the length and CRC are added
+size_t encode_frame(uint8_t *dst, uint8_t *buffer, size_t len)
+{
+  if (!framed)
+  {
+    return cobs_encode(dst, buffer + FRAME_HEADER, len);
+  }
+
+  buffer[0] = len & 0xFF;
+  buffer[1] = len >> 8;
+  uint16_t crc = crc16(buffer, len + FRAME_HEADER);
+  buffer[len + FRAME_HEADER] = crc & 0xFF;
+  buffer[len + FRAME_HEADER + 1] = crc >> 8;
+  return cobs_encode(dst, buffer, len + FRAME_OVERHEAD);
+}
+
+// CRC-16/CCITT-FALSE of a byte buffer, a byte at a time from the table
+uint16_t crc16(const uint8_t *data, size_t len)
+{
+  uint16_t crc = 0xFFFF;
+  for (size_t i = 0; i < len; ++i)
+  {
+    crc = (crc << 8) ^ pgm_read_word(&CRC16_TABLE[((crc >> 8) ^ data[i]) & 0xFF]);
+  }
+  return crc;
 }
 
 // COBS encode a byte buffer
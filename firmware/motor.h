@@ -26,6 +26,7 @@ public:
   void stop()
   {
     mode = STOPPED;
+    output = 0;
     write_analog(0);
   }
 
@@ -34,11 +35,12 @@ public:
     switch (mode)
     {
     case ANALOG:
+      output = speed;
       write_analog(speed);
       break;
     case POSITION_PID:
     {
-      double output = pid->calculate((double)get_enc(), (double)setpoint);
+      output = pid->calculate((double)get_enc(), (double)setpoint);
       write_analog((int)output);
       break;
     }
@@ -53,6 +55,17 @@ public:
     setpoint = pos;
   }
 
+  long int get_setpoint()
+  {
+    return setpoint;
+  }
+
+  // last output written to the motor, before clamping
+  double get_output()
+  {
+    return output;
+  }
+
   void set_analog_mode()
   {
     mode = ANALOG;
@@ -98,8 +111,9 @@ public:
   }
 
 private:
-  long int setpoint;
-  int speed;
+  long int setpoint = 0;
+  int speed = 0;
+  double output = 0;
 
   int polarity = 1;
 
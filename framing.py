@@ -0,0 +1,88 @@
+"""Check frames with a length field and a CRC16.
+
+A framed packet is a little-endian 16 bit payload length, the payload,
+then a CRC-16/CCITT of the length and payload, all inside one COBS frame:
+
+    [length lo][length hi][payload ...][crc lo][crc hi]
+
+A length of 0xFFFF with no payload is a NACK, asking the other end to
+send its last frame again.
+
+Jackson Smith
+Final Project
+"""
+
+import binascii
+
+# every frame carries a 2 byte length and a 2 byte CRC
+FRAME_OVERHEAD = 4
+
+# length field of a NACK; payloads are always shorter
+NACK_LENGTH = 0xFFFF
+
+# CRC-16/CCITT-FALSE: polynomial 0x1021, starting from 0xFFFF
+CRC_INIT = 0xFFFF
+
+
+class FrameError(ValueError):
+    """Exception raised when a frame's length or CRC is wrong."""
+    pass
+
+
+def crc16(data, crc=CRC_INIT):
+    """Compute a CRC-16/CCITT-FALSE.
+
+    binascii's table driven version; firmware.ino uses the same table.
+
+    Args:
+        data: Bytes to check.
+        crc: Starting value, to continue an earlier CRC. Default is 0xFFFF.
+
+    Returns:
+        The CRC as an integer.
+    """
+    return binascii.crc_hqx(data, crc)
+
+
+def frame(payload):
+    """Add the length and CRC to a payload.
+
+    Args:
+        payload: Bytes to send, shorter than 0xFFFF.
+
+    Returns:
+        The framed bytes, ready to COBS encode.
+    """
+    if len(payload) >= NACK_LENGTH:
+        raise FrameError(f"Payload of {len(payload)} bytes is too long to frame")
+    body = len(payload).to_bytes(2, "little") + payload
+    return body + crc16(body).to_bytes(2, "little")
+
+
+def unframe(data):
+    """Check a framed packet and take out its payload.
+
+    Args:
+        data: A decoded COBS frame.
+
+    Returns:
+        The payload, or None if the frame is a NACK.
+
+    Raises:
+        FrameError: If the length doesn't match or the CRC is wrong.
+    """
+    if len(data) < FRAME_OVERHEAD:
+        raise FrameError(f"Frame of {len(data)} bytes is too short")
+
+    length = data[0] | data[1] << 8
+    if crc16(data[:-2]) != data[-2] | data[-1] << 8:
+        raise FrameError("Frame CRC doesn't match")
+    if length == NACK_LENGTH and len(data) == FRAME_OVERHEAD:
+        return None
+    if length != len(data) - FRAME_OVERHEAD:
+        raise FrameError(f"Frame says it holds {length} bytes but holds {len(data) - FRAME_OVERHEAD}")
+    return bytes(data[2:-2])
+
+
+# the NACK frame, already framed
+NACK = NACK_LENGTH.to_bytes(2, "little") + crc16(NACK_LENGTH.to_bytes(2, "little")).to_bytes(2, "little")
@@ -7,8 +7,10 @@ Final Project
 import tkinter as tk
 import tkinter.filedialog as filedialog
 from entry_collection import EntryCollection
-from liveplot import LivePlotter
+from sample_channel import SampleChannel
 import json
+import time
+import numpy as np
 
 # Default directory for config files
 SAVE_DIR = r"/home/nvidia/Documents/ArduController/configs"
@@ -65,18 +67,55 @@ properties = [
 # default values (blank for now)
 defaults = {}
 
+# milliseconds between moving samples from the acquisition thread to the plots
+DRAIN_INTERVAL = 50
+
+# milliseconds between refreshes of the link statistics panel
+STATS_INTERVAL = 1000
+
+
+def line_styles(motor_count, first, second):
+    """Pick labels and colors for a pair of plotted lines per motor.
+
+    Args:
+        motor_count: The number of motors.
+        first: Name of each motor's first line, e.g. "Setpoint".
+        second: Name of each motor's second line, e.g. "Encoder".
+
+    Returns:
+        A tuple of (labels, colors): every motor's first line, then every
+        motor's second line.
+    """
+    if motor_count == 1:
+        return [first, second], ["black", "red"]
+
+    # light and dark shades of the same color for each motor
+    # matplotlib is slow to import, so only once the plots are built
+    import matplotlib
+
+    palette = matplotlib.colormaps["tab20"]
+    labels = [f"{first} {i}" for i in range(motor_count)] + [f"{second} {i}" for i in range(motor_count)]
+    colors = [palette(2 * i + 1) for i in range(motor_count)] + [palette(2 * i) for i in range(motor_count)]
+    return labels, colors
+
 
 class GUI(tk.Frame):
     """Primary interface for PID tuning."""
-    def __init__(self, master, motor_count, ard, setpoint_queue, *args, **kwargs):
+    def __init__(self, master, motor_count, ard, setpoint_queue, *args, launched=None, **kwargs):
         """Initialize the GUI class.
 
+        The plots are built once the window is up, so the controls show
+        straight away and the Arduino can connect while matplotlib loads.
+
         Args:
             master: The parent Tkinter window.
             motor_count: The number of motors to be controlled.
-            ard: The ArduController object that communicates with the hardware.
+            ard: The ArduController object that communicates with the hardware,
+                or None until it connects; set self.ard then.
             setpoint_queue: The queue that holds the setpoint values.
             *args, **kwargs: Additional arguments and keyword arguments for tk.Frame.
+            launched: time.perf_counter() when the program started, to time
+                the first sample from. Defaults to now.
         """
         super().__init__(master, *args, **kwargs)
 
@@ -120,25 +159,115 @@ class GUI(tk.Frame):
         self.status = tk.Label(self, text="")
         self.status.grid(column=0, row=2)
 
-        self.plotter = LivePlotter(self, 5, ["Setpoint", "Encoder"], ["black", "red"])
-        self.err_plotter = LivePlotter(self, 5, ["Baseline", "Error"], ["black", "red"])
+        # pending after() callbacks by name, cancelled if the GUI is destroyed
+        self.jobs = {}
+
+        self.plotter = None
+        self.err_plotter = None
+        self.jobs["build_plots"] = self.after_idle(self.build_plots)
+
+        # seconds from launch until the first sample reached the plots
+        self.launched = time.perf_counter() if launched is None else launched
+        self.time_to_first_sample = None
+
+        # samples from the acquisition thread: every setpoint, then every encoder
+        self.channel = SampleChannel(2 * motor_count)
+        self.start = time.time()
+        self.shown_overruns = 0
+        self.overrun_label = tk.Label(self, text="")
+        self.overrun_label.grid(column=1, row=2)
+        self.jobs["drain"] = self.after(DRAIN_INTERVAL, self.drain)
+
+        self.stats_label = tk.Label(self, text="", font="TkFixedFont", justify=tk.LEFT, anchor="nw")
+        self.stats_label.grid(column=1, row=0, padx=15, pady=15, sticky="nw")
+        self.update_stats()
+
+    def build_plots(self):
+        """Build the position and error plots."""
+        from liveplot import LivePlotter
+
+        count = len(self.motors)
+        self.plotter = LivePlotter(self, 5, *line_styles(count, "Setpoint", "Encoder"), fast=True)
+        self.err_plotter = LivePlotter(self, 5, *line_styles(count, "Baseline", "Error"), fast=True)
         self.plotter.grid(column=0, row=3)
         self.err_plotter.grid(column=1, row=3)
 
+    def destroy(self):
+        """Cancel the pending refreshes, then destroy the GUI."""
+        for job in self.jobs.values():
+            self.after_cancel(job)
+        self.jobs.clear()
+        super().destroy()
+
+    def connected(self):
+        """Check the Arduino has connected, saying so in the status line if not."""
+        if self.ard is None:
+            self.status["text"] = "Still connecting to the Arduino."
+            return False
+        return True
+
     def set_motor(self):
-        params = self.get()[0]
-        self.ard.set_motor(params["Analog signal"])
+        if not self.connected():
+            return
+        for i, params in enumerate(self.get()):
+            self.ard.set_motor(params["Analog signal"], i)
 
-    def plot(self, encoder, setpoint):
-        self.plotter.plot((setpoint, encoder))
-        self.err_plotter.plot((0, encoder - setpoint))
-        self.err_plotter.reset_view()
+    def plot(self, encoders, setpoints, timestamp=None):
+        """Plot every motor's encoder count and setpoint.
+
+        Safe to call from any one thread; the plots pick the samples up
+        in batches on the Tk thread.
+
+        Args:
+            encoders: Encoder counts, indexed by motor.
+            setpoints: Setpoints, indexed by motor.
+            timestamp: Seconds since the plots started. Defaults to now.
+        """
+        if timestamp is None:
+            timestamp = time.time() - self.start
+        count = len(self.motors)
+        self.channel.push(timestamp, setpoints[:count], encoders[:count])
+
+    def drain(self):
+        """Move every sample plotted since the last call onto the plots."""
+        if self.plotter is None:
+            # not built yet; the samples wait in the channel
+            self.jobs["drain"] = self.after(DRAIN_INTERVAL, self.drain)
+            return
+
+        times, values = self.channel.swap()
+        if len(times) and self.time_to_first_sample is None:
+            self.time_to_first_sample = time.perf_counter() - self.launched
+            self.status["text"] = f"First sample after {self.time_to_first_sample:.2f} s"
+        if len(times):
+            count = len(self.motors)
+            errors = values[:, count:] - values[:, :count]
+            self.plotter.extend(times, values)
+            self.err_plotter.extend(times, np.hstack((np.zeros_like(errors), errors)))
+            self.err_plotter.reset_view()
+
+        if self.channel.overruns != self.shown_overruns:
+            self.shown_overruns = self.channel.overruns
+            self.overrun_label["text"] = f"Dropped {self.shown_overruns} samples"
+
+        self.jobs["drain"] = self.after(DRAIN_INTERVAL, self.drain)
+
+    def update_stats(self):
+        """Show the serial link's statistics, and schedule the next refresh."""
+        stats = getattr(self.ard, "stats", None)
+        if stats is not None:
+            self.stats_label["text"] = stats.summary()
+        self.jobs["update_stats"] = self.after(STATS_INTERVAL, self.update_stats)
 
     def reset_view(self):
+        if self.plotter is None:
+            return
         self.plotter.reset_view()
         self.err_plotter.reset_view()
 
     def reset_error(self):
+        if self.err_plotter is None:
+            return
         self.err_plotter.reset_view()
 
     def get(self):
@@ -187,19 +316,26 @@ class GUI(tk.Frame):
         file.close()
 
     def send_pid(self):
-        pid_params = self.get()[0]
-        self.ard.set_pid(
-            KP=pid_params["Pos KP"],
-            KI=pid_params["Pos KI"],
-            KD=pid_params["Pos KD"],
-            zero_output=pid_params["Pos cutoff"],
-            min_output=pid_params["Pos min"],
-            max_output=pid_params["Pos max"],
-            I_region=pid_params["Int region"],
-            I_max=pid_params["Int max"],
-        )
+        if not self.connected():
+            return
+        for i, pid_params in enumerate(self.get()):
+            self.ard.set_pid(
+                KP=pid_params["Pos KP"],
+                KI=pid_params["Pos KI"],
+                KD=pid_params["Pos KD"],
+                zero_output=pid_params["Pos cutoff"],
+                min_output=pid_params["Pos min"],
+                max_output=pid_params["Pos max"],
+                I_region=pid_params["Int region"],
+                I_max=pid_params["Int max"],
+                motor=i,
+            )
 
     def update_setpoint(self):
-        params = self.get()[0]
-        self.ard.set_position(params["Target position"])
-        self.setpoint_queue.put(params["Target position"])
+        if not self.connected():
+            return
+        setpoints = []
+        for i, params in enumerate(self.get()):
+            self.ard.set_position(params["Target position"], i)
+            setpoints.append(params["Target position"])
+        self.setpoint_queue.put(setpoints)
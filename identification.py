@@ -0,0 +1,238 @@
+"""Identify a motor model from a recorded run of PWM commands and encoder counts.
+
+Both models have velocity respond to PWM with a first order lag, so the
+position is second order:
+- first order plus dead time (FOPDT): PWM takes effect dead_time late.
+- second order with friction: PWM within the deadband (static friction)
+  doesn't move the motor.
+
+Each is fitted by linear least squares over the whole run at once, scanning
+the dead times and deadbands the samples can tell apart. A fit gives its
+parameters and quality, and plant() turns it into a MotorPlant that the
+simulator or tuning.search() can use as it is.
+
+Example usage:
+    python identification.py session.arlog --motor 0
+
+Jackson Smith
+Final Project
+"""
+
+import argparse
+import math
+from collections import namedtuple
+
+import numpy as np
+
+from recorder import TelemetryLog
+from simulator import MotorPlant
+from tuning import write_analog
+
+# longest dead time (s) fit_fopdt() tries by default
+MAX_DEAD_TIME = 0.05
+
+# widest deadband (PWM) fit_second_order() tries by default
+MAX_DEADBAND = 100
+
+
+class PlantFit(namedtuple("PlantFit", [
+    "model", "gain", "time_constant", "dead_time", "deadband", "r_squared", "rms_error",
+])):
+    """Parameters and quality of a fitted model.
+
+    gain is in counts per second per PWM unit, time_constant and dead_time
+    in seconds and deadband in PWM. r_squared is the fraction of the
+    variation in per-sample motion the model predicts, and rms_error its
+    typical miss in counts per sample.
+    """
+    def plant(self, position=0.0):
+        """Build a MotorPlant that behaves like the fit.
+
+        Args:
+            position: Starting encoder position. Default is 0.
+
+        Returns:
+            A MotorPlant.
+        """
+        return MotorPlant(self.gain, self.time_constant, self.deadband, position, self.dead_time)
+
+
+def resample(time, command, encoder, dt=None):
+    """Put a run on evenly spaced samples.
+
+    Encoder counts are interpolated; commands hold until the next one,
+    like the motor sees them. Evenly spaced runs come back as they were.
+
+    Args:
+        time: Sample times in seconds, increasing.
+        command: Control output at each sample.
+        encoder: Encoder count at each sample.
+        dt: Sample period. Defaults to the median gap between samples.
+
+    Returns:
+        Tuple of (dt, command, encoder) arrays.
+    """
+    time = np.asarray(time, dtype=float)
+    if dt is None:
+        dt = float(np.median(np.diff(time)))
+    grid = time[0] + np.arange(int((time[-1] - time[0]) / dt) + 1) * dt
+
+    # the last sample at or before each point, allowing for rounding in dt
+    held = np.searchsorted(time, grid + dt * 1e-3, "right") - 1
+    return dt, np.asarray(command, dtype=float)[held], np.interp(grid, time, encoder)
+
+
+def fit(time, command, encoder, polarity=-1, max_dead_time=0.0, max_deadband=0, model=None):
+    """Fit a MotorPlant, scanning dead times and deadbands for the best fit.
+
+    Over each sample period the motor's exact response gives the motion
+    in the next period as a linear mix of the motion in this one and the
+    drive in both:
+
+        move[k + 1] = a * move[k] + c1 * drive[k] + c2 * drive[k + 1]
+
+    so each dead time and deadband is one least squares solve over every
+    sample. A deadband only matters at the PWM levels the run used, so
+    those are the deadbands tried.
+
+    Args:
+        time: Sample times in seconds, increasing.
+        command: Control output at each sample, e.g. the set_motor speed.
+        encoder: Encoder count at each sample.
+        polarity: Motor polarity. Default is -1, like the firmware's motor.
+        max_dead_time: Longest dead time to try, in seconds. Default is 0.
+        max_deadband: Widest deadband to try, in PWM. Default is 0.
+        model: Name to give the fit. Default is None.
+
+    Returns:
+        The best PlantFit.
+
+    Raises:
+        ValueError: If the run is too short, or no fit is physical (the
+            motor doesn't move, or doesn't follow the commands).
+    """
+    dt, command, encoder = resample(time, command, encoder)
+    pwm = write_analog(command, polarity)
+    move = np.diff(encoder)
+
+    max_delay = int(round(max_dead_time / dt))
+    if len(move) < max_delay + 7:
+        raise ValueError(f"Run of {len(move) + 1} samples is too short to fit")
+
+    # the same rows for every dead time, so residuals compare
+    y = move[max_delay + 3:]
+    previous = move[max_delay + 2:-1]
+    # each move shares an encoder reading, and so its rounding, with the
+    # next; two moves back shares none with y or previous, so it stands in
+    # for previous without biasing the lag towards zero
+    instrument = move[max_delay:-3]
+    total = float(np.sum((y - y.mean()) ** 2))
+    levels = np.unique(np.abs(pwm))
+    deadbands = np.concatenate(([0.0], levels[(levels > 0) & (levels <= max_deadband)]))
+
+    best = None
+    for deadband in deadbands:
+        drive = np.where(np.abs(pwm) <= deadband, 0.0, pwm)
+        for delay in range(max_delay + 1):
+            start = max_delay + 2 - delay
+            inputs = (drive[start:start + len(y)], drive[start + 1:start + 1 + len(y)])
+            X = np.column_stack((previous,) + inputs)
+            Z = np.column_stack((instrument,) + inputs)
+            try:
+                a, c1, c2 = np.linalg.solve(Z.T @ X, Z.T @ y)
+            except np.linalg.LinAlgError:
+                continue
+            if not 0 < a < 1:
+                continue
+            error = float(np.sum((X @ (a, c1, c2) - y) ** 2))
+            if best is None or error < best[0]:
+                best = (error, a, c1 + c2, delay, deadband)
+
+    if best is None:
+        raise ValueError("No physical fit: the motor doesn't follow the commands")
+
+    error, a, c, delay, deadband = best
+    return PlantFit(
+        model=model,
+        gain=float(c / (dt * (1 - a))),
+        time_constant=float(-dt / math.log(a)),
+        dead_time=delay * dt,
+        deadband=float(deadband),
+        r_squared=1 - error / total if total else 0.0,
+        rms_error=math.sqrt(error / len(y)),
+    )
+
+
+def fit_fopdt(time, command, encoder, polarity=-1, max_dead_time=MAX_DEAD_TIME):
+    """Fit a first order plus dead time model.
+
+    Args:
+        time: Sample times in seconds, increasing.
+        command: Control output at each sample, e.g. the set_motor speed.
+        encoder: Encoder count at each sample.
+        polarity: Motor polarity. Default is -1, like the firmware's motor.
+        max_dead_time: Longest dead time to try, in seconds. Default is MAX_DEAD_TIME.
+
+    Returns:
+        A PlantFit with no deadband.
+    """
+    return fit(time, command, encoder, polarity, max_dead_time=max_dead_time, model="fopdt")
+
+
+def fit_second_order(time, command, encoder, polarity=-1, max_deadband=MAX_DEADBAND):
+    """Fit a second order model with static friction.
+
+    Args:
+        time: Sample times in seconds, increasing.
+        command: Control output at each sample, e.g. the set_motor speed.
+        encoder: Encoder count at each sample.
+        polarity: Motor polarity. Default is -1, like the firmware's motor.
+        max_deadband: Widest deadband to try, in PWM. Default is MAX_DEADBAND.
+
+    Returns:
+        A PlantFit with no dead time.
+    """
+    return fit(time, command, encoder, polarity, max_deadband=max_deadband, model="second_order")
+
+
+def from_log(log, motor=0, start=None, end=None):
+    """Pull one motor's run out of a telemetry log.
+
+    Args:
+        log: A TelemetryLog.
+        motor: Motor index. Default is 0.
+        start: First time to include. Defaults to the start of the log.
+        end: Time to stop before. Defaults to the end of the log.
+
+    Returns:
+        Tuple of (time, command, encoder) arrays.
+
+    Raises:
+        ValueError: If the log didn't record control outputs.
+    """
+    records = log.between(start, end)
+    command = records["command"][:, motor]
+    if np.isnan(command).all():
+        raise ValueError(f"{log.path} has no control outputs to fit; record telemetry instead of polling")
+    return records["time"], command, records["encoder"][:, motor]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit motor models to a recorded run.")
+    parser.add_argument("path", help="telemetry log written by TelemetryRecorder")
+    parser.add_argument("--motor", type=int, default=0, help="motor to fit")
+    parser.add_argument("--start", type=float, help="first time to fit")
+    parser.add_argument("--end", type=float, help="time to stop fitting before")
+    args = parser.parse_args()
+
+    run = from_log(TelemetryLog(args.path), args.motor, args.start, args.end)
+    for result in (fit_fopdt(*run), fit_second_order(*run)):
+        print(
+            f"{result.model:13s} gain {result.gain:8.3f}   time constant {result.time_constant * 1000:6.1f} ms"
+            f"   dead time {result.dead_time * 1000:5.1f} ms   deadband {result.deadband:5.1f}"
+            f"   R^2 {result.r_squared:.4f}   rms {result.rms_error:.2f} counts"
+        )
+
+
+if __name__ == "__main__":
+    main()
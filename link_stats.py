@@ -0,0 +1,297 @@
+"""Count traffic on a serial link and time its transactions.
+
+Jackson Smith
+Final Project
+"""
+
+import math
+import time
+from math import frexp
+
+# buckets per power of two; each bucket is at most 1/16 wide
+SUB_BUCKETS = 16
+# powers of two covered, from 1 us up to about 70 minutes
+OCTAVES = 32
+# bucket 0 holds everything under 1 us, the last anything too long
+BUCKETS = OCTAVES * SUB_BUCKETS + 2
+
+
+class LatencyHistogram:
+    """Histogram of durations in logarithmic buckets.
+
+    Like an HDR histogram, every power of two of microseconds is split
+    into equal sub-buckets, so any duration is kept to within about 6%
+    in a fixed, small table. Recording is a few arithmetic operations and
+    a list increment.
+    """
+    def __init__(self):
+        """Initialize an empty LatencyHistogram."""
+        self.counts = [0] * BUCKETS
+        self.reset()
+
+    def reset(self):
+        """Forget every recorded duration."""
+        for i in range(len(self.counts)):
+            self.counts[i] = 0
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def record(self, seconds):
+        """Add a duration.
+
+        Args:
+            seconds: The duration in seconds.
+        """
+        us = seconds * 1e6
+        if us < 1:
+            index = 0
+            if us < self.min:
+                self.min = us
+        else:
+            # us is mantissa * 2 ** exponent with mantissa in [0.5, 1)
+            mantissa, exponent = frexp(us)
+            index = (exponent - 2) * SUB_BUCKETS + 1 + int(mantissa * (2 * SUB_BUCKETS))
+            if index >= BUCKETS:
+                index = BUCKETS - 1
+            if us > self.max:
+                self.max = us
+            if us < self.min:
+                self.min = us
+        self.counts[index] += 1
+        self.count += 1
+        self.total += us
+
+    @staticmethod
+    def upper_bound(index):
+        """Largest duration in microseconds a bucket holds."""
+        if index == 0:
+            return 1.0
+        octave, sub = divmod(index - 1, SUB_BUCKETS)
+        return 2.0 ** octave * (1 + (sub + 1) / SUB_BUCKETS)
+
+    def percentile(self, percent):
+        """Estimate a percentile.
+
+        Args:
+            percent: Percentile between 0 and 100.
+
+        Returns:
+            The duration in microseconds, or 0 if nothing was recorded.
+        """
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(self.count * percent / 100))
+        seen = 0
+        # the last bucket has no upper bound, so the max stands in for it
+        for index, count in enumerate(self.counts[:-1]):
+            seen += count
+            if seen >= rank:
+                return min(max(self.upper_bound(index), self.min), self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        """Mean duration in microseconds, or 0 if nothing was recorded."""
+        return self.total / self.count if self.count else 0.0
+
+    def summary(self):
+        """Summarize the recorded durations.
+
+        Returns:
+            Dictionary with the count, and the mean, median, 90th and 99th
+            percentile and longest duration in microseconds.
+        """
+        return {
+            "count": self.count,
+            "mean_us": self.mean,
+            "p50_us": self.percentile(50),
+            "p90_us": self.percentile(90),
+            "p99_us": self.percentile(99),
+            "max_us": self.max,
+        }
+
+
+class LinkStats:
+    """Traffic counters and latency histograms for one serial link.
+
+    Each counter is only updated from one thread at a time (the one
+    holding the serial lock, or the engine's reader or writer thread), so
+    no extra locking is needed.
+
+    Example usage:
+        ard = ArduController(port)
+        ard.request_encoder()
+        print(ard.stats.snapshot()["latency"]["REQUEST_ENCODER"]["p99_us"])
+    """
+    def __init__(self, names=None):
+        """
+        Initialize a LinkStats.
+
+        Args:
+            names: Optional dictionary of command ID to name, used to label
+                latency histograms.
+        """
+        self.names = {} if names is None else names
+        self.latency = {}
+        self.lock_wait = LatencyHistogram()
+        # command and start time of the transaction waiting for a reply
+        self.pending = None
+        self.reset()
+
+    def reset(self):
+        """Zero every counter and histogram."""
+        for histogram in self.latency.values():
+            histogram.reset()
+        self.lock_wait.reset()
+
+        self.frames_out = 0
+        self.bytes_out = 0
+        self.frames_in = 0
+        self.bytes_in = 0
+        self.timeouts = 0
+        self.decode_failures = 0
+        self.lock_timeouts = 0
+        # framed mode: frames failing their length or CRC check, and recovery
+        self.bad_frames = 0
+        self.nacks_sent = 0
+        self.nacks_received = 0
+        self.retransmits = 0
+        # times the port was lost and opened again
+        self.reconnects = 0
+        # settings not sent: already on the Arduino, or replaced by a newer
+        # value before their turn
+        self.skipped_writes = 0
+        self.coalesced_writes = 0
+
+    def record_latency(self, command, seconds):
+        """Add a round trip time to a command's histogram.
+
+        Args:
+            command: Command ID.
+            seconds: Round trip time in seconds.
+        """
+        histogram = self.latency.get(command)
+        if histogram is None:
+            histogram = self.latency[command] = LatencyHistogram()
+        histogram.record(seconds)
+
+    def begin(self, command):
+        """Note that a command was just sent, in case a reply follows."""
+        self.pending = (command, time.perf_counter())
+
+    def end(self, arrived=True):
+        """Time the reply to the last command begun, or count its timeout.
+
+        Args:
+            arrived: Whether a whole reply arrived in time.
+        """
+        if not arrived:
+            self.pending = None
+            self.timeouts += 1
+        elif self.pending is not None:
+            command, start = self.pending
+            self.pending = None
+            self.record_latency(command, time.perf_counter() - start)
+
+    def timer(self, command):
+        """Make a Future callback timing a command from now until it resolves.
+
+        Args:
+            command: Command ID.
+
+        Returns:
+            Function to pass to Future.add_done_callback. Cancelled and
+            failed requests aren't timed.
+        """
+        start = time.perf_counter()
+
+        def done(future):
+            if not future.cancelled() and future.exception() is None:
+                self.record_latency(command, time.perf_counter() - start)
+
+        return done
+
+    def name(self, command):
+        """Name of a command ID."""
+        return self.names.get(command, str(command))
+
+    def snapshot(self):
+        """Copy out every counter and histogram summary.
+
+        Returns:
+            Dictionary of counter name to value, plus "lock_wait" and
+            "latency" summaries. "latency" maps each command's name to
+            its histogram summary.
+        """
+        return {
+            "frames_out": self.frames_out,
+            "bytes_out": self.bytes_out,
+            "frames_in": self.frames_in,
+            "bytes_in": self.bytes_in,
+            "timeouts": self.timeouts,
+            "decode_failures": self.decode_failures,
+            "lock_timeouts": self.lock_timeouts,
+            "bad_frames": self.bad_frames,
+            "nacks_sent": self.nacks_sent,
+            "nacks_received": self.nacks_received,
+            "retransmits": self.retransmits,
+            "reconnects": self.reconnects,
+            "skipped_writes": self.skipped_writes,
+            "coalesced_writes": self.coalesced_writes,
+            "lock_wait": self.lock_wait.summary(),
+            "latency": {
+                self.name(command): histogram.summary()
+                for command, histogram in sorted(self.latency.items())
+                if histogram.count
+            },
+        }
+
+    def summary(self):
+        """Describe the link in a few short lines, for a status display.
+
+        Returns:
+            The description as a string.
+        """
+        lines = [
+            f"out {self.frames_out} frames {format_bytes(self.bytes_out)}"
+            f"   in {self.frames_in} frames {format_bytes(self.bytes_in)}",
+            f"timeouts {self.timeouts}   decode errors {self.decode_failures}"
+            f"   lock wait p99 {format_us(self.lock_wait.percentile(99))}",
+        ]
+        if self.bad_frames or self.nacks_received or self.retransmits:
+            lines.append(
+                f"bad frames {self.bad_frames}   nacks in {self.nacks_received}"
+                f"   retransmits {self.retransmits}"
+            )
+        if self.reconnects:
+            lines.append(f"reconnects {self.reconnects}")
+        if self.skipped_writes or self.coalesced_writes:
+            lines.append(f"writes skipped {self.skipped_writes}   coalesced {self.coalesced_writes}")
+        for command, histogram in sorted(self.latency.items()):
+            if histogram.count:
+                lines.append(
+                    f"{self.name(command).lower():<24} n={histogram.count:<8}"
+                    f" p50 {format_us(histogram.percentile(50)):>8}"
+                    f"  p99 {format_us(histogram.percentile(99)):>8}"
+                )
+        return "\n".join(lines)
+
+
+def format_us(us):
+    """Format microseconds with a sensible unit."""
+    if us < 1000:
+        return f"{us:.0f} us"
+    if us < 1e6:
+        return f"{us / 1000:.1f} ms"
+    return f"{us / 1e6:.2f} s"
+
+
+def format_bytes(count):
+    """Format a byte count with a sensible unit."""
+    if count < 1024:
+        return f"{count} B"
+    if count < 1024 ** 2:
+        return f"{count / 1024:.1f} kB"
+    return f"{count / 1024 ** 2:.1f} MB"
@@ -4,6 +4,7 @@ Jackson Smith
 Final Project
 """
 
+import math
 import time
 import queue
 import matplotlib.pyplot as plt
@@ -11,6 +12,8 @@ import matplotlib.animation as animation
 from tkinter import *
 from tkinter import ttk
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from decimation import minmax_decimate
+from ring_buffer import TimeRingBuffer, WindowedExtrema
 
 
 class LivePlotter(ttk.Frame):
@@ -23,6 +26,7 @@ class LivePlotter(ttk.Frame):
         colors,
         update_interval=50,
         line_width=2,
+        fast=False,
         **kwargs
     ):
         """Initialize a LivePlotter object.
@@ -34,6 +38,9 @@ class LivePlotter(ttk.Frame):
             colors (list of str): A list of colors for the different lines in the plot.
             update_interval (int): The interval (in milliseconds) between updates to the plot.
             line_width (int): The line width for the plotted lines.
+            fast (bool): Blit only the lines over a cached background, scroll in
+                steps so the full figure is only redrawn when the ticks change,
+                and thin lines to two points per pixel column.
             **kwargs: Additional keyword arguments for the Tkinter Frame constructor.
 
         Raises:
@@ -44,11 +51,15 @@ class LivePlotter(ttk.Frame):
 
         self.time_scale = time_scale
         self.update_interval = update_interval
+        self.fast = fast
+        # in fast mode the x axis scrolls in jumps of this many seconds
+        self.scroll_step = time_scale / 10
 
         # Set up Matplotlib
         self.fig, self.ax = plt.subplots()
-        self.x_data = []
-        self.y_data = [[] for _ in colors]
+        # visible history, and the extremes of every line within it
+        self.history = TimeRingBuffer(len(colors))
+        self.extrema = WindowedExtrema()
 
         self.lines = []
         for label, color in zip(labels, colors):
@@ -66,7 +77,7 @@ class LivePlotter(ttk.Frame):
             self.fig,
             self.update_plot,
             init_func=self.init,
-            blit=False,
+            blit=fast,
             interval=self.update_interval,
             cache_frame_data=False,
         )
@@ -80,14 +91,33 @@ class LivePlotter(ttk.Frame):
         self.min_y = float("inf")
         self.max_y = float("-inf")
 
-    def plot(self, data_points):
+    def plot(self, data_points, timestamp=None):
         """Adds new data points to the plot.
 
         Args:
             data_points (list of float): A list of y-values to be plotted.
+            timestamp (float): Seconds since the plotter started, e.g. when
+                replaying recorded data. Must not go backwards. Defaults to now.
         """
-        current_time = time.time() - self.start
-        self.value_queue.put((current_time, data_points))
+        if timestamp is None:
+            timestamp = time.time() - self.start
+        self.value_queue.put((timestamp, data_points))
+
+    def extend(self, times, values):
+        """Adds a batch of data points at once. Call from the Tk thread.
+
+        Args:
+            times (array): Seconds since the plotter started, one per row.
+                Must not go backwards.
+            values (array): One row of y-values per time.
+        """
+        if len(times) == 0:
+            return
+        lows = values.min(axis=1)
+        highs = values.max(axis=1)
+        for i, (low, high) in enumerate(zip(lows.tolist(), highs.tolist())):
+            self.extrema.push(self.history.end + i, low, high)
+        self.history.extend(times, values)
 
     def init(self):
         """Initializes the plot for the first frame.
@@ -112,41 +142,77 @@ class LivePlotter(ttk.Frame):
         """
         while not self.value_queue.empty():
             x, y_points = self.value_queue.get()
-            self.x_data.append(x)
-            for i, y in enumerate(y_points):
-                self.y_data[i].append(y)
+            self.extrema.push(self.history.end, min(y_points), max(y_points))
+            self.history.append(x, y_points)
 
-        if len(self.x_data) == 0:
-            return
+        if len(self.history) == 0:
+            return self.lines
 
-        while max(self.x_data) - min(self.x_data) > self.time_scale:
-            self.x_data.pop(0)
-            for y_list in self.y_data:
-                y_list.pop(0)
+        # drop points that have scrolled out of the window
+        newest = self.history.newest_time
+        self.history.evict_before(newest - self.time_scale)
+        self.extrema.evict_before(self.history.start)
 
-        xmax = max(self.time_scale, max(self.x_data))
+        xmax = max(self.time_scale, newest)
+        if self.fast:
+            xmax = math.ceil(xmax / self.scroll_step) * self.scroll_step
 
-        self.ax.set_xlim(xmax - self.time_scale, xmax)
+        xlim = (xmax - self.time_scale, xmax)
+        limits_changed = xlim != self.ax.get_xlim()
+        if limits_changed:
+            self.ax.set_xlim(*xlim)
 
         # Dynamically adjust y-axis limits based on all lines' data
-        all_y_data = [y for y_list in self.y_data for y in y_list]
-
-        if all_y_data:
-            min_y = min(all_y_data)
-            max_y = max(all_y_data)
+        min_y = self.extrema.min
+        max_y = self.extrema.max
+
+        if min_y < self.min_y:
+            self.min_y = min_y
+        if max_y > self.max_y:
+            self.max_y = max_y
+
+        gap = max(1, 0.1 * abs(self.max_y - self.min_y))
+        if self.fast:
+            limits_changed |= self.fit_ylim(self.min_y - gap, self.max_y + gap)
+        else:
+            self.ax.set_ylim(self.min_y - gap, self.max_y + gap)
 
-            if min_y < self.min_y:
-                self.min_y = min_y
-            if max_y > self.max_y:
-                self.max_y = max_y
+        times = self.history.times
+        ys = [self.history.column(i) for i in range(len(self.lines))]
+        if self.fast:
+            times, ys = minmax_decimate(times, ys, xlim[0], xlim[1], self.ax.bbox.width)
 
-            gap = max(1, 0.1 * abs(self.max_y - self.min_y))
-            self.ax.set_ylim(self.min_y - gap, self.max_y + gap)
+        for line, y in zip(self.lines, ys):
+            line.set_data(times, y)
 
-        for line, y_list in zip(self.lines, self.y_data):
-            line.set_data(self.x_data, y_list)
+        if self.fast and limits_changed:
+            # redraw axes and ticks; the animation then caches the new background
+            self.canvas.draw()
         return self.lines
 
+    def fit_ylim(self, low, high):
+        """Fit the y limits around a range, changing them as rarely as possible.
+
+        The limits only grow when the range doesn't fit and only shrink when
+        they are more than twice as wide as it. New limits get some headroom
+        so a slowly growing range doesn't change them every frame.
+
+        Args:
+            low: Lowest value that must be visible.
+            high: Highest value that must be visible.
+
+        Returns:
+            True if the limits changed.
+        """
+        current_low, current_high = self.ax.get_ylim()
+        span = high - low
+        if current_low <= low and high <= current_high and current_high - current_low <= 2 * span:
+            return False
+
+        margin = 0.25 * span
+        self.ax.set_ylim(low - margin, high + margin)
+        return True
+
     def reset_view(self):
         """Resets the view of the plot to its initial state.
 
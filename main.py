@@ -8,62 +8,186 @@ import tkinter as tk
 from gui import GUI
 
 import threading
-import time
 import queue
+import time
+from concurrent.futures import Future, TimeoutError
+
+import serial
 
 from arducontroller import ArduController
+from recorder import TelemetryRecorder
+from scheduler import RateScheduler
+
+# stream samples from the Arduino instead of polling for them
+USE_TELEMETRY = True
+TELEMETRY_RATE = 200  # samples per second
+
+# samples per second when polling instead
+POLL_RATE = 200
+
+# fastest baud rate to switch the link to once connected, or None to stay at 115200
+MAX_BAUD = None
+
+# axes to lay the window out with while connecting; it's rebuilt for the
+# MOTOR_COUNT the Arduino reports if that's different
+MOTOR_COUNT = 1
 
+# log every sample to this file (replay it with recorder.py), or None
+RECORD_PATH = None
 
-def plot_encoders(ard, gui, setpoint_queue):
+# milliseconds between checks on the connection while it's being made
+CONNECT_POLL_INTERVAL = 20
+
+
+def plot_encoders(ard, gui, setpoint_queue, recorder=None, scheduler=None):
     """Continuously plots the encoder values and setpoints.
 
     Args:
         ard (ArduController): The Arduino controller object to retrieve encoder values from.
         gui (GUI): The GUI object to plot the encoder values and setpoints on.
-        setpoint_queue (Queue): A queue object to receive setpoints from other parts of the program.
+        setpoint_queue (Queue): A queue object to receive lists of setpoints, one per motor,
+            from other parts of the program.
+        recorder (TelemetryRecorder): Optional recorder to log every sample to.
+        scheduler (RateScheduler): Paces the polls. Defaults to POLL_RATE samples per second.
     """
-    setpoint = 0
+    if scheduler is None:
+        scheduler = RateScheduler(POLL_RATE)
+
+    setpoints = [0] * len(gui.motors)
     while True:
+        deadline = scheduler.wait()
+
         while not setpoint_queue.empty():
-            setpoint = setpoint_queue.get()
+            setpoints = setpoint_queue.get()
 
         if ard.closed:
             break
 
-        enc = ard.request_encoder()[0]
-        gui.plot(enc, setpoint)
+        # every axis in one round trip
+        try:
+            encoders = ard.request_encoders()
+        except TimeoutError:
+            # no sample this time; the link stats count the timeout
+            continue
+        if encoders is None:
+            # closed mid-transaction
+            break
+        gui.plot(encoders, setpoints)
+        if recorder is not None:
+            # the deadline, so recorded samples are evenly spaced
+            recorder.record(deadline, encoders, setpoints)
+
 
-        time.sleep(0.005)  # 5 ms delay to avoid loading too many datapoints
+def plot_telemetry(ard, gui, rate=TELEMETRY_RATE, recorder=None):
+    """Plots streamed encoder values and setpoints.
 
+    Needs the ArduController in pipelined mode. Setpoints come from the
+    Arduino itself, so no setpoint queue is needed.
 
-def on_closing(root, ard):
-    """Close GUI and arduino connection."""
-    ard.wait_for_unlock()
-    ard.close()
+    Args:
+        ard (ArduController): The Arduino controller object to stream from.
+        gui (GUI): The GUI object to plot the encoder values and setpoints on.
+        rate (float): Samples per second to ask for.
+        recorder (TelemetryRecorder): Optional recorder to log every sample to.
+    """
+    for sample in ard.telemetry(rate):
+        gui.plot(sample.encoder, sample.setpoint)
+        if recorder is not None:
+            recorder.record(sample.time, sample.encoder, sample.setpoint, sample.output)
+
+
+def on_closing(root, ard, plot_thread=None, recorder=None):
+    """Close GUI and arduino connection, and finish any recording."""
+    if ard is not None:
+        ard.wait_for_unlock()
+        ard.close()
+    if recorder is not None:
+        # let the plotting thread notice the port closed before the last write
+        if plot_thread is not None:
+            plot_thread.join(timeout=1)
+        recorder.close()
     root.destroy()
     root.quit()
 
 
+def connect():
+    """Connect to the Arduino on a background thread.
+
+    Returns:
+        Future resolving to the ArduController.
+    """
+    future = Future()
+
+    def run():
+        try:
+            future.set_result(ArduController(pipelined=USE_TELEMETRY, max_baud=MAX_BAUD))
+        except (serial.SerialException, OSError, ConnectionError) as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, daemon=True).start()
+    return future
+
+
 def main():
-    ard = ArduController()
+    launched = time.perf_counter()
+    # the handshake runs while the window and plots are built
+    connecting = connect()
 
     setpoint_queue = queue.Queue()
 
     root = tk.Tk()
     root.title("ArduController")
 
-    gui = GUI(root, 1, ard, setpoint_queue)
-
-    gui.grid(row=0, column=0)
-
-    t1 = threading.Thread(
-        target=plot_encoders, args=(ard, gui, setpoint_queue), daemon=True
+    def build_gui(motor_count):
+        gui = GUI(root, motor_count, None, setpoint_queue, launched=launched)
+        gui.grid(row=0, column=0)
+        return gui
+
+    # the rest is filled in once connected
+    session = {"gui": build_gui(MOTOR_COUNT)}
+
+    def start_plotting():
+        if not connecting.done():
+            root.after(CONNECT_POLL_INTERVAL, start_plotting)
+            return
+        gui = session["gui"]
+        try:
+            ard = connecting.result()
+        except (serial.SerialException, OSError, ConnectionError) as e:
+            gui.status["text"] = f"Couldn't connect to the Arduino: {e}"
+            return
+
+        # firmware without HELLO doesn't report its motor count
+        motor_count = ard.motor_count or MOTOR_COUNT
+        if motor_count != len(gui.motors):
+            gui.destroy()
+            gui = session["gui"] = build_gui(motor_count)
+        gui.ard = ard
+
+        recorder = TelemetryRecorder(RECORD_PATH, motor_count) if RECORD_PATH else None
+
+        if USE_TELEMETRY:
+            t1 = threading.Thread(
+                target=plot_telemetry, args=(ard, gui), kwargs={"recorder": recorder}, daemon=True
+            )
+        else:
+            t1 = threading.Thread(
+                target=plot_encoders, args=(ard, gui, setpoint_queue, recorder), daemon=True
+            )
+        t1.start()
+        session["ard"] = ard
+        session["thread"] = t1
+        session["recorder"] = recorder
+
+    start_plotting()
+
+    root.protocol(
+        "WM_DELETE_WINDOW",
+        lambda: on_closing(root, session.get("ard"), session.get("thread"), session.get("recorder")),
     )
-    t1.start()
-
-    root.protocol("WM_DELETE_WINDOW", lambda: on_closing(root, ard))
 
     root.mainloop()
 
 
-main()
+if __name__ == "__main__":
+    main()
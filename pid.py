@@ -0,0 +1,108 @@
+"""A Python copy of the firmware's PID controller (firmware/pid.h).
+
+Jackson Smith
+Final Project
+"""
+
+import math
+import time
+
+
+class PID:
+    """Implements a simple PID Controller, exactly like pid.h.
+
+    Times are in milliseconds, as on the Arduino.
+    """
+    def __init__(self, KP, KI, KD, zero_output, min_output, max_output, I_region, I_max,
+                 clock=None):
+        """
+        Initialize a PID controller.
+
+        Args:
+            KP: Proportional gain.
+            KI: Integral gain.
+            KD: Derivative gain.
+            zero_output: Outputs smaller than this are zeroed.
+            min_output: Outputs smaller than this are pushed up.
+            max_output: Output magnitude limit.
+            I_region: Only integrate when the error is smaller than this.
+            I_max: Integrator magnitude limit.
+            clock: Function returning the time in milliseconds. Defaults to
+                the wall clock, like micros() / 1000.0 on the Arduino.
+        """
+        self.KP, self.KI, self.KD = KP, KI, KD
+        self.zero_output, self.min_output, self.max_output = zero_output, min_output, max_output
+        self.I_region, self.I_max = I_region, I_max
+
+        self.clock = clock or (lambda: time.perf_counter() * 1000.0)
+
+        self.prev_time = self.clock()
+        self.prev_measurement = 0.0
+        self.integrator = 0.0
+
+    def set_params(self, KP, KI, KD, zero_output, min_output, max_output, I_region, I_max):
+        """Update the gains and limits, keeping the controller's state (like SET_PID)."""
+        self.KP, self.KI, self.KD = KP, KI, KD
+        self.zero_output, self.min_output, self.max_output = zero_output, min_output, max_output
+        self.I_region, self.I_max = I_region, I_max
+
+    def calculate(self, measurement, setpoint):
+        """Calculate the controller output.
+
+        Args:
+            measurement: Current encoder count.
+            setpoint: Target encoder count.
+
+        Returns:
+            The controller output.
+        """
+        current_time = self.clock()
+        dt = current_time - self.prev_time
+        self.prev_time = current_time
+
+        change = measurement - self.prev_measurement
+        if dt:
+            deriv = change / dt
+        else:
+            # IEEE division by zero, like the Arduino
+            deriv = math.copysign(math.inf, change) if change else math.nan
+
+        self.prev_measurement = measurement
+
+        error = measurement - setpoint
+        # integrate if within region
+        if abs(error) < self.I_region:
+            self.integrator += error * self.KI * dt
+
+            # make sure integrator stays within bounds
+            if abs(self.integrator) > self.I_max:
+                self.integrator *= self.I_max / abs(self.integrator)
+
+        output = self.KP * error + self.integrator + self.KD * deriv
+
+        if abs(output) > self.max_output:
+            output *= self.max_output / abs(output)
+
+        if abs(output) < self.zero_output:
+            output = 0.0
+        elif abs(output) < self.min_output:
+            # pid.h scales up to max_output here, not min_output; a zero
+            # output scales by infinity, which gives NaN on the Arduino
+            output = output * (self.max_output / abs(output)) if output else math.nan
+
+        return output
+
+
+def write_analog(output, polarity=-1):
+    """Convert a controller output to the PWM the motor sees, like Motor::write_analog.
+
+    Args:
+        output: Controller output (truncated to an int, like the firmware's cast).
+        polarity: Motor polarity. The firmware's motor uses -1.
+
+    Returns:
+        Signed PWM between -255 and 255.
+    """
+    if math.isnan(output):
+        output = 0
+    return max(min(int(output), 255), -255) * polarity
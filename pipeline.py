@@ -0,0 +1,128 @@
+"""Match sequenced replies to outstanding requests.
+
+Jackson Smith
+Final Project
+"""
+
+import threading
+
+from byte_packing import unpack_values
+
+# set on the command byte of a sequenced frame; the next byte is the sequence ID
+SEQUENCED = 0x80
+
+# sequence IDs are 7 bits so reply headers never have the high bit set
+SEQUENCE_IDS = 0x80
+
+# set on the first byte of frames the Arduino sends without a request
+STREAM = 0x80
+
+
+class PipelineFullError(Exception):
+    """Exception raised when every sequence ID is already in flight."""
+    pass
+
+
+class RequestTable:
+    """Track outstanding sequenced requests by ID.
+
+    Each request is a future (concurrent.futures or asyncio) and the
+    pattern or function its reply is decoded with. Replies can arrive in any order.
+    """
+    def __init__(self):
+        """Initialize an empty RequestTable."""
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.next_id = 0
+        self.stray_replies = 0
+
+    def add(self, future, pattern=""):
+        """Allocate a sequence ID for a request.
+
+        IDs are handed out round robin, so a late reply to a cancelled
+        request is unlikely to be mistaken for a newer one.
+
+        Args:
+            future: Future to complete when the reply arrives.
+            pattern: Pattern to unpack the reply with, or a function taking
+                the raw reply bytes and returning the result. None passes the
+                raw reply bytes through instead.
+
+        Returns:
+            The sequence ID.
+
+        Raises:
+            PipelineFullError: If all sequence IDs are in use.
+        """
+        with self.lock:
+            if len(self.pending) >= SEQUENCE_IDS:
+                raise PipelineFullError(f"{SEQUENCE_IDS} requests already in flight")
+
+            while self.next_id in self.pending:
+                self.next_id = (self.next_id + 1) % SEQUENCE_IDS
+            seq = self.next_id
+            self.next_id = (self.next_id + 1) % SEQUENCE_IDS
+
+            self.pending[seq] = (future, pattern)
+            return seq
+
+    def discard(self, seq):
+        """Forget a request, e.g. one that was cancelled or timed out.
+
+        Args:
+            seq: The request's sequence ID.
+        """
+        with self.lock:
+            self.pending.pop(seq, None)
+
+    def resolve(self, frame):
+        """Complete the request a reply frame belongs to.
+
+        Args:
+            frame: Decoded reply: the sequence ID followed by the reply data.
+
+        Returns:
+            True if the reply matched an outstanding request.
+        """
+        with self.lock:
+            entry = self.pending.pop(frame[0], None)
+
+        if entry is None:
+            self.stray_replies += 1
+            return False
+
+        future, pattern = entry
+        if future.done():
+            return True
+
+        if pattern is None:
+            future.set_result(bytes(frame[1:]))
+            return True
+
+        try:
+            if callable(pattern):
+                results = pattern(bytes(frame[1:]))
+            else:
+                results, _ = unpack_values(frame[1:], pattern)
+        except Exception as e:
+            future.set_exception(e)
+        else:
+            future.set_result(results)
+        return True
+
+    def fail_all(self, exc):
+        """Fail every outstanding request, e.g. when the port closes.
+
+        Args:
+            exc: Exception to set on each future.
+        """
+        with self.lock:
+            entries = list(self.pending.values())
+            self.pending.clear()
+
+        for future, _ in entries:
+            if not future.done():
+                future.set_exception(exc)
+
+    def __len__(self):
+        return len(self.pending)
@@ -0,0 +1,339 @@
+"""Record telemetry to a binary log and replay it.
+
+A log is a small header followed by fixed size records, written a chunk
+at a time. A sidecar index file holds the time of the first record of
+every chunk, so a time range can be found without reading the records.
+
+Example usage:
+    python recorder.py session.arlog --speed 4
+
+Jackson Smith
+Final Project
+"""
+
+import argparse
+import os
+import threading
+import time
+
+import numpy as np
+
+LOG_MAGIC = b"ARDUCLOG"
+LOG_VERSION = 1
+
+HEADER_DTYPE = np.dtype([
+    ("magic", "S8"),
+    ("version", "<u2"),
+    ("motor_count", "<u2"),
+    ("chunk_records", "<u4"),
+])
+
+# one entry per chunk: number and time of its first record
+INDEX_DTYPE = np.dtype([("record", "<u8"), ("time", "<f8")])
+
+# records written per chunk, and so per index entry
+CHUNK_RECORDS = 4096
+
+
+def record_dtype(motor_count):
+    """Build the record layout for a number of motors.
+
+    Args:
+        motor_count: Number of motors per record.
+
+    Returns:
+        Structured dtype with a time in seconds, then the encoder count,
+        setpoint, error and control output of every motor.
+    """
+    return np.dtype([
+        ("time", "<f8"),
+        ("encoder", "<i4", (motor_count,)),
+        ("setpoint", "<i4", (motor_count,)),
+        ("error", "<i4", (motor_count,)),
+        ("command", "<f4", (motor_count,)),
+    ])
+
+
+def index_path(path):
+    """Path of a log's sidecar time index."""
+    return path + ".idx"
+
+
+class TelemetryRecorder:
+    """Append telemetry samples to a binary log.
+
+    Samples are buffered and written a chunk at a time, so recording at
+    full rate costs one write every few thousand samples.
+    """
+    def __init__(self, path, motor_count=1, chunk_records=CHUNK_RECORDS):
+        """
+        Initialize a TelemetryRecorder, replacing any log at the path.
+
+        Args:
+            path: File to write.
+            motor_count: Number of motors per sample. Default is 1.
+            chunk_records: Samples buffered per write. Default is 4096.
+        """
+        self.path = path
+        self.motor_count = motor_count
+        self.dtype = record_dtype(motor_count)
+
+        self.file = open(path, "wb")
+        self.index_file = open(index_path(path), "wb")
+
+        header = np.zeros(1, dtype=HEADER_DTYPE)
+        header[0] = (LOG_MAGIC, LOG_VERSION, motor_count, chunk_records)
+        self.file.write(header.tobytes())
+
+        self.chunk = np.zeros(chunk_records, dtype=self.dtype)
+        self.pending = 0
+        self.count = 0
+        self.last_time = -np.inf
+        self.closed = False
+
+    def record(self, time, encoders, setpoints, commands=None):
+        """Add one sample.
+
+        Args:
+            time: Sample time in seconds. Must not go backwards.
+            encoders: Encoder counts, indexed by motor.
+            setpoints: Setpoints, indexed by motor.
+            commands: Control outputs, indexed by motor. NaN if not given.
+        """
+        if time < self.last_time:
+            raise ValueError(f"Sample time {time} is before the previous sample at {self.last_time}")
+        self.last_time = time
+
+        row = self.chunk[self.pending]
+        row["time"] = time
+        row["encoder"] = encoders
+        row["setpoint"] = setpoints
+        row["error"] = row["encoder"] - row["setpoint"]
+        row["command"] = np.nan if commands is None else commands
+
+        self.pending += 1
+        if self.pending == len(self.chunk):
+            self.flush()
+
+    def flush(self):
+        """Write the buffered samples as a chunk."""
+        if not self.pending:
+            return
+
+        entry = np.array([(self.count, self.chunk[0]["time"])], dtype=INDEX_DTYPE)
+        self.file.write(self.chunk[:self.pending].tobytes())
+        self.index_file.write(entry.tobytes())
+        self.file.flush()
+        self.index_file.flush()
+
+        self.count += self.pending
+        self.pending = 0
+
+    def close(self):
+        """Write the last chunk and close the log."""
+        if self.closed:
+            return
+        self.closed = True
+        self.flush()
+        self.file.close()
+        self.index_file.close()
+
+    def __len__(self):
+        return self.count + self.pending
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class TelemetryLog:
+    """Read a log written by TelemetryRecorder, without loading it.
+
+    Records are memory mapped, so opening an hours long log is instant
+    and only the pages a time range touches are read.
+    """
+    def __init__(self, path):
+        """
+        Initialize a TelemetryLog.
+
+        Args:
+            path: Log file to read.
+
+        Raises:
+            ValueError: If the file isn't a telemetry log.
+        """
+        self.path = path
+
+        header = np.fromfile(path, dtype=HEADER_DTYPE, count=1)
+        if len(header) == 0 or header[0]["magic"] != LOG_MAGIC:
+            raise ValueError(f"{path} is not a telemetry log")
+        if header[0]["version"] != LOG_VERSION:
+            raise ValueError(f"{path} has unsupported version {header[0]['version']}")
+
+        self.motor_count = int(header[0]["motor_count"])
+        self.chunk_records = int(header[0]["chunk_records"])
+        self.dtype = record_dtype(self.motor_count)
+
+        # ignore a record cut off by a crash mid-write
+        count = (os.path.getsize(path) - HEADER_DTYPE.itemsize) // self.dtype.itemsize
+        if count:
+            self.records = np.memmap(
+                path, dtype=self.dtype, mode="r", offset=HEADER_DTYPE.itemsize, shape=(count,)
+            )
+        else:
+            self.records = np.zeros(0, dtype=self.dtype)
+
+        try:
+            index = np.fromfile(index_path(path), dtype=INDEX_DTYPE)
+        except FileNotFoundError:
+            index = np.zeros(0, dtype=INDEX_DTYPE)
+        self.index = index[index["record"] < count]
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def start_time(self):
+        """Time of the first record."""
+        return float(self.records[0]["time"])
+
+    @property
+    def end_time(self):
+        """Time of the last record."""
+        return float(self.records[-1]["time"])
+
+    def find(self, time):
+        """Find the first record at or after a time.
+
+        The index narrows the search to one chunk; only that chunk's
+        times are read.
+
+        Args:
+            time: Time in seconds.
+
+        Returns:
+            The record number, len(self) if every record is earlier.
+        """
+        if len(self.index) == 0:
+            return int(np.searchsorted(self.records["time"], time))
+
+        chunk = max(0, int(np.searchsorted(self.index["time"], time, "right")) - 1)
+        low = int(self.index["record"][chunk])
+        high = int(self.index["record"][chunk + 1]) if chunk + 1 < len(self.index) else len(self)
+        return low + int(np.searchsorted(self.records["time"][low:high], time))
+
+    def between(self, start=None, end=None):
+        """Get the records in a time range.
+
+        Args:
+            start: First time to include. Defaults to the start of the log.
+            end: Time to stop before. Defaults to the end of the log.
+
+        Returns:
+            Memory mapped structured array of the records.
+        """
+        first = 0 if start is None else self.find(start)
+        last = len(self) if end is None else self.find(end)
+        return self.records[first:last]
+
+    def replay(self, consumer, start=None, end=None, speed=1.0, interval=0.01,
+               clock=time.monotonic, sleep=time.sleep):
+        """Feed records to a consumer at their recorded pace, or faster.
+
+        Args:
+            consumer: Function called with each batch of due records.
+            start: First time to replay. Defaults to the start of the log.
+            end: Time to stop before. Defaults to the end of the log.
+            speed: Playback speed, e.g. 1 for real time or 10 for ten times
+                faster. None replays as fast as the consumer takes it.
+            interval: Most seconds to wait between batches. Default is 0.01.
+            clock: Function returning the current time in seconds.
+            sleep: Function sleeping for some seconds.
+        """
+        records = self.between(start, end)
+        if len(records) == 0:
+            return
+
+        if speed is None:
+            for i in range(0, len(records), self.chunk_records):
+                consumer(records[i:i + self.chunk_records])
+            return
+
+        times = records["time"]
+        first_time = times[0]
+        wall_start = clock()
+
+        i = 0
+        while i < len(records):
+            log_now = first_time + (clock() - wall_start) * speed
+            due = i + int(np.searchsorted(times[i:], log_now, "right"))
+            if due > i:
+                consumer(records[i:due])
+                i = due
+            if i < len(records):
+                sleep(max(0.0, min(interval, (times[i] - log_now) / speed)))
+
+
+def plot_records(plotter, start_time=None):
+    """Make a replay consumer that draws records on a LivePlotter.
+
+    Lines are drawn like GUI.plot: every motor's setpoint, then every
+    motor's encoder count.
+
+    Args:
+        plotter: The LivePlotter to draw on.
+        start_time: Log time to show as the plotter's current time.
+            Defaults to the first record replayed.
+
+    Returns:
+        Function taking a batch of records.
+    """
+    offset = None
+
+    def consume(records):
+        nonlocal offset
+        if offset is None:
+            first = records[0]["time"] if start_time is None else start_time
+            offset = time.time() - plotter.start - first
+
+        values = np.hstack((records["setpoint"], records["encoder"]))
+        for timestamp, row in zip((records["time"] + offset).tolist(), values.tolist()):
+            plotter.plot(row, timestamp)
+
+    return consume
+
+
+def main():
+    import tkinter as tk
+
+    from gui import line_styles
+    from liveplot import LivePlotter
+
+    parser = argparse.ArgumentParser(description="Replay a telemetry log.")
+    parser.add_argument("path", help="log file written by TelemetryRecorder")
+    parser.add_argument("--speed", type=float, default=1.0, help="playback speed (default 1)")
+    parser.add_argument("--start", type=float, help="log time to start at")
+    parser.add_argument("--end", type=float, help="log time to stop at")
+    args = parser.parse_args()
+
+    log = TelemetryLog(args.path)
+    print(f"{len(log)} records from {log.start_time:.3f} s to {log.end_time:.3f} s")
+
+    root = tk.Tk()
+    root.title(f"Replay {args.path}")
+    plotter = LivePlotter(root, 5, *line_styles(log.motor_count, "Setpoint", "Encoder"), fast=True)
+    plotter.grid(row=0, column=0)
+
+    threading.Thread(
+        target=log.replay,
+        args=(plot_records(plotter),),
+        kwargs={"start": args.start, "end": args.end, "speed": args.speed},
+        daemon=True,
+    ).start()
+    root.mainloop()
+
+
+if __name__ == "__main__":
+    main()
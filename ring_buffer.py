@@ -0,0 +1,193 @@
+"""Fixed-cost buffers for sliding windows of live data.
+
+Jackson Smith
+Final Project
+"""
+
+from collections import deque
+
+import numpy as np
+
+
+class TimeRingBuffer:
+    """A circular buffer of timestamped rows, evicted by time.
+
+    Every row is written twice, capacity apart, so the rows in the buffer
+    are always one contiguous slice and can be handed to matplotlib as
+    views without copying or wrapping.
+
+    Rows are numbered in the order they were added; start and end are the
+    numbers of the oldest row kept and one past the newest.
+    """
+    def __init__(self, columns, capacity=1024):
+        """
+        Initialize a TimeRingBuffer.
+
+        Args:
+            columns: Number of values per row.
+            capacity: Starting number of rows. The buffer doubles when full.
+        """
+        self.columns = columns
+        self.capacity = capacity
+        self._times = np.empty(2 * capacity)
+        self._values = np.empty((columns, 2 * capacity))
+
+        # index into the arrays of the oldest row
+        self.head = 0
+        self.start = 0
+        self.end = 0
+
+    def __len__(self):
+        return self.end - self.start
+
+    def append(self, time, values):
+        """Add a row.
+
+        Args:
+            time: Row timestamp. Must not be older than the newest row.
+            values: Sequence of column values.
+        """
+        if len(self) == self.capacity:
+            self._grow()
+
+        index = (self.head + len(self)) % self.capacity
+        mirror = index + self.capacity
+        self._times[index] = self._times[mirror] = time
+        self._values[:, index] = self._values[:, mirror] = values
+        self.end += 1
+
+    def extend(self, times, values):
+        """Add many rows at once.
+
+        Args:
+            times: Row timestamps. Must not be older than the newest row.
+            values: Array with one row of column values per timestamp.
+        """
+        count = len(times)
+        while len(self) + count > self.capacity:
+            self._grow()
+
+        start = (self.head + len(self)) % self.capacity
+        first = min(count, self.capacity - start)
+        rest = count - first
+        values = np.asarray(values).T
+
+        for offset in (0, self.capacity):
+            self._times[start + offset:start + offset + first] = times[:first]
+            self._values[:, start + offset:start + offset + first] = values[:, :first]
+            # wrap around to the front
+            self._times[offset:offset + rest] = times[first:]
+            self._values[:, offset:offset + rest] = values[:, first:]
+        self.end += count
+
+    def evict_before(self, time):
+        """Drop rows older than a time.
+
+        Args:
+            time: Rows with timestamps before this are dropped.
+
+        Returns:
+            Number of rows dropped.
+        """
+        dropped = 0
+        while self.start < self.end and self._times[self.head] < time:
+            self.head = (self.head + 1) % self.capacity
+            self.start += 1
+            dropped += 1
+        return dropped
+
+    def clear(self):
+        """Drop every row."""
+        self.head = 0
+        self.start = self.end
+
+    @property
+    def times(self):
+        """Timestamps of the rows, oldest first (a view)."""
+        return self._times[self.head:self.head + len(self)]
+
+    def column(self, i):
+        """Values of one column, oldest first (a view).
+
+        Args:
+            i: Column index.
+        """
+        return self._values[i, self.head:self.head + len(self)]
+
+    @property
+    def newest_time(self):
+        """Timestamp of the newest row."""
+        return self._times[self.head + len(self) - 1]
+
+    def _grow(self):
+        """Double the capacity, keeping the rows."""
+        times = self.times.copy()
+        values = self._values[:, self.head:self.head + len(self)].copy()
+
+        self.capacity *= 2
+        self._times = np.empty(2 * self.capacity)
+        self._values = np.empty((self.columns, 2 * self.capacity))
+
+        count = len(times)
+        self._times[:count] = self._times[self.capacity:self.capacity + count] = times
+        self._values[:, :count] = self._values[:, self.capacity:self.capacity + count] = values
+        self.head = 0
+
+
+class WindowedExtrema:
+    """Running minimum and maximum of a sliding window.
+
+    Uses monotonic deques, so pushing, evicting and reading the extremes
+    all take amortized constant time however big the window is.
+    """
+    def __init__(self):
+        """Initialize an empty WindowedExtrema."""
+        # (row number, value) with increasing values
+        self.mins = deque()
+        # (row number, value) with decreasing values
+        self.maxes = deque()
+
+    def push(self, index, low, high=None):
+        """Add a row's values.
+
+        Args:
+            index: Row number, increasing with each push.
+            low: Smallest value in the row.
+            high: Largest value in the row. Defaults to low.
+        """
+        if high is None:
+            high = low
+
+        while self.mins and self.mins[-1][1] >= low:
+            self.mins.pop()
+        self.mins.append((index, low))
+
+        while self.maxes and self.maxes[-1][1] <= high:
+            self.maxes.pop()
+        self.maxes.append((index, high))
+
+    def evict_before(self, index):
+        """Forget rows numbered before an index.
+
+        Args:
+            index: Number of the oldest row still in the window.
+        """
+        while self.mins and self.mins[0][0] < index:
+            self.mins.popleft()
+        while self.maxes and self.maxes[0][0] < index:
+            self.maxes.popleft()
+
+    def clear(self):
+        """Forget every row."""
+        self.mins.clear()
+        self.maxes.clear()
+
+    @property
+    def min(self):
+        """Smallest value in the window, or None if empty."""
+        return self.mins[0][1] if self.mins else None
+
+    @property
+    def max(self):
+        """Largest value in the window, or None if empty."""
+        return self.maxes[0][1] if self.maxes else None
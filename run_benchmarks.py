@@ -0,0 +1,188 @@
+"""Run the benchmark suite and compare it against a stored baseline.
+
+Example usage:
+    python run_benchmarks.py --output results.json
+    python run_benchmarks.py --update-baseline
+    python run_benchmarks.py --threshold 0.1 --all
+
+Exits with status 1 if any metric is worse than the baseline by more than
+the threshold.
+
+Jackson Smith
+Final Project
+"""
+
+import argparse
+import importlib
+import json
+import platform
+import sys
+import time
+
+# quick benchmarks, run by default
+SUITES = [
+    "bench_byte_packing",
+    "bench_cobs_encoding",
+    "bench_liveplot",
+    "bench_transactions",
+    "bench_acquisition",
+    "bench_recorder",
+]
+
+# slower benchmarks, only run with --all
+EXTRA_SUITES = [
+    "bench_lock_contention",
+    "bench_async",
+    "bench_telemetry",
+    "bench_pool",
+    "bench_link_stats",
+    "bench_baud",
+    "bench_connect",
+    "bench_tuning",
+    "bench_identification",
+    "bench_shadow_state",
+    "bench_batch",
+]
+
+DEFAULT_BASELINE = "bench_baseline.json"
+
+# metric name endings, and whether bigger numbers are better
+HIGHER_IS_BETTER = ("_per_s", "_hz")
+LOWER_IS_BETTER = ("_us", "_ms", "_ns_per_byte", "_percent", "_s")
+
+
+def direction(name):
+    """Work out which way a metric should move.
+
+    Args:
+        name: Metric name.
+
+    Returns:
+        1 if higher is better, -1 if lower is better, 0 if unknown.
+    """
+    if name.endswith(HIGHER_IS_BETTER):
+        return 1
+    if name.endswith(LOWER_IS_BETTER):
+        return -1
+    return 0
+
+
+def run_suites(names):
+    """Run benchmark modules.
+
+    Args:
+        names: Module names, each with a run() returning {metric: value}.
+
+    Returns:
+        A tuple of ({suite.metric: value}, {suite: reason skipped}).
+    """
+    metrics = {}
+    skipped = {}
+    for name in names:
+        suite = name.removeprefix("bench_")
+        print(f"Running {suite}...", file=sys.stderr)
+        try:
+            results = importlib.import_module(name).run()
+        except ImportError as e:
+            skipped[suite] = f"missing dependency: {e.name}"
+            continue
+
+        if not results:
+            skipped[suite] = "not runnable here"
+        for metric, value in results.items():
+            metrics[f"{suite}.{metric}"] = value
+    return metrics, skipped
+
+
+def compare(metrics, baseline, threshold):
+    """Find metrics that got worse than the baseline.
+
+    Args:
+        metrics: Current {metric: value}.
+        baseline: Baseline {metric: value}.
+        threshold: Allowed fractional change in the bad direction, e.g. 0.2.
+
+    Returns:
+        List of (metric, baseline value, current value, fractional change).
+    """
+    regressions = []
+    for name, value in metrics.items():
+        sign = direction(name)
+        old = baseline.get(name)
+        if not sign or not old:
+            continue
+
+        change = (value - old) / abs(old)
+        if -sign * change > threshold:
+            regressions.append((name, old, value, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the ArduController benchmarks.")
+    parser.add_argument("--all", action="store_true", help="include the slower benchmarks")
+    parser.add_argument("--only", nargs="+", metavar="SUITE", help="run only these suites")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="fractional regression allowed before failing (default 0.2)")
+    parser.add_argument("--update-baseline", action="store_true", help="save these results as the baseline")
+    args = parser.parse_args()
+
+    if args.only:
+        names = [name if name.startswith("bench_") else f"bench_{name}" for name in args.only]
+    else:
+        names = SUITES + (EXTRA_SUITES if args.all else [])
+
+    metrics, skipped = run_suites(names)
+    results = {
+        "metrics": metrics,
+        "skipped": skipped,
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "node": platform.node(),
+        },
+    }
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+    if args.update_baseline:
+        try:
+            with open(args.baseline) as file:
+                baseline = json.load(file)
+        except FileNotFoundError:
+            baseline = {"metrics": {}}
+        # keep baseline values for suites that weren't run this time
+        baseline["metrics"].update(metrics)
+        baseline["meta"] = results["meta"]
+        with open(args.baseline, "w") as file:
+            json.dump(baseline, file, indent=2)
+        print(f"Updated baseline {args.baseline}", file=sys.stderr)
+        return 0
+
+    try:
+        with open(args.baseline) as file:
+            baseline = json.load(file)["metrics"]
+    except FileNotFoundError:
+        print(f"No baseline at {args.baseline}; run with --update-baseline to create one.", file=sys.stderr)
+        return 0
+
+    regressions = compare(metrics, baseline, args.threshold)
+    for name, old, new, change in regressions:
+        print(f"REGRESSION {name}: {old:.3f} -> {new:.3f} ({change:+.1%})", file=sys.stderr)
+    if regressions:
+        return 1
+
+    print(f"No regressions beyond {args.threshold:.0%}.", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
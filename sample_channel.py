@@ -0,0 +1,92 @@
+"""Hand samples from an acquisition thread to the Tk loop in batches.
+
+Jackson Smith
+Final Project
+"""
+
+import threading
+
+import numpy as np
+
+
+class SampleChannel:
+    """A bounded single-producer, single-consumer channel of timestamped rows.
+
+    Two preallocated buffers take turns: the producer fills one while the
+    consumer reads the other. The lock is only held to write one row or to
+    swap the buffers, never while the consumer reads, so neither side
+    waits on the other for long.
+
+    Example usage:
+        channel = SampleChannel(2)
+        channel.push(time, (setpoint, encoder))   # acquisition thread
+        times, values = channel.swap()            # Tk thread, once a frame
+    """
+    def __init__(self, columns, capacity=8192):
+        """
+        Initialize a SampleChannel.
+
+        Args:
+            columns: Number of values per row.
+            capacity: Most rows held between swaps. Rows pushed while full
+                are dropped and counted in overruns. Default is 8192.
+        """
+        self.columns = columns
+        self.capacity = capacity
+        self.lock = threading.Lock()
+
+        self.buffers = [
+            (np.empty(capacity), np.empty((capacity, columns))),
+            (np.empty(capacity), np.empty((capacity, columns))),
+        ]
+        self.active = 0
+        self.count = 0
+
+        self.overruns = 0
+        self.total = 0
+
+    def push(self, time, *parts):
+        """Add a row. Called from the producer thread only.
+
+        Args:
+            time: Row timestamp.
+            *parts: Sequences of values, concatenated to make the row.
+
+        Returns:
+            False if the channel was full and the row was dropped.
+        """
+        with self.lock:
+            if self.count == self.capacity:
+                self.overruns += 1
+                return False
+
+            times, values = self.buffers[self.active]
+            row = values[self.count]
+            start = 0
+            for part in parts:
+                end = start + len(part)
+                row[start:end] = part
+                start = end
+            times[self.count] = time
+
+            self.count += 1
+            self.total += 1
+            return True
+
+    def swap(self):
+        """Take every row pushed since the last swap. Called from the consumer thread only.
+
+        Returns:
+            A tuple of (times, values) arrays with one row per sample. They
+            are views into a buffer the producer reuses, so they are only
+            valid until the next swap.
+        """
+        with self.lock:
+            times, values = self.buffers[self.active]
+            count = self.count
+            self.active ^= 1
+            self.count = 0
+        return times[:count], values[:count]
+
+    def __len__(self):
+        return self.count
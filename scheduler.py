@@ -0,0 +1,123 @@
+"""Run a loop at a fixed rate against absolute deadlines.
+
+Jackson Smith
+Final Project
+"""
+
+import time
+from collections import deque
+
+import numpy as np
+
+
+class RateScheduler:
+    """Pace a loop to a fixed rate without drifting.
+
+    Deadlines sit on a fixed grid from the first tick, so time spent in
+    the loop body and sleep overshoot don't accumulate. A tick that is
+    more than a whole period late skips the deadlines it missed instead
+    of running them back to back.
+
+    Example usage:
+        scheduler = RateScheduler(200)
+        while running:
+            scheduler.wait()
+            sample()
+        print(scheduler.stats())
+    """
+    def __init__(self, rate, spin=0.0002, history=2000, clock=time.perf_counter, sleep=time.sleep):
+        """
+        Initialize a RateScheduler.
+
+        Args:
+            rate: Ticks per second.
+            spin: Seconds before each deadline to stop sleeping and spin
+                instead, to hide sleep overshoot. Default is 0.0002.
+            history: Number of recent ticks kept for the jitter statistics.
+                Default is 2000.
+            clock: Function returning the current time in seconds.
+            sleep: Function sleeping for some seconds.
+        """
+        self.period = 1 / rate
+        self.spin = spin
+        self.clock = clock
+        self.sleep = sleep
+
+        self.start = None
+        self.deadline = None
+        self.last_tick = None
+        self.ticks = 0
+        self.missed = 0
+        # seconds each tick started after its deadline
+        self.lateness = deque(maxlen=history)
+
+    @property
+    def rate(self):
+        """Target ticks per second."""
+        return 1 / self.period
+
+    def wait(self):
+        """Wait for the next deadline.
+
+        Returns:
+            The deadline this tick belongs to, on the scheduler's clock.
+        """
+        now = self.clock()
+        if self.deadline is None:
+            self.start = self.deadline = now
+        else:
+            remaining = self.deadline - now
+            if remaining > self.spin:
+                self.sleep(remaining - self.spin)
+            while self.clock() < self.deadline:
+                pass
+            now = self.clock()
+
+        late = now - self.deadline
+        if late >= self.period:
+            # skip the ticks we slept through, keeping to the grid
+            skipped = int(late // self.period)
+            self.missed += skipped
+            self.deadline += skipped * self.period
+            late -= skipped * self.period
+
+        self.lateness.append(late)
+        self.ticks += 1
+        self.last_tick = now
+
+        deadline = self.deadline
+        self.deadline += self.period
+        return deadline
+
+    def __iter__(self):
+        """Tick forever, yielding each deadline."""
+        while True:
+            yield self.wait()
+
+    def reset(self):
+        """Start a fresh grid and statistics at the next tick."""
+        self.start = self.deadline = self.last_tick = None
+        self.ticks = 0
+        self.missed = 0
+        self.lateness.clear()
+
+    def stats(self):
+        """Summarize how well the deadlines were kept.
+
+        Returns:
+            Dictionary with the achieved rate (ticks per second), missed
+            deadlines, and the median, 90th, 99th percentile and worst
+            lateness of recent ticks in microseconds.
+        """
+        elapsed = self.last_tick - self.start if self.ticks > 1 else 0.0
+        lateness = np.array(self.lateness) * 1e6 if self.lateness else np.zeros(1)
+        p50, p90, p99 = np.percentile(lateness, [50, 90, 99])
+        return {
+            "target_rate": self.rate,
+            "achieved_rate": (self.ticks - 1) / elapsed if elapsed > 0 else 0.0,
+            "missed": self.missed,
+            "jitter_p50_us": float(p50),
+            "jitter_p90_us": float(p90),
+            "jitter_p99_us": float(p99),
+            "jitter_max_us": float(lateness.max()),
+        }
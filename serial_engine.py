@@ -0,0 +1,198 @@
+"""Full-duplex serial I/O with dedicated reader and writer threads.
+
+Jackson Smith
+Final Project
+"""
+
+import queue
+import threading
+
+from cobs_encoder import CobsStreamDecoder, cobs_check
+
+# longest frame we expect; anything longer is noise
+MAX_FRAME = 4096
+
+
+class SerialEngine:
+    """Drive a serial port from a reader thread and a writer thread.
+
+    The reader drains whatever is waiting on the port in one read and
+    splits it into COBS frames. The writer sends every frame queued since
+    its last wakeup in a single write. Callers only enqueue frames and wait
+    for replies.
+    """
+    def __init__(self, ser, on_frame=None, stats=None, on_error=None):
+        """
+        Initialize a SerialEngine.
+
+        Args:
+            ser: An open serial.Serial (or anything with read/write/in_waiting).
+            on_frame: Optional callback run on the reader thread for each
+                decoded frame. If not given, frames go to a queue for receive().
+            stats: Optional LinkStats to count traffic in.
+            on_error: Optional callback run with the exception when reading
+                or writing fails, e.g. because the USB cable was pulled. The
+                failed thread then exits. If not given, the exception is raised.
+        """
+        self.ser = ser
+        self.on_frame = on_frame
+        self.stats = stats
+        self.on_error = on_error
+        self.decoder = CobsStreamDecoder(MAX_FRAME)
+
+        self.incoming = queue.Queue()
+        self.outgoing = queue.Queue()
+
+        self.running = False
+        # set once a read or write has failed
+        self.failed = False
+        self.reader = None
+        self.writer = None
+
+    def start(self):
+        """Start the reader and writer threads."""
+        self.running = True
+        self.reader = threading.Thread(target=self._read_loop, daemon=True)
+        self.writer = threading.Thread(target=self._write_loop, daemon=True)
+        self.reader.start()
+        self.writer.start()
+
+    def stop(self):
+        """Stop both threads and wait for them to exit."""
+        if not self.running:
+            return
+        self.running = False
+
+        # wake both threads up
+        self.outgoing.put(None)
+        # a port that failed may be closing under us, and can't be cancelled
+        if hasattr(self.ser, "cancel_read") and not self.failed:
+            self.ser.cancel_read()
+
+        for thread in (self.reader, self.writer):
+            if thread is not threading.current_thread():
+                thread.join()
+
+    def send(self, frame):
+        """Queue an encoded frame to be written.
+
+        Args:
+            frame: COBS encoded bytes, including the trailing zero.
+        """
+        self.outgoing.put(frame)
+
+    def receive(self, timeout=None):
+        """Wait for the next decoded frame.
+
+        Args:
+            timeout: Seconds to wait. None waits forever.
+
+        Returns:
+            The decoded frame, or None on timeout.
+        """
+        try:
+            return self.incoming.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def flush_input(self):
+        """Discard any received frames nobody has asked for yet."""
+        while True:
+            try:
+                self.incoming.get_nowait()
+            except queue.Empty:
+                return
+
+    def _read_loop(self):
+        """Read chunks from the port and split them into frames."""
+        while self.running:
+            try:
+                # block for the first byte, then take everything waiting
+                chunk = self.ser.read(max(1, self.ser.in_waiting))
+            except Exception as e:
+                if not self.running:
+                    return
+                self._fail(e)
+                return
+
+            if not chunk:
+                continue
+
+            if self.stats is not None:
+                self._count_in(chunk)
+
+            for frame in self.decoder.feed(chunk):
+                if self.on_frame is not None:
+                    self.on_frame(frame)
+                else:
+                    self.incoming.put(frame)
+
+    def _write_loop(self):
+        """Write queued frames, joining everything queued together."""
+        while True:
+            frame = self.outgoing.get()
+            if frame is None:
+                return
+
+            frames = [frame]
+            stop = False
+            while True:
+                try:
+                    frame = self.outgoing.get_nowait()
+                except queue.Empty:
+                    break
+                if frame is None:
+                    stop = True
+                    break
+                frames.append(frame)
+
+            try:
+                self.ser.write(b"".join(frames))
+            except Exception as e:
+                if self.running:
+                    self._fail(e)
+                return
+
+            if self.stats is not None:
+                self.stats.frames_out += len(frames)
+                self.stats.bytes_out += sum(map(len, frames))
+
+            if stop:
+                return
+
+    def _fail(self, error):
+        """Hand a failed read or write to on_error, or raise it."""
+        self.failed = True
+        if self.on_error is None:
+            raise error
+        self.on_error(error)
+
+    def _count_in(self, chunk):
+        """Count received bytes, frames and damaged frames.
+
+        Runs before the chunk is fed to the decoder, which keeps no
+        encoded frames to check afterwards.
+        """
+        stats = self.stats
+        stats.bytes_in += len(chunk)
+
+        pending = self.decoder.pending
+        start = 0
+        end = chunk.find(0)
+        while end != -1:
+            frame = pending + chunk[start:end] if pending else chunk[start:end]
+            pending = None
+            # empty frames are just back-to-back delimiters
+            if frame:
+                stats.frames_in += 1
+                if not cobs_check(frame):
+                    stats.decode_failures += 1
+            start = end + 1
+            end = chunk.find(0, start)
+
+        # the decoder drops a frame that grows too long to be real
+        leftover = len(chunk) - start
+        if pending:
+            leftover += len(pending)
+        if self.decoder.max_frame is not None and leftover > self.decoder.max_frame:
+            stats.decode_failures += 1
@@ -0,0 +1,89 @@
+"""Track what each motor on the Arduino is set to, as far as the host knows.
+
+A write forgets the fields it touches until the Arduino acknowledges it,
+then the new values are confirmed. Writes that would leave every field
+unchanged can be skipped.
+
+Jackson Smith
+Final Project
+"""
+
+import threading
+
+
+class ShadowState:
+    """A shadow copy of the Arduino's per-motor settings.
+
+    Fields are plain names, e.g. "mode", "speed", "setpoint" or "pid".
+    A field that isn't known never matches, so unknown state is always
+    written.
+    """
+    def __init__(self):
+        # motor index to {field: value}
+        self.motors = {}
+        self.lock = threading.Lock()
+
+    def matches(self, motors, fields):
+        """Check whether some motors are all known to hold some values.
+
+        Args:
+            motors: Motor indices.
+            fields: Dictionary of field name to value.
+
+        Returns:
+            True if every field of every motor is confirmed at that value.
+        """
+        with self.lock:
+            for motor in motors:
+                known = self.motors.get(motor, {})
+                for field, value in fields.items():
+                    if field not in known or known[field] != value:
+                        return False
+            return True
+
+    def confirm(self, motors, fields):
+        """Record values the Arduino has acknowledged.
+
+        Args:
+            motors: Motor indices.
+            fields: Dictionary of field name to value.
+        """
+        with self.lock:
+            for motor in motors:
+                self.motors.setdefault(motor, {}).update(fields)
+
+    def forget(self, motors=None, fields=None):
+        """Mark values as unknown, e.g. while a write is in flight.
+
+        Args:
+            motors: Motor indices. Defaults to every motor.
+            fields: Field names. Defaults to every field.
+        """
+        with self.lock:
+            for motor in list(self.motors) if motors is None else motors:
+                known = self.motors.get(motor)
+                if known is None:
+                    continue
+                if fields is None:
+                    known.clear()
+                    continue
+                for field in fields:
+                    known.pop(field, None)
+
+    def clear(self):
+        """Forget everything, e.g. after the Arduino may have rebooted."""
+        self.forget()
+
+    def get(self, motor, field, default=None):
+        """Get a confirmed value.
+
+        Args:
+            motor: Motor index.
+            field: Field name.
+            default: Returned if the value isn't known.
+
+        Returns:
+            The value, or default.
+        """
+        with self.lock:
+            return self.motors.get(motor, {}).get(field, default)
@@ -0,0 +1,717 @@
+"""Simulate an Arduino running ArduController firmware on a pseudo-terminal.
+
+The simulator follows firmware.ino: the same COBS framing and commands,
+commands handled once per control loop, the PID controller from pid.h and
+a motor/encoder plant. Serial latency and baud rate can be throttled so
+measurements on a plain Linux box match the real hardware.
+
+Jackson Smith
+Final Project
+"""
+
+import argparse
+import math
+import multiprocessing
+import os
+import random
+import select
+import threading
+import time
+import tty
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+from arducontroller import (
+    BAUD_CODEC,
+    BAUD_RATES,
+    BAUD_VERIFY_TIME,
+    BATCHABLE,
+    Command,
+    DEFAULT_MOTOR_MASK,
+    HEARTBEAT_TIMEOUT,
+    HELLO_CODEC,
+    HISTORY_HEADER_CODEC,
+    TELEMETRY_DTYPE,
+    TELEMETRY_TIME_CODEC,
+)
+from byte_packing import Codec, pack_values, unpack_values
+from cobs_encoder import CobsStreamDecoder, cobs_encode
+from framing import NACK, FrameError, frame, unframe
+from pid import PID, write_analog
+from pipeline import SEQUENCED, STREAM
+
+# matches CYCLE_DELAY_MS in firmware.ino
+CYCLE_DELAY = 0.005
+
+# match HISTORY_LENGTH and HISTORY_PER_REPLY in firmware.ino
+HISTORY_LENGTH = 128
+HISTORY_PER_REPLY = 64
+SAMPLE_CODEC = Codec("Iif")
+
+# most control cycles to catch up on at once after sitting idle
+MAX_CATCH_UP = 1000
+
+# matches Serial.begin and PROTOCOL_VERSION in firmware.ino
+BOOT_BAUD = 115200
+PROTOCOL_VERSION = 2
+
+# matches REPLY_LENGTH in firmware.ino, which bounds a batch's replies
+REPLY_LENGTH = 800
+
+# start bit, 8 data bits, stop bit
+BITS_PER_BYTE = 10
+
+# settings that behave like a real board on USB serial
+HARDWARE_PROFILE = {"latency": 0.001, "baud_rate": 115200, "cycle_aligned": True}
+
+
+class MotorPlant:
+    """A DC motor and encoder: first order velocity response with a deadband.
+
+    Velocity approaches gain * PWM with the given time constant. PWM inside
+    the deadband (static friction) doesn't move the motor, and PWM reaches
+    the motor dead_time late.
+    """
+    def __init__(self, gain=20.0, time_constant=0.05, deadband=10, position=0.0, dead_time=0.0):
+        """
+        Initialize a MotorPlant.
+
+        Args:
+            gain: Steady state speed per PWM unit, in counts per second. Default is 20.
+            time_constant: Seconds to reach 63% of steady state speed. Default is 0.05.
+            deadband: PWM magnitude needed to overcome friction. Default is 10.
+            position: Starting encoder position. Default is 0.
+            dead_time: Seconds before PWM takes effect, rounded to whole steps.
+                Default is 0.
+        """
+        self.gain = gain
+        self.time_constant = time_constant
+        self.deadband = deadband
+        self.dead_time = dead_time
+
+        self.position = position
+        self.velocity = 0.0
+        # PWM still on its way to the motor, oldest first
+        self.delayed = deque()
+
+    def step(self, pwm, dt):
+        """Advance the motor.
+
+        Args:
+            pwm: Signed PWM applied to the motor, -255 to 255.
+            dt: Seconds to advance.
+        """
+        if self.dead_time:
+            self.delayed.append(pwm)
+            pwm = self.delayed.popleft() if len(self.delayed) > round(self.dead_time / dt) else 0.0
+
+        drive = 0.0 if abs(pwm) <= self.deadband else pwm
+        target = self.gain * drive
+
+        # exact solution of the first order response over dt
+        decay = math.exp(-dt / self.time_constant)
+        new_velocity = target + (self.velocity - target) * decay
+        self.position += target * dt + (self.velocity - target) * self.time_constant * (1 - decay)
+        self.velocity = new_velocity
+
+    @property
+    def encoder(self):
+        """Whole encoder counts."""
+        return math.floor(self.position)
+
+
+class SimulatedMotor:
+    """One motor as the firmware's Motor sees it: mode, PID and plant."""
+    def __init__(self, plant, clock, polarity=-1):
+        """
+        Initialize a SimulatedMotor.
+
+        Args:
+            plant: The motor model.
+            clock: Function returning the device time in milliseconds, for the PID.
+            polarity: Motor polarity, like the firmware's Motor. Default is -1.
+        """
+        self.plant = plant
+        self.polarity = polarity
+        self.pid = PID(0, 0, 0, 0, 0, 0, 0, 0, clock=clock)
+        self.setpoint = 0
+        self.speed = 0
+        self.mode = "analog"
+        self.output = 0.0
+
+    @property
+    def encoder(self):
+        """Current encoder count."""
+        return self.plant.encoder
+
+    def step(self):
+        """Run one control cycle, like Motor::update, and move the plant."""
+        if self.mode == "analog":
+            self.output = self.speed
+        elif self.mode == "position":
+            self.output = self.pid.calculate(float(self.encoder), float(self.setpoint))
+        else:
+            self.output = 0.0
+
+        self.plant.step(write_analog(self.output, self.polarity), CYCLE_DELAY)
+
+
+class SimulatedArduino:
+    """Answer ArduController commands on a pseudo-terminal.
+
+    Point an unchanged ArduController at it with ArduController(port=sim.port).
+    """
+    def __init__(self, plant=None, latency=0.0, baud_rate=None, cycle_aligned=False, polarity=-1,
+                 motor_count=1, error_rate=0.0, seed=None, baud_rates=BAUD_RATES, max_reliable_baud=None,
+                 boot_time=0.0):
+        """
+        Initialize a SimulatedArduino and open its pseudo-terminal.
+
+        Args:
+            plant: The model for motor 0. Defaults to MotorPlant().
+            latency: Extra seconds added to each direction, e.g. USB polling. Default is 0.
+            baud_rate: Throttle both directions to this baud rate. Default is None (no limit).
+            cycle_aligned: Only handle commands once per control loop, like loop()
+                does. Default is False, which answers as soon as a command arrives.
+            polarity: Motor polarity, like the firmware's Motor. Default is -1.
+            motor_count: Number of motors, like MOTOR_COUNT. Motors after the
+                first get a default MotorPlant. Default is 1.
+            error_rate: Chance each read or write has one bit flipped, like
+                noise on a long cable. Default is 0.
+            seed: Seed for the noise, to repeat a run exactly. Default is None.
+            baud_rates: Rates NEGOTIATE_BAUD may switch to. Default is BAUD_RATES.
+            max_reliable_baud: Above this rate every byte is lost, like a cable
+                too long for it. Default is None (every rate works).
+            boot_time: Seconds after starting or reset() during which bytes
+                from the host are lost, like the bootloader. Default is 0.
+        """
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.master)
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+
+        self.latency = latency
+        # throttle to the negotiated rate only if throttling at all
+        self.throttled = bool(baud_rate)
+        self.boot_baud = baud_rate or BOOT_BAUD
+        self.byte_time = 0.0
+        self.set_baud(self.boot_baud)
+
+        self.baud_rates = baud_rates
+        self.max_reliable_baud = max_reliable_baud
+        # rate to switch to once the reply is out, and when to give up on
+        # it without a ping
+        self.pending_baud = None
+        self.baud_deadline = None
+        self.cycle_aligned = cycle_aligned
+
+        self.decoder = CobsStreamDecoder()
+        self.handlers = {}
+
+        # framed mode, and the last framed reply, to send again on a NACK
+        self.framed = False
+        self.last_reply = b""
+        self.bad_frames = 0
+
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+
+        self.register_event(Command.SET_MOTOR, self.handle_speed_change)
+        self.register_event(Command.REQUEST_ENCODER, self.handle_encoder_request)
+        self.register_event(Command.SET_PID, self.handle_set_pid)
+        self.register_event(Command.SET_POSITION, self.handle_set_position)
+        self.register_event(Command.SUBSCRIBE_TELEMETRY, self.handle_subscribe_telemetry)
+        self.register_event(Command.REQUEST_ENCODER_HISTORY, self.handle_history_request)
+        self.register_event(Command.NEGOTIATE_BAUD, self.handle_negotiate_baud)
+        self.register_event(Command.BATCH, self.handle_batch)
+
+        self.start_time = time.perf_counter()
+        self.clock_time = self.start_time
+
+        self.clock = lambda: (self.clock_time - self.start_time) * 1000.0
+        plants = [plant or MotorPlant()] + [MotorPlant() for _ in range(motor_count - 1)]
+        self.motors = [SimulatedMotor(p, self.clock, polarity) for p in plants]
+
+        self.boot_time = boot_time
+        self.booted = self.start_time + boot_time
+
+        self.last_update = self.start_time
+        self.last_heartbeat = self.start_time
+        self.next_tick = self.start_time
+
+        self.telemetry_period = 0
+        self.next_telemetry = 0
+
+        # packed samples, and how many were ever recorded
+        self.history = deque(maxlen=HISTORY_LENGTH)
+        self.history_count = 0
+
+        # (ready time, data) in both directions, in time order
+        self.incoming = deque()
+        self.outgoing = deque()
+        self.rx_free = self.start_time
+        self.tx_free = self.start_time
+
+        self.running = False
+        self.thread = None
+
+    @property
+    def plant(self):
+        """Motor 0's model."""
+        return self.motors[0].plant
+
+    @property
+    def pid(self):
+        """Motor 0's PID controller."""
+        return self.motors[0].pid
+
+    @property
+    def encoder(self):
+        """Motor 0's current encoder count."""
+        return self.motors[0].encoder
+
+    def selected_motors(self, data, args_size):
+        """Find the motors a command addresses from its optional trailing mask.
+
+        Args:
+            data: The command's data.
+            args_size: Size of the command's arguments, before the mask.
+
+        Returns:
+            List of SimulatedMotor.
+        """
+        mask = data[args_size] if len(data) > args_size else DEFAULT_MOTOR_MASK
+        return [motor for i, motor in enumerate(self.motors) if mask & (1 << i)]
+
+    def reset(self):
+        """Restart like the board does when the port opens: settings and
+        protocol state back to their defaults, motors where they are."""
+        now = time.perf_counter()
+        self.motors = [SimulatedMotor(motor.plant, self.clock, motor.polarity) for motor in self.motors]
+        self.reset_link()
+        self.set_baud(self.boot_baud)
+        self.baud_deadline = None
+        self.decoder = CobsStreamDecoder()
+        self.incoming.clear()
+        self.booted = now + self.boot_time
+        self.last_heartbeat = now
+
+    def reset_link(self):
+        """Put the protocol back to its defaults, as HELLO does."""
+        self.framed = False
+        self.last_reply = b""
+        self.telemetry_period = 0
+        self.pending_baud = None
+
+    def set_baud(self, rate):
+        """Change the serial baud rate, like Serial.begin."""
+        self.baud = rate
+        if self.throttled:
+            self.byte_time = BITS_PER_BYTE / rate
+
+    def link_works(self):
+        """Whether bytes get through at the current baud rate."""
+        return self.max_reliable_baud is None or self.baud <= self.max_reliable_baud
+
+    def register_event(self, command, callback):
+        """Register a command handler.
+
+        Args:
+            command: Instruction ID from Command.
+            callback: Function taking the command's data and returning the
+                reply bytes (empty for no reply).
+        """
+        self.handlers[command] = callback
+
+    def start(self):
+        """Serve commands on a background thread."""
+        self.running = True
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop serving and close the pseudo-terminal."""
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+        os.close(self.master)
+        os.close(self.slave)
+
+    def serve(self):
+        """Read, dispatch and reply until stopped."""
+        while self.running:
+            now = time.perf_counter()
+            timeout = max(0.0, min(0.1, self.next_wakeup() - now))
+
+            ready, _, _ = select.select([self.master], [], [], timeout)
+
+            now = time.perf_counter()
+            if ready:
+                self.receive(os.read(self.master, 4096), now)
+
+            if not self.cycle_aligned or now >= self.next_tick:
+                self.run_loop(now)
+                if self.cycle_aligned:
+                    self.next_tick = now + CYCLE_DELAY
+
+            self.flush(now)
+
+    def next_wakeup(self):
+        """Find when something next needs doing."""
+        times = []
+        if self.outgoing:
+            times.append(self.outgoing[0][0])
+        if self.incoming:
+            times.append(max(self.incoming[0][0], self.next_tick) if self.cycle_aligned else self.incoming[0][0])
+        if self.telemetry_period:
+            times.append(max(self.next_telemetry, self.next_tick) if self.cycle_aligned else self.next_telemetry)
+        return min(times, default=time.perf_counter() + 0.1)
+
+    def receive(self, chunk, now):
+        """Queue frames from the host once they would have finished arriving.
+
+        Args:
+            chunk: Bytes read from the pseudo-terminal.
+            now: Time they were read.
+        """
+        self.rx_free = max(now, self.rx_free) + len(chunk) * self.byte_time
+        if not self.link_works() or now < self.booted:
+            return
+        ready = self.rx_free + self.latency
+        for data in self.decoder.feed(self.add_noise(chunk)):
+            self.incoming.append((ready, data))
+
+    def send(self, data, now):
+        """Queue bytes to the host for when they would have finished sending.
+
+        Args:
+            data: Encoded bytes.
+            now: Time they were written.
+        """
+        self.tx_free = max(now, self.tx_free) + len(data) * self.byte_time
+        if not self.link_works():
+            return
+        self.outgoing.append((self.tx_free + self.latency, self.add_noise(data)))
+
+    def add_noise(self, data):
+        """Flip one random bit, error_rate of the time."""
+        if not data or not self.error_rate or self.random.random() >= self.error_rate:
+            return data
+        data = bytearray(data)
+        data[self.random.randrange(len(data))] ^= 1 << self.random.randrange(8)
+        return bytes(data)
+
+    def encode(self, data):
+        """COBS encode a frame to the host, framing it in framed mode."""
+        return cobs_encode(frame(data) if self.framed else data)
+
+    def flush(self, now):
+        """Write every queued reply that is due."""
+        due = []
+        while self.outgoing and self.outgoing[0][0] <= now:
+            due.append(self.outgoing.popleft()[1])
+        if due:
+            os.write(self.master, b"".join(due))
+
+    def run_loop(self, now):
+        """One pass of the firmware's loop(): motor, serial, telemetry, heartbeat.
+
+        Args:
+            now: Current time.
+        """
+        self.update(now)
+
+        while self.incoming and self.incoming[0][0] <= now:
+            _, data = self.incoming.popleft()
+            self.last_heartbeat = now
+            reply = self.receive_frame(data)
+            if reply:
+                self.send(reply, now)
+
+        self.update_baud(now)
+
+        if self.telemetry_period and now >= self.next_telemetry:
+            self.send(self.encode(self.telemetry_frame(now)), now)
+            # skip missed periods instead of sending a burst
+            self.next_telemetry = max(self.next_telemetry + self.telemetry_period, now)
+
+        if now - self.last_heartbeat > HEARTBEAT_TIMEOUT:
+            # nobody is listening anymore
+            for motor in self.motors:
+                motor.mode = "stopped"
+            self.telemetry_period = 0
+
+    def update_baud(self, now):
+        """Switch to a negotiated baud rate once the reply has gone out, or
+        back to the boot rate if no ping confirmed it in time.
+
+        Args:
+            now: Current time.
+        """
+        if self.pending_baud is not None:
+            # Serial.flush() then Serial.begin(): the reply is sent at the old rate
+            self.set_baud(self.pending_baud)
+            self.pending_baud = None
+            self.baud_deadline = now + BAUD_VERIFY_TIME
+        elif self.baud_deadline is not None and now > self.baud_deadline:
+            self.set_baud(self.boot_baud)
+            self.baud_deadline = None
+
+    def receive_frame(self, data):
+        """Check one decoded frame in the current mode and handle it.
+
+        Args:
+            data: Decoded COBS frame.
+
+        Returns:
+            The encoded reply, empty if there is no reply.
+        """
+        # HELLO is one unframed byte, understood in either mode, and
+        # answered unframed
+        if len(data) == 1 and data[0] == Command.HELLO:
+            self.reset_link()
+            return cobs_encode(HELLO_CODEC.pack(Command.HELLO, PROTOCOL_VERSION, len(self.motors)))
+
+        # the framing switch is two unframed bytes, understood in either mode
+        if len(data) == 2 and data[0] == Command.SET_FRAMING:
+            self.framed = bool(data[1])
+            return self.encode(bytes([data[1]])) if self.framed else b""
+
+        if not self.framed:
+            reply = self.dispatch(data)
+            return cobs_encode(reply) if reply else b""
+
+        try:
+            payload = unframe(data)
+        except FrameError:
+            self.bad_frames += 1
+            return cobs_encode(NACK)
+        if payload is None:
+            # the host got a damaged reply
+            return self.last_reply
+
+        # every framed command gets a reply, so the host knows it arrived
+        self.last_reply = self.encode(self.dispatch(payload))
+        return self.last_reply
+
+    def dispatch(self, frame):
+        """Run the handler for one decoded frame.
+
+        Sequenced commands always get a reply, prefixed with their sequence ID.
+
+        Args:
+            frame: Decoded frame, a command ID followed by its data.
+
+        Returns:
+            The reply bytes, empty if there is no reply.
+        """
+        if not frame:
+            return b""
+
+        if frame[0] & SEQUENCED:
+            command = frame[0] & ~SEQUENCED
+            header = bytes(frame[1:2])
+            data = bytes(frame[2:])
+        else:
+            command = frame[0]
+            header = b""
+            data = bytes(frame[1:])
+
+        handler = self.handlers.get(command)
+        if handler is None:
+            return b""
+        return header + handler(data)
+
+    def update(self, now=None):
+        """Run the control loop up to a time, one cycle at a time.
+
+        Args:
+            now: Time to run up to. Defaults to the current time.
+        """
+        if now is None:
+            now = time.perf_counter()
+        if now - self.last_update > MAX_CATCH_UP * CYCLE_DELAY:
+            self.last_update = now - MAX_CATCH_UP * CYCLE_DELAY
+
+        while self.last_update + CYCLE_DELAY <= now:
+            self.last_update += CYCLE_DELAY
+            self.clock_time = self.last_update
+            for motor in self.motors:
+                motor.step()
+            self.record_sample(self.last_update)
+
+    def device_time(self, when):
+        """Convert a perf_counter time to the device's wrapping microsecond clock."""
+        return round((when - self.start_time) * 1e6) & 0xFFFFFFFF
+
+    def record_sample(self, when):
+        """Add motor 0's current state to the history."""
+        motor = self.motors[0]
+        self.history.append(SAMPLE_CODEC.pack(self.device_time(when), motor.encoder, motor.output))
+        self.history_count += 1
+
+    def telemetry_frame(self, now):
+        """Build one telemetry frame: time, then encoder, setpoint and PID output per motor."""
+        states = np.array(
+            [(motor.encoder, motor.setpoint, motor.output) for motor in self.motors],
+            dtype=TELEMETRY_DTYPE,
+        )
+        return (
+            bytes([STREAM | Command.SUBSCRIBE_TELEMETRY])
+            + TELEMETRY_TIME_CODEC.pack(self.device_time(now))
+            + states.tobytes()
+        )
+
+    def handle_set_pid(self, data):
+        """Update PID params."""
+        params, _ = unpack_values(data, "ffffffff")
+        for motor in self.selected_motors(data, 32):
+            motor.pid.set_params(*params)
+        return b""
+
+    def handle_set_position(self, data):
+        """Update PID setpoint and echo it back."""
+        (setpoint,), _ = unpack_values(data, "i")
+        for motor in self.selected_motors(data, 4):
+            motor.setpoint = setpoint
+            motor.mode = "position"
+        return pack_values([setpoint])
+
+    def handle_speed_change(self, data):
+        """Change motor speed."""
+        (speed,), _ = unpack_values(data, "i")
+        for motor in self.selected_motors(data, 4):
+            motor.speed = speed
+            motor.mode = "analog"
+        return b""
+
+    def handle_encoder_request(self, data):
+        """Reply with every motor's encoder count."""
+        return pack_values([motor.encoder for motor in self.motors])
+
+    def handle_history_request(self, data):
+        """Reply with every sample since a cursor: start cursor, count, samples."""
+        (cursor,), _ = unpack_values(data, "i")
+
+        # samples older than the ring buffer are gone
+        oldest = self.history_count - len(self.history)
+        cursor = min(max(cursor, oldest), self.history_count)
+        count = min(self.history_count - cursor, HISTORY_PER_REPLY)
+
+        first = cursor - oldest
+        samples = [self.history[i] for i in range(first, first + count)]
+        return HISTORY_HEADER_CODEC.pack(cursor, count) + b"".join(samples)
+
+    def handle_subscribe_telemetry(self, data):
+        """Start, retime or (with a period of 0) stop telemetry streaming."""
+        (period_us,), _ = unpack_values(data, "i")
+        self.telemetry_period = period_us / 1e6
+        self.next_telemetry = time.perf_counter()
+        return b""
+
+    def handle_negotiate_baud(self, data):
+        """Pick the first offered rate we support, or with no offer, confirm the current one."""
+        if not data:
+            # the ping got through, so the new rate works
+            self.baud_deadline = None
+            return BAUD_CODEC.pack(self.baud)
+
+        offered, _ = unpack_values(data, "i" * (len(data) // BAUD_CODEC.size))
+        rate = next((rate for rate in offered if rate in self.baud_rates), 0)
+        if rate and rate != self.baud:
+            self.pending_baud = rate
+        return BAUD_CODEC.pack(rate)
+
+    def handle_batch(self, data):
+        """Run several commands from one frame, packing their replies into one.
+
+        Each command and each reply is a length byte, then the bytes. A
+        command that can't be batched gets an empty reply; commands whose
+        replies might not fit in the reply buffer are dropped.
+        """
+        replies = []
+        written = 0
+        offset = 0
+        # an encoder count per motor is the longest batched reply, and the
+        # sequence ID goes in front
+        while offset < len(data) and written + 1 + 4 * len(self.motors) <= REPLY_LENGTH - 1:
+            length = data[offset]
+            offset += 1
+            if length == 0 or offset + length > len(data):
+                break
+
+            command = data[offset]
+            handler = self.handlers.get(command) if command in BATCHABLE else None
+            reply = handler(data[offset + 1:offset + length]) if handler is not None else b""
+            replies.append(bytes([len(reply)]) + reply)
+            written += 1 + len(reply)
+            offset += length
+        return b"".join(replies)
+
+
+def _serve_process(conn, kwargs):
+    """Run a simulator in a child process, sending its port back over conn."""
+    sim = SimulatedArduino(**kwargs)
+    conn.send(sim.port)
+    sim.running = True
+    sim.serve()
+
+
+@contextmanager
+def simulator_process(**kwargs):
+    """Run a SimulatedArduino in its own process.
+
+    Keeps the simulator's CPU use out of the measurements of the process
+    under test.
+
+    Args:
+        **kwargs: Keyword arguments for SimulatedArduino.
+
+    Yields:
+        The simulator's serial port.
+    """
+    parent, child = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=_serve_process, args=(child, kwargs), daemon=True)
+    process.start()
+    try:
+        yield parent.recv()
+    finally:
+        process.terminate()
+        process.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate an ArduController board on a pseudo-terminal.")
+    parser.add_argument("--hardware", action="store_true", help="use latency and baud rate like a real board")
+    parser.add_argument("--latency", type=float, help="seconds added in each direction")
+    parser.add_argument("--baud", type=int, help="throttle to this baud rate")
+    parser.add_argument("--gain", type=float, default=20.0, help="motor counts per second per PWM unit")
+    parser.add_argument("--time-constant", type=float, default=0.05, help="motor time constant in seconds")
+    parser.add_argument("--deadband", type=float, default=10, help="PWM needed to overcome friction")
+    parser.add_argument("--dead-time", type=float, default=0.0, help="seconds before PWM takes effect")
+    parser.add_argument("--motors", type=int, default=1, help="number of motors")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="chance each read or write is damaged")
+    args = parser.parse_args()
+
+    kwargs = dict(HARDWARE_PROFILE) if args.hardware else {}
+    if args.latency is not None:
+        kwargs["latency"] = args.latency
+    if args.baud is not None:
+        kwargs["baud_rate"] = args.baud
+    kwargs["plant"] = MotorPlant(args.gain, args.time_constant, args.deadband, dead_time=args.dead_time)
+    kwargs["motor_count"] = args.motors
+    kwargs["error_rate"] = args.error_rate
+
+    sim = SimulatedArduino(**kwargs)
+    print(sim.port, flush=True)
+    sim.running = True
+    try:
+        sim.serve()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
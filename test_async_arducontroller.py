@@ -0,0 +1,68 @@
+"""Test the asyncio controller against the simulator.
+
+Jackson Smith
+Final Project
+"""
+
+import asyncio
+
+import pytest
+from async_arducontroller import AsyncArduController
+from simulator import SimulatedArduino
+
+
+@pytest.fixture
+def sim():
+    sim = SimulatedArduino()
+    sim.start()
+    yield sim
+    sim.stop()
+
+
+@pytest.mark.parametrize("sequenced", [True, False])
+def test_concurrent_requests(sim, sequenced):
+    async def main():
+        ard = AsyncArduController(sim.port, sequenced=sequenced)
+        await ard.connect(startup_delay=0)
+        assert await ard.set_position(42) == 42
+        results = await asyncio.gather(*(ard.request_encoder() for _ in range(20)))
+        ard.close()
+        return results
+
+    # the PID gains are still zero, so the motor hasn't moved
+    assert asyncio.run(main()) == [[0]] * 20
+
+
+def test_timeout_forgets_request(sim):
+    async def main():
+        ard = AsyncArduController(sim.port)
+        await ard.connect(startup_delay=0)
+        # nothing answers an unknown command
+        with pytest.raises(asyncio.TimeoutError):
+            await ard.request(0x7F, b"", "i", timeout=0.05)
+        pending = len(ard.requests)
+        ard.close()
+        return pending
+
+    assert asyncio.run(main()) == 0
+
+
+def test_unplugged_board_fails_requests():
+    sim = SimulatedArduino()
+    sim.start()
+
+    async def main():
+        ard = AsyncArduController(sim.port)
+        await ard.connect(startup_delay=0)
+        # nothing answers an unknown command, so it's still waiting when the board goes
+        pending = asyncio.ensure_future(ard.request(0x7F, b"", "i", timeout=5))
+        await asyncio.sleep(0.05)
+        sim.stop()
+
+        with pytest.raises(ConnectionError):
+            await pending
+        assert ard.closed
+        with pytest.raises(ConnectionError):
+            await ard.request_encoder()
+
+    asyncio.run(main())
@@ -0,0 +1,177 @@
+"""Test sending several commands in one BATCH frame.
+
+Jackson Smith
+Final Project
+"""
+
+import pytest
+
+from arducontroller import (
+    MAX_BATCH_COMMANDS,
+    ArduController,
+    BadCommandError,
+    Command,
+    split_batch,
+)
+from byte_packing import pack_values
+from simulator import SimulatedArduino
+from test_shadow_state import count_frames
+
+PID = (2, 0, 0.5, 0, -100, 100, 0, 0)
+
+MODES = [{}, {"framed": True}, {"pipelined": True}, {"framed": True, "pipelined": True}]
+
+
+@pytest.fixture
+def sim():
+    sim = SimulatedArduino(motor_count=2)
+    sim.start()
+    yield sim
+    sim.stop()
+
+
+@pytest.mark.parametrize("options", MODES)
+def test_batch_is_one_frame(sim, options):
+    ard = ArduController(sim.port, **options)
+    try:
+        sent = count_frames(ard)
+        with ard.batch() as batch:
+            pid = batch.set_pid(*PID, motor=1)
+            echo = batch.set_position(7, motor=(0, 1))
+            batch.set_motor(-30, motor=1)
+            encoders = batch.request_encoders()
+
+        assert len(sent) == 1
+        assert pid.result() is None
+        assert echo.result() == [7]
+        assert encoders.result().tolist() == [motor.encoder for motor in sim.motors]
+        assert batch.results[:3] == [None, [7], None]
+
+        assert sim.motors[0].setpoint == 7
+        assert sim.motors[1].pid.KP == 2
+        assert sim.motors[1].mode == "analog"
+        assert sim.motors[1].speed == -30
+    finally:
+        ard.close()
+
+
+@pytest.mark.parametrize("options", [{}, {"pipelined": True}])
+def test_long_batch_is_split(sim, options):
+    ard = ArduController(sim.port, **options)
+    try:
+        sent = count_frames(ard)
+        with ard.batch() as batch:
+            for position in range(MAX_BATCH_COMMANDS + 1):
+                batch.set_position(position)
+            # too long for what's left of a frame
+            for _ in range(6):
+                batch.set_pid(*PID)
+
+        assert len(sent) == 3
+        assert batch.results == [[position] for position in range(MAX_BATCH_COMMANDS + 1)] + [None] * 6
+        assert sim.motors[0].setpoint == MAX_BATCH_COMMANDS
+    finally:
+        ard.close()
+
+
+def test_unchanged_settings_are_skipped(sim):
+    ard = ArduController(sim.port, write_interval=10)
+    try:
+        with ard.batch() as batch:
+            batch.set_pid(*PID)
+            batch.set_position(5)
+
+        sent = count_frames(ard)
+        with ard.batch() as batch:
+            batch.set_pid(*PID)
+            batch.set_position(5)
+        assert len(sent) == 0
+        assert batch.results == [None, [5]]
+        assert ard.stats.skipped_writes == 2
+
+        # batches aren't held for write_interval, and restore like any setting
+        with ard.batch() as batch:
+            batch.set_position(6)
+        assert sim.motors[0].setpoint == 6
+        assert ard.link_state[(Command.SET_POSITION, b"")] == (6,)
+    finally:
+        ard.close()
+
+
+def test_failed_block_sends_nothing(sim):
+    ard = ArduController(sim.port)
+    try:
+        sent = count_frames(ard)
+        with pytest.raises(KeyError):
+            with ard.batch() as batch:
+                future = batch.set_position(9)
+                raise KeyError
+        assert len(sent) == 0
+        assert future.cancelled()
+        assert sim.motors[0].setpoint != 9
+    finally:
+        ard.close()
+
+
+def test_only_short_commands_batch(sim):
+    ard = ArduController(sim.port)
+    try:
+        with ard.batch() as batch:
+            with pytest.raises(BadCommandError):
+                batch.add(Command.REQUEST_ENCODER_HISTORY, (0,))
+            with pytest.raises(BadCommandError):
+                batch.set_position(1, motor=9)
+    finally:
+        ard.close()
+
+    # the Arduino answers the same with an empty reply
+    assert split_batch(sim.handle_batch(b"\x05\x06\x00\x00\x00\x00\x01\x02")) == [b"", pack_values([0, 0])]
+
+
+def test_old_firmware(sim):
+    ard = ArduController(sim.port, framed=True)
+    try:
+        ard.firmware_version = 1
+        with pytest.raises(BadCommandError):
+            with ard.batch():
+                pass
+
+        # firmware that answers only part of a batch
+        ard.firmware_version = None
+        sim.handlers[Command.BATCH] = lambda data: b"\x00"
+        with pytest.raises(ConnectionError):
+            with ard.batch() as batch:
+                batch.set_position(3)
+                encoders = batch.request_encoders()
+        assert isinstance(encoders.exception(), ConnectionError)
+    finally:
+        ard.close()
+
+
+@pytest.mark.parametrize("options", [{}, {"pipelined": True}])
+def test_lost_reply_times_out(sim, options):
+    # drop every reply to a batch
+    dispatch = sim.dispatch
+    sim.dispatch = lambda frame: b"" if frame[0] & 0x7F == Command.BATCH else dispatch(frame)
+
+    ard = ArduController(sim.port, timeout=0.2, **options)
+    try:
+        with pytest.raises(TimeoutError):
+            with ard.batch() as batch:
+                encoders = batch.request_encoders()
+        assert isinstance(encoders.exception(), TimeoutError)
+        assert ard.stats.reconnects == 0
+
+        ard.close()
+        with pytest.raises(ConnectionError):
+            with ard.batch() as batch:
+                batch.request_encoders()
+    finally:
+        ard.close()
+
+
+def test_split_batch():
+    assert split_batch(b"") == []
+    assert split_batch(b"\x00\x02ab\x01c") == [b"", b"ab", b"c"]
+    with pytest.raises(ValueError):
+        split_batch(b"\x03ab")
@@ -0,0 +1,83 @@
+"""Test switching the link to a faster baud rate, and falling back.
+
+Jackson Smith
+Final Project
+"""
+
+import pytest
+
+from arducontroller import BAUD_CODEC, BAUD_VERIFY_TIME, ArduController
+from byte_packing import pack_values
+from simulator import BOOT_BAUD, SimulatedArduino
+
+
+def test_simulator_picks_first_supported_rate():
+    sim = SimulatedArduino(baud_rates=(1000000, 250000))
+    sim.stop()
+
+    assert sim.handle_negotiate_baud(pack_values([2000000, 1000000, 250000])) == BAUD_CODEC.pack(1000000)
+    assert sim.pending_baud == 1000000
+
+    sim.update_baud(0.0)
+    assert sim.baud == 1000000
+    # no ping in time, so back to the boot rate
+    sim.update_baud(BAUD_VERIFY_TIME + 0.1)
+    assert sim.baud == BOOT_BAUD
+
+    assert sim.handle_negotiate_baud(pack_values([2000000])) == BAUD_CODEC.pack(0)
+    assert sim.pending_baud is None
+
+
+def test_ping_confirms_rate():
+    sim = SimulatedArduino()
+    sim.stop()
+
+    sim.handle_negotiate_baud(pack_values([500000]))
+    sim.update_baud(0.0)
+    assert sim.handle_negotiate_baud(b"") == BAUD_CODEC.pack(500000)
+    sim.update_baud(BAUD_VERIFY_TIME + 0.1)
+    assert sim.baud == 500000
+
+
+@pytest.mark.parametrize("options", [{}, {"pipelined": True}, {"framed": True, "pipelined": True}])
+def test_controller_switches_to_fastest_common_rate(options):
+    sim = SimulatedArduino(baud_rate=BOOT_BAUD, baud_rates=(1000000, 500000))
+    sim.plant.position = 9
+    sim.start()
+
+    ard = ArduController(sim.port, max_baud=2000000, **options)
+    try:
+        assert ard.ser.baudrate == 1000000
+        assert sim.baud == 1000000
+        assert ard.request_encoder() == [9]
+    finally:
+        ard.close()
+        sim.stop()
+
+
+def test_controller_falls_back_when_fast_link_fails():
+    sim = SimulatedArduino(baud_rate=BOOT_BAUD, max_reliable_baud=500000)
+    sim.plant.position = 4
+    sim.start()
+
+    ard = ArduController(sim.port, max_baud=1000000, framed=True)
+    try:
+        assert ard.ser.baudrate == BOOT_BAUD
+        assert sim.baud == BOOT_BAUD
+        assert ard.request_encoder() == [4]
+    finally:
+        ard.close()
+        sim.stop()
+
+
+def test_no_negotiation_at_or_below_boot_rate():
+    sim = SimulatedArduino()
+    sim.start()
+
+    ard = ArduController(sim.port, max_baud=BOOT_BAUD)
+    try:
+        assert ard.negotiate_baud() == BOOT_BAUD
+        assert sim.baud == BOOT_BAUD
+    finally:
+        ard.close()
+        sim.stop()
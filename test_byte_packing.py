@@ -5,7 +5,7 @@ Final Project
 """
 
 import pytest
-from byte_packing import pack_values, unpack_values
+from byte_packing import Codec, compile_pattern, pack_values, unpack_values
 
 def test_pack_values():
     # Arrange
@@ -25,3 +25,30 @@ def test_unpack_values():
 
     assert packed_message == [1, 2.5, 2]
     assert msg == b""
+
+
+def test_codec_matches_pack_values():
+    codec = Codec("ifi")
+
+    assert codec.pack(1, 2.5, 2) == pack_values([1, 2.5, 2])
+    assert codec.unpack(b'\x01\x00\x00\x00\x00\x00 @\x02\x00\x00\x00') == (1, 2.5, 2)
+
+
+def test_codec_command_pack_into_offset():
+    codec = Codec("hd", command=4)
+    buffer = bytearray(16)
+
+    end = codec.pack_into(buffer, 2, -2, 0.5)
+
+    assert end == 2 + 1 + 2 + 8
+    values, offset = Codec("Bhd").unpack_from(buffer, 2)
+    assert values == (4, -2, 0.5)
+    assert offset == end
+
+
+def test_compile_pattern_cached_and_validated():
+    assert compile_pattern("bBhHiIqQfd") is compile_pattern("bBhHiIqQfd")
+    assert compile_pattern("bq").size == 9
+
+    with pytest.raises(ValueError):
+        compile_pattern("ix")
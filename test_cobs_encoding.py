@@ -5,7 +5,7 @@ Final Project
 """
 
 import pytest
-from cobs_encoder import cobs_decode, cobs_encode
+from cobs_encoder import CobsStreamDecoder, cobs_decode, cobs_encode
 
 def test_cobs_encode_distance_greater_than_length():
     input_bytes = bytearray([0x01, 0x02, 0x03, 0xFF, 0x01])
@@ -20,4 +20,38 @@ def test_cobs_encode_distance_greater_than_length_with_zero_padding():
 def test_cobs_decode_distance_greater_than_length_with_zero_padding():
     input_bytes = bytearray([0x00, 0x01, 0x02, 0x03, 0xFF, 0x01, 0x00])
     decoded_bytes = cobs_decode(input_bytes)
-    assert decoded_bytes == bytearray(b'\x00\x00\x03\x00\x01\x00')
\ No newline at end of file
+    assert decoded_bytes == bytearray(b'\x00\x00\x03\x00\x01\x00')
+
+def test_cobs_encode_long_run():
+    input_bytes = bytes(range(1, 256)) * 2
+    encoded_bytes = cobs_encode(input_bytes)
+    assert encoded_bytes[0] == 0xFF
+    assert encoded_bytes[-1] == 0
+    assert b"\x00" not in encoded_bytes[:-1]
+    assert cobs_decode(encoded_bytes) == input_bytes
+
+def test_cobs_round_trip_with_zeroes():
+    input_bytes = b"\x00\x01\x00\x00\x02" + bytes(300) + b"\x03"
+    assert cobs_decode(cobs_encode(input_bytes)) == input_bytes
+
+def test_stream_decoder_splits_chunks():
+    messages = [b"\x02\x00\x00\x00\x05", b"", b"\x01\x02", bytes(range(1, 256))]
+    stream = b"".join(cobs_encode(message) for message in messages)
+
+    decoder = CobsStreamDecoder()
+    frames = []
+    for i in range(0, len(stream), 7):
+        frames += decoder.feed(stream[i:i + 7])
+
+    assert frames == messages
+    assert decoder.pending == b""
+
+def test_stream_decoder_drops_oversized_frames():
+    decoder = CobsStreamDecoder(max_frame=8)
+    assert decoder.feed(b"\xff" * 20) == []
+    assert decoder.dropped == 1
+    # the rest of the dropped frame isn't taken for a new one
+    assert decoder.feed(b"\xff" * 5) == []
+    assert decoder.feed(b"\xff\x00" + cobs_encode(b"\x04")) == [b"\x04"]
+    assert decoder.feed(cobs_encode(b"\x05")) == [b"\x05"]
+    assert decoder.dropped == 1
@@ -0,0 +1,108 @@
+"""Test the HELLO handshake and reconnecting after the port fails.
+
+Jackson Smith
+Final Project
+"""
+
+import time
+
+import pytest
+
+from arducontroller import HELLO_CODEC, ArduController, Command
+from cobs_encoder import cobs_decode
+from simulator import PROTOCOL_VERSION, SimulatedArduino
+
+
+def test_hello_resets_link():
+    sim = SimulatedArduino(motor_count=2)
+    sim.stop()
+    sim.framed = True
+    sim.telemetry_period = 0.01
+
+    reply = cobs_decode(sim.receive_frame(bytes([Command.HELLO])))
+
+    assert HELLO_CODEC.unpack(reply) == (Command.HELLO, PROTOCOL_VERSION, 2)
+    assert not sim.framed
+    assert sim.telemetry_period == 0
+
+
+def test_handshake_waits_only_as_long_as_boot():
+    sim = SimulatedArduino(motor_count=2, boot_time=0.3)
+    sim.start()
+
+    start = time.perf_counter()
+    ard = ArduController(sim.port)
+    try:
+        assert 0.3 <= time.perf_counter() - start < 1
+        assert ard.firmware_version == PROTOCOL_VERSION
+        assert ard.motor_count == 2
+        assert ard.request_encoder() == [0, 0]
+    finally:
+        ard.close()
+        sim.stop()
+
+
+def test_handshake_times_out_without_firmware():
+    # nothing serves the port
+    sim = SimulatedArduino()
+
+    with pytest.raises(ConnectionError):
+        ArduController(sim.port, connect_timeout=0.2)
+    sim.stop()
+
+
+@pytest.mark.parametrize("options", [{}, {"pipelined": True}, {"framed": True, "pipelined": True}])
+def test_reconnect_restores_settings(options):
+    sim = SimulatedArduino(motor_count=2)
+    sim.motors[1].plant.position = 7
+    sim.start()
+
+    ard = ArduController(sim.port, **options)
+    try:
+        ard.set_pid(2, 0, 0, 0, -100, 100, 0, 0, motor=1)
+        ard.set_motor(30, motor=0)
+        ard.set_position(5, motor=(0, 1))
+        # motor 1 holds still once restored, so the read below doesn't race it
+        ard.set_position(7, motor=1)
+
+        # the board resets and the port drops out from under us
+        sim.reset()
+        ard.ser.close()
+
+        assert ard.request_encoder()[1] == 7
+        assert ard.stats.reconnects == 1
+        assert [motor.mode for motor in sim.motors] == ["position", "position"]
+        assert [motor.setpoint for motor in sim.motors] == [5, 7]
+        assert sim.motors[1].pid.KP == 2
+        assert sim.framed == bool(options.get("framed"))
+    finally:
+        ard.close()
+        sim.stop()
+
+
+def test_lost_reply_is_not_a_lost_port():
+    sim = SimulatedArduino()
+    sim.start()
+
+    # drop the reply to the first command
+    dispatch = sim.dispatch
+    dropped = []
+
+    def drop_first(frame):
+        if dropped:
+            return dispatch(frame)
+        dropped.append(frame)
+        return b""
+
+    sim.dispatch = drop_first
+
+    ard = ArduController(sim.port, pipelined=True, timeout=0.2)
+    try:
+        with pytest.raises(TimeoutError):
+            ard.set_position(5)
+        assert ard.stats.reconnects == 0
+        assert ard.set_position(6) == [6]
+    finally:
+        ard.close()
+        sim.stop()
+
@@ -0,0 +1,84 @@
+"""Test driving several boards from one ControllerPool.
+
+Jackson Smith
+Final Project
+"""
+
+import time
+
+import pytest
+from controller_pool import ControllerPool
+from simulator import SimulatedArduino
+
+
+@pytest.fixture
+def sims():
+    sims = [SimulatedArduino(motor_count=2) for _ in range(3)]
+    for i, sim in enumerate(sims):
+        sim.motors[1].plant.position = 100 * i
+        sim.start()
+    yield sims
+    for sim in sims:
+        sim.stop()
+
+
+def test_fan_out_request_encoders(sims):
+    with ControllerPool() as pool:
+        for i, sim in enumerate(sims):
+            pool.add(sim.port, name=f"board{i}")
+        pool.start(startup_delay=0)
+
+        results = pool.request_encoders()
+
+    assert sorted(results) == ["board0", "board1", "board2"]
+    assert [list(results[f"board{i}"]) for i in range(3)] == [[0, 0], [0, 100], [0, 200]]
+
+
+def test_commands_reach_their_own_board(sims):
+    with ControllerPool() as pool:
+        boards = [pool.add(sim.port) for sim in sims]
+        pool.start(startup_delay=0)
+
+        assert boards[1].set_position(25, motor=1).result(1) == [25]
+        boards[2].set_motor(-40).result(1)
+
+    assert [sim.motors[1].setpoint for sim in sims] == [0, 25, 0]
+    assert [sim.motors[0].speed for sim in sims] == [0, 0, -40]
+
+
+def test_silent_board_times_out_alone(sims):
+    sims[0].running = False
+    sims[0].thread.join()
+
+    with ControllerPool() as pool:
+        for i, sim in enumerate(sims):
+            pool.add(sim.port, name=i)
+        pool.start(startup_delay=0)
+
+        results = pool.request_encoders(timeout=0.2)
+
+    assert isinstance(results[0], TimeoutError)
+    assert list(results[1]) == [0, 100]
+
+
+def test_unplugged_board_fails_alone(sims):
+    with ControllerPool() as pool:
+        boards = [pool.add(sim.port, name=i) for i, sim in enumerate(sims)]
+        pool.start(startup_delay=0)
+
+        # closed here, so the fixture doesn't close it again
+        sims.pop(1).stop()
+        results = pool.request_encoders(timeout=0.5)
+        assert isinstance(results[1], OSError)
+        assert list(results[2]) == [0, 200]
+
+        # the I/O thread stops watching it rather than spinning on it
+        deadline = time.monotonic() + 1
+        while not boards[1].closed and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert boards[1].closed
+        assert boards[1].fd not in pool.selector.get_map()
+
+        future = boards[1].request_encoders()
+        assert isinstance(future.exception(0), ConnectionError)
+        assert list(pool.request_encoders()[0]) == [0, 0]
@@ -0,0 +1,47 @@
+"""Test min/max decimation.
+
+Jackson Smith
+Final Project
+"""
+
+import numpy as np
+
+from decimation import minmax_decimate
+
+
+def test_small_inputs_are_unchanged():
+    x = np.arange(10.0)
+    ys = [x * 2]
+    out_x, out_ys = minmax_decimate(x, ys, 0, 10, 100)
+    assert out_x is x
+    assert out_ys is ys
+
+
+def test_keeps_extremes_of_every_column():
+    rng = np.random.default_rng(1)
+    x = np.sort(rng.uniform(0, 10, 5000))
+    y = rng.normal(0, 1, 5000)
+    y[1234] = 50
+    y[4321] = -50
+
+    out_x, (out_y,) = minmax_decimate(x, [y], 0, 10, 100)
+
+    assert len(out_x) == len(out_y) <= 200
+    assert np.all(np.diff(out_x) >= 0)
+    assert out_y.max() == 50
+    assert out_y.min() == -50
+
+    # every column's extremes survive
+    bins = (x * 10).astype(int)
+    for column in range(100):
+        in_column = (out_x >= column / 10) & (out_x < (column + 1) / 10)
+        assert out_y[in_column].min() == y[bins == column].min()
+        assert out_y[in_column].max() == y[bins == column].max()
+
+
+def test_lines_share_decimated_x():
+    x = np.linspace(0, 1, 1000)
+    out_x, out_ys = minmax_decimate(x, [x, -x], 0, 1, 10)
+    assert len(out_ys) == 2
+    assert len(out_ys[0]) == len(out_ys[1]) == len(out_x) == 20
+    assert out_x[0] == 0 and out_x[-1] == 1
@@ -0,0 +1,45 @@
+"""Test the fair lock.
+
+Jackson Smith
+Final Project
+"""
+
+import threading
+import time
+
+from fair_lock import FairLock
+
+
+def test_fair_lock_serves_in_order():
+    lock = FairLock()
+    order = []
+    lock.acquire()
+
+    threads = []
+    for i in range(5):
+        thread = threading.Thread(target=lambda i=i: (lock.acquire(), order.append(i), lock.release()))
+        thread.start()
+        threads.append(thread)
+        # make sure each thread has taken its ticket before the next starts
+        while lock.next_ticket != i + 2:
+            time.sleep(0.001)
+
+    lock.release()
+    for thread in threads:
+        thread.join()
+
+    assert order == [0, 1, 2, 3, 4]
+    assert lock.acquisitions == 6
+    assert not lock.locked()
+
+
+def test_fair_lock_timeout_skips_abandoned_ticket():
+    lock = FairLock()
+    lock.acquire()
+
+    assert lock.acquire(timeout=0.01) is False
+    assert lock.timeouts == 1
+
+    lock.release()
+    assert not lock.locked()
+    assert lock.acquire(timeout=0.01) is True
@@ -0,0 +1,106 @@
+"""Test length and CRC framing, and recovering from damaged frames.
+
+Jackson Smith
+Final Project
+"""
+
+import pytest
+
+from arducontroller import ArduController, Command
+from cobs_encoder import cobs_encode, cobs_decode
+from framing import NACK, FrameError, crc16, frame, unframe
+from simulator import SimulatedArduino
+
+
+def table_crc16(data):
+    """CRC16 computed like firmware.ino, a byte at a time from a table."""
+    table = []
+    for i in range(256):
+        crc = i << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021 if crc & 0x8000 else crc << 1) & 0xFFFF
+        table.append(crc)
+
+    crc = 0xFFFF
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFF) ^ table[((crc >> 8) ^ byte) & 0xFF]
+    return crc
+
+
+def test_crc16_matches_firmware_table():
+    assert crc16(b"123456789") == 0x29B1
+    for data in (b"", b"\x00", bytes(range(256)), b"\xff" * 7):
+        assert crc16(data) == table_crc16(data)
+
+
+def test_frame_round_trip():
+    for payload in (b"", b"\x02", bytes(range(256)) * 3):
+        framed = frame(payload)
+        assert len(framed) == len(payload) + 4
+        assert unframe(framed) == payload
+    assert unframe(NACK) is None
+
+
+def test_unframe_rejects_damage():
+    framed = bytearray(frame(b"\x04\x01\x02\x03\x04"))
+    for i in range(len(framed)):
+        for bit in range(8):
+            damaged = bytearray(framed)
+            damaged[i] ^= 1 << bit
+            with pytest.raises(FrameError):
+                unframe(damaged)
+
+    with pytest.raises(FrameError):
+        unframe(framed[:-1])
+    with pytest.raises(FrameError):
+        unframe(b"\x00\x00")
+
+
+def test_simulator_nacks_and_resends():
+    sim = SimulatedArduino()
+    sim.stop()
+    sim.plant.position = 12
+
+    assert sim.receive_frame(bytes([Command.SET_FRAMING, 1])) == cobs_encode(frame(b"\x01"))
+
+    reply = sim.receive_frame(frame(bytes([Command.REQUEST_ENCODER])))
+    assert unframe(cobs_decode(reply)) == (12).to_bytes(4, "little")
+
+    damaged = bytearray(frame(bytes([Command.REQUEST_ENCODER])))
+    damaged[2] ^= 0x01
+    assert sim.receive_frame(damaged) == cobs_encode(NACK)
+    assert sim.bad_frames == 1
+
+    # a NACK gets the last good reply again
+    assert sim.receive_frame(NACK) == reply
+
+    # commands with no reply are acknowledged in framed mode
+    ack = sim.receive_frame(frame(bytes([Command.SET_MOTOR]) + (0).to_bytes(4, "little")))
+    assert unframe(cobs_decode(ack)) == b""
+
+    sim.receive_frame(bytes([Command.SET_FRAMING, 0]))
+    assert sim.receive_frame(bytes([Command.REQUEST_ENCODER])) == cobs_encode((12).to_bytes(4, "little"))
+
+
+@pytest.mark.parametrize("pipelined", [False, True])
+def test_framed_controller_survives_noise(pipelined):
+    sim = SimulatedArduino(motor_count=2, error_rate=0.05, seed=3)
+    sim.motors[0].plant.position = 5
+    sim.motors[1].plant.position = -7
+    sim.start()
+
+    ard = ArduController(sim.port, framed=True, pipelined=pipelined)
+    try:
+        for _ in range(200):
+            assert ard.request_encoder() == [5, -7]
+        for position in range(20):
+            reply = ard.set_position(position, motor=1)
+            assert reply == [position]
+        assert sim.motors[1].setpoint == 19
+    finally:
+        ard.close()
+        sim.stop()
+
+    stats = ard.stats
+    assert stats.timeouts == 0
+    assert stats.bad_frames + stats.nacks_received > 0
@@ -0,0 +1,69 @@
+"""Test requesting and decoding encoder history.
+
+Jackson Smith
+Final Project
+"""
+
+import time
+
+import pytest
+
+from arducontroller import HISTORY_DTYPE, ArduController, decode_history
+from byte_packing import pack_values
+from simulator import HISTORY_LENGTH, HISTORY_PER_REPLY, SimulatedArduino
+
+
+def test_decode_history_reply():
+    sim = SimulatedArduino()
+    for i in range(10):
+        sim.plant.position = 2 * i + 2
+        sim.record_sample(sim.start_time + i * 0.005)
+    sim.stop()
+
+    start, samples = decode_history(sim.handle_history_request(pack_values([4])))
+
+    assert start == 4
+    assert samples.dtype == HISTORY_DTYPE
+    assert list(samples["encoder"]) == [10, 12, 14, 16, 18, 20]
+    assert list(samples["time"]) == [20000, 25000, 30000, 35000, 40000, 45000]
+
+
+def test_history_cursor_clamped_to_ring_buffer():
+    sim = SimulatedArduino()
+    for i in range(HISTORY_LENGTH + 10):
+        sim.record_sample(sim.start_time)
+    sim.stop()
+
+    start, samples = decode_history(sim.handle_history_request(pack_values([0])))
+
+    assert start == 10
+    assert len(samples) == HISTORY_PER_REPLY
+
+
+@pytest.mark.parametrize("pipelined", [False, True])
+def test_request_history(pipelined):
+    sim = SimulatedArduino(motor_count=2)
+    sim.motors[0].plant.position = 42
+    sim.motors[1].plant.position = -5
+    sim.start()
+
+    ard = ArduController(sim.port, pipelined=pipelined, timeout=0.2)
+    try:
+        time.sleep(0.05)
+        start, samples = ard.request_history(0)
+        assert start == 0
+        assert len(samples) > 0
+        # only motor 0 is recorded
+        assert set(samples["encoder"]) == {42}
+        assert ard.history_cursor == len(samples)
+
+        sim.running = False
+        sim.thread.join()
+        with pytest.raises(TimeoutError):
+            ard.request_history()
+        assert ard.stats.timeouts == 1
+    finally:
+        ard.close()
+        sim.stop()
+
+    assert ard.request_history() is None
@@ -0,0 +1,94 @@
+"""Test fitting motor models to recorded runs.
+
+Jackson Smith
+Final Project
+"""
+
+import numpy as np
+import pytest
+
+from identification import fit_fopdt, fit_second_order, from_log, resample
+from pid import write_analog
+from recorder import TelemetryLog, TelemetryRecorder
+from simulator import CYCLE_DELAY, MotorPlant
+from tuning import grid, simulate
+
+
+def record_run(plant, count, seed=0):
+    """Drive a plant with held random speeds, like scripted set_motor calls."""
+    rng = np.random.default_rng(seed)
+    speeds = np.repeat(rng.integers(-120, 121, count // 40 + 1), rng.integers(20, 60, count // 40 + 1))[:count]
+    encoders = np.empty(count)
+    for k, speed in enumerate(speeds):
+        encoders[k] = plant.encoder
+        plant.step(write_analog(speed), CYCLE_DELAY)
+    return np.arange(count) * CYCLE_DELAY, speeds, encoders
+
+
+def test_fopdt_finds_dead_time():
+    run = record_run(MotorPlant(30.0, 0.04, deadband=0, dead_time=0.015), 6000)
+    result = fit_fopdt(*run)
+
+    assert result.model == "fopdt"
+    assert result.gain == pytest.approx(30.0, rel=0.02)
+    assert result.time_constant == pytest.approx(0.04, rel=0.03)
+    assert result.dead_time == pytest.approx(0.015)
+    assert result.deadband == 0
+    assert result.r_squared > 0.99
+
+
+def test_second_order_finds_deadband():
+    run = record_run(MotorPlant(20.0, 0.05, deadband=25), 6000)
+    result = fit_second_order(*run)
+
+    assert result.model == "second_order"
+    assert result.gain == pytest.approx(20.0, rel=0.02)
+    assert result.time_constant == pytest.approx(0.05, rel=0.03)
+    # the run can only tell deadbands apart at the speeds it used
+    levels = np.unique(np.abs(run[1]))
+    assert result.deadband == levels[levels <= 25].max()
+    assert result.dead_time == 0
+
+    # a model that ignores friction fits worse
+    assert fit_fopdt(*run, max_dead_time=0).rms_error > result.rms_error
+
+
+def test_fitted_plant_drives_simulation():
+    run = record_run(MotorPlant(20.0, 0.05, deadband=10, dead_time=0.01), 4000)
+    plant = fit_fopdt(*run).plant()
+
+    assert isinstance(plant, MotorPlant)
+    assert plant.dead_time == pytest.approx(0.01)
+    scores = simulate(grid(KP=[0.5]), plant, 500, duration=1.0)
+    assert np.isfinite(scores[0]["settling_time"])
+
+
+def test_resample_holds_commands():
+    dt, command, encoder = resample([0.0, 0.01, 0.035, 0.04], [1, 2, 3, 4], [0, 10, 35, 40], dt=0.01)
+
+    assert dt == 0.01
+    assert command.tolist() == [1, 2, 2, 2, 4]
+    assert encoder.tolist() == pytest.approx([0, 10, 20, 30, 40])
+
+
+def test_from_log(tmp_path):
+    path = str(tmp_path / "run.arlog")
+    time, speeds, encoders = record_run(MotorPlant(), 200)
+    with TelemetryRecorder(path, motor_count=2) as recorder:
+        for t, speed, encoder in zip(time, speeds, encoders):
+            recorder.record(t, [encoder, 0], [0, 0], [speed, np.nan])
+
+    log = TelemetryLog(path)
+    logged_time, command, encoder = from_log(log)
+    assert logged_time.tolist() == time.tolist()
+    assert command.tolist() == speeds.tolist()
+    assert encoder.tolist() == encoders.tolist()
+
+    with pytest.raises(ValueError):
+        from_log(log, motor=1)
+
+
+def test_no_motion_is_not_a_fit():
+    time = np.arange(500) * CYCLE_DELAY
+    with pytest.raises(ValueError):
+        fit_second_order(time, np.zeros(500), np.zeros(500))
@@ -0,0 +1,121 @@
+"""Test link statistics.
+
+Jackson Smith
+Final Project
+"""
+
+import os
+import tty
+from concurrent.futures import Future
+
+import pytest
+import serial
+
+from cobs_encoder import cobs_check, cobs_encode
+from link_stats import LatencyHistogram, LinkStats
+from serial_engine import SerialEngine
+
+
+@pytest.fixture
+def pty_serial():
+    master, slave = os.openpty()
+    tty.setraw(master)
+    ser = serial.Serial(os.ttyname(slave), 115200, timeout=1)
+    yield master, ser
+    ser.close()
+    os.close(master)
+    os.close(slave)
+
+
+def test_histogram_percentiles_within_bucket_width():
+    histogram = LatencyHistogram()
+    for us in range(1, 10001):
+        histogram.record(us / 1e6)
+
+    assert histogram.count == 10000
+    assert histogram.min == pytest.approx(1)
+    assert histogram.max == pytest.approx(10000)
+    assert histogram.mean == pytest.approx(5000.5)
+    for percent in (50, 90, 99):
+        exact = percent * 100
+        assert exact <= histogram.percentile(percent) <= exact * 1.07
+    assert histogram.percentile(100) == pytest.approx(10000)
+
+
+def test_histogram_extremes_and_reset():
+    histogram = LatencyHistogram()
+    assert histogram.percentile(50) == 0
+
+    histogram.record(0)
+    histogram.record(1e6)
+    assert histogram.counts[0] == 1
+    assert histogram.percentile(100) == pytest.approx(1e12)
+
+    histogram.reset()
+    assert histogram.count == 0
+    assert sum(histogram.counts) == 0
+
+
+def test_stats_time_replies_and_count_timeouts():
+    stats = LinkStats({2: "REQUEST_ENCODER"})
+    stats.begin(2)
+    stats.end()
+    # a reply with nothing sent isn't timed
+    stats.end()
+    stats.begin(2)
+    stats.end(False)
+
+    snapshot = stats.snapshot()
+    assert snapshot["latency"]["REQUEST_ENCODER"]["count"] == 1
+    assert snapshot["timeouts"] == 1
+    assert "request_encoder" in stats.summary()
+
+    stats.reset()
+    assert stats.snapshot()["latency"] == {}
+
+
+def test_timer_skips_failed_and_cancelled_futures():
+    stats = LinkStats()
+    for outcome in ("result", "exception", "cancel"):
+        future = Future()
+        future.add_done_callback(stats.timer(4))
+        if outcome == "result":
+            future.set_result([1])
+        elif outcome == "exception":
+            future.set_exception(ConnectionError())
+        else:
+            future.cancel()
+
+    assert stats.latency[4].count == 1
+
+
+def test_cobs_check():
+    for data in (b"", b"\x00", b"\x01\x02\x00\x03", bytes(range(1, 256)) * 2):
+        assert cobs_check(cobs_encode(data)[:-1])
+    assert not cobs_check(b"\x05\x01")
+    assert not cobs_check(b"\x02\x01\x00")
+
+
+def test_engine_counts_traffic(pty_serial):
+    master, ser = pty_serial
+    stats = LinkStats()
+    engine = SerialEngine(ser, stats=stats)
+    engine.start()
+
+    good = cobs_encode(b"\x01\x00\x02")
+    # split the frame across chunks, then send a damaged one
+    os.write(master, good[:2])
+    assert engine.receive(0.1) is None
+    os.write(master, good[2:] + b"\x09\x01\x00")
+    assert engine.receive(1) == b"\x01\x00\x02"
+    engine.receive(1)
+
+    engine.send(cobs_encode(b"\x02"))
+    os.read(master, 1024)
+    engine.stop()
+
+    assert stats.frames_in == 2
+    assert stats.bytes_in == len(good) + 3
+    assert stats.decode_failures == 1
+    assert stats.frames_out == 1
+    assert stats.bytes_out == 3
@@ -0,0 +1,84 @@
+"""Test addressing several motors.
+
+Jackson Smith
+Final Project
+"""
+
+import asyncio
+
+import pytest
+from arducontroller import ArduController, BadCommandError, Command, decode_telemetry, motor_mask
+from async_arducontroller import AsyncArduController
+from byte_packing import pack_values
+from simulator import SimulatedArduino
+
+
+def test_motor_mask():
+    assert motor_mask(0) == b""
+    assert motor_mask(2) == bytes([0b100])
+    assert motor_mask([0, 3]) == bytes([0b1001])
+    with pytest.raises(BadCommandError):
+        motor_mask(8)
+
+
+def test_mask_selects_motors():
+    sim = SimulatedArduino(motor_count=4)
+    sim.stop()
+
+    sim.dispatch(bytes([Command.SET_MOTOR]) + pack_values([50]))
+    sim.dispatch(bytes([Command.SET_MOTOR]) + pack_values([-80]) + motor_mask([1, 3]))
+
+    assert [motor.speed for motor in sim.motors] == [50, -80, 0, -80]
+
+
+def test_telemetry_covers_every_motor():
+    sim = SimulatedArduino(motor_count=3)
+    sim.stop()
+    for i, motor in enumerate(sim.motors):
+        motor.plant.position = 10 * i
+        motor.setpoint = i
+
+    raw, motors = decode_telemetry(sim.telemetry_frame(sim.start_time + 0.001))
+
+    assert raw == 1000
+    assert list(motors["encoder"]) == [0, 10, 20]
+    assert list(motors["setpoint"]) == [0, 1, 2]
+
+
+@pytest.mark.parametrize("sequenced", [True, False])
+def test_one_reply_holds_every_encoder(sequenced):
+    sim = SimulatedArduino(motor_count=4)
+    for i, motor in enumerate(sim.motors):
+        motor.plant.position = -i
+    sim.start()
+
+    async def main():
+        ard = AsyncArduController(sim.port, sequenced=sequenced)
+        await ard.connect(startup_delay=0)
+        encoders = await ard.request_encoders()
+        ard.close()
+        return encoders
+
+    try:
+        assert list(asyncio.run(main())) == [0, -1, -2, -3]
+    finally:
+        sim.stop()
+
+
+def test_missing_encoder_reply_raises():
+    sim = SimulatedArduino(motor_count=2)
+    sim.start()
+    ard = ArduController(sim.port, timeout=0.1)
+    try:
+        assert ard.request_encoder() == [0, 0]
+        sim.running = False
+        sim.thread.join()
+
+        # not an empty or partly filled array
+        with pytest.raises(TimeoutError):
+            ard.request_encoders()
+        assert ard.stats.timeouts == 1
+        assert ard.stats.reconnects == 0
+    finally:
+        ard.close()
+        sim.stop()
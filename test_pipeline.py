@@ -0,0 +1,48 @@
+"""Test matching sequenced replies to requests.
+
+Jackson Smith
+Final Project
+"""
+
+from concurrent.futures import Future
+
+import pytest
+from byte_packing import pack_values
+from pipeline import SEQUENCE_IDS, PipelineFullError, RequestTable
+
+
+def test_replies_matched_out_of_order():
+    table = RequestTable()
+    first, second = Future(), Future()
+    first_id = table.add(first, "i")
+    second_id = table.add(second, "if")
+
+    assert table.resolve(bytes([second_id]) + pack_values([7, 0.5]))
+    assert table.resolve(bytes([first_id]) + pack_values([-3]))
+
+    assert first.result(0) == [-3]
+    assert second.result(0) == [7, 0.5]
+    assert len(table) == 0
+
+
+def test_stray_and_discarded_replies_ignored():
+    table = RequestTable()
+    future = Future()
+    seq = table.add(future, "i")
+    table.discard(seq)
+
+    assert not table.resolve(bytes([seq]) + pack_values([1]))
+    assert table.stray_replies == 1
+    assert not future.done()
+
+
+def test_table_full():
+    table = RequestTable()
+    for _ in range(SEQUENCE_IDS):
+        table.add(Future())
+
+    with pytest.raises(PipelineFullError):
+        table.add(Future())
+
+    table.fail_all(ConnectionError())
+    assert len(table) == 0
@@ -0,0 +1,70 @@
+"""Test recording and replaying telemetry logs.
+
+Jackson Smith
+Final Project
+"""
+
+import numpy as np
+import pytest
+from recorder import TelemetryLog, TelemetryRecorder
+
+
+def write_log(path, count, motor_count=2, chunk_records=16):
+    with TelemetryRecorder(str(path), motor_count, chunk_records) as recorder:
+        for i in range(count):
+            recorder.record(i * 0.01, [i, -i], [0, 5])
+
+
+def test_round_trip(tmp_path):
+    path = tmp_path / "session.arlog"
+    write_log(path, 50)
+
+    log = TelemetryLog(str(path))
+    assert len(log) == 50
+    assert log.motor_count == 2
+    assert len(log.index) == 4
+    assert list(log.records[7]["encoder"]) == [7, -7]
+    assert list(log.records[7]["error"]) == [7, -12]
+    assert np.isnan(log.records[7]["command"]).all()
+
+
+def test_between_uses_index(tmp_path):
+    path = tmp_path / "session.arlog"
+    write_log(path, 100)
+    log = TelemetryLog(str(path))
+
+    records = log.between(0.155, 0.40)
+    assert records["encoder"][0, 0] == 16
+    assert records["encoder"][-1, 0] == 39
+    assert len(log.between(5, None)) == 0
+    assert log.find(-1) == 0
+
+
+def test_partial_record_ignored(tmp_path):
+    path = tmp_path / "session.arlog"
+    write_log(path, 20)
+    with open(path, "ab") as file:
+        file.write(b"\1\2\3")
+
+    assert len(TelemetryLog(str(path))) == 20
+
+
+def test_times_must_not_go_backwards(tmp_path):
+    with TelemetryRecorder(str(tmp_path / "session.arlog")) as recorder:
+        recorder.record(1.0, [0], [0])
+        with pytest.raises(ValueError):
+            recorder.record(0.5, [0], [0])
+
+
+def test_replay_paces_batches(tmp_path):
+    path = tmp_path / "session.arlog"
+    write_log(path, 100)
+    log = TelemetryLog(str(path))
+
+    now = [0.0]
+    batches = []
+    log.replay(batches.append, speed=2, clock=lambda: now[0], sleep=lambda s: now.__setitem__(0, now[0] + s))
+
+    assert sum(len(batch) for batch in batches) == 100
+    # 0.99 s of log at double speed
+    assert now[0] == pytest.approx(0.495, abs=0.011)
@@ -0,0 +1,64 @@
+"""Test the live data buffers.
+
+Jackson Smith
+Final Project
+"""
+
+import random
+
+from ring_buffer import TimeRingBuffer, WindowedExtrema
+
+
+def test_ring_buffer_window_is_contiguous_after_wrapping():
+    buffer = TimeRingBuffer(2, capacity=4)
+    for t in range(10):
+        buffer.append(t, (t, -t))
+        buffer.evict_before(t - 2)
+
+    assert list(buffer.times) == [7, 8, 9]
+    assert list(buffer.column(0)) == [7, 8, 9]
+    assert list(buffer.column(1)) == [-7, -8, -9]
+    assert (buffer.start, buffer.end) == (7, 10)
+    assert buffer.capacity == 4
+
+
+def test_ring_buffer_grows_when_full():
+    buffer = TimeRingBuffer(1, capacity=2)
+    for t in range(5):
+        buffer.append(t, (t * 10,))
+
+    assert buffer.capacity == 8
+    assert list(buffer.times) == [0, 1, 2, 3, 4]
+    assert list(buffer.column(0)) == [0, 10, 20, 30, 40]
+    assert buffer.newest_time == 4
+
+
+def test_windowed_extrema_match_brute_force():
+    rng = random.Random(3)
+    extrema = WindowedExtrema()
+    values = []
+    for i in range(500):
+        values.append(rng.uniform(-100, 100))
+        extrema.push(i, values[-1])
+        start = max(0, i - 37)
+        extrema.evict_before(start)
+
+        assert extrema.min == min(values[start:])
+        assert extrema.max == max(values[start:])
+
+
+def test_ring_buffer_extend_matches_append():
+    appended = TimeRingBuffer(2, capacity=4)
+    extended = TimeRingBuffer(2, capacity=4)
+    t = 0
+    for batch in (3, 2, 6, 1):
+        rows = [(t + i, (t + i, -(t + i))) for i in range(batch)]
+        for time, values in rows:
+            appended.append(time, values)
+        extended.extend([time for time, _ in rows], [values for _, values in rows])
+        t += batch
+        appended.evict_before(t - 3)
+        extended.evict_before(t - 3)
+
+        assert list(extended.times) == list(appended.times)
+        assert list(extended.column(1)) == list(appended.column(1))
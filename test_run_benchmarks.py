@@ -0,0 +1,23 @@
+"""Test benchmark regression checks.
+
+Jackson Smith
+Final Project
+"""
+
+from run_benchmarks import compare, direction
+
+
+def test_metric_direction():
+    assert direction("transactions.fast_commands_per_s") == 1
+    assert direction("cobs_encoding.encode_ns_per_byte") == -1
+    assert direction("liveplot.draw_ms") == -1
+    assert direction("something.count") == 0
+
+
+def test_compare_flags_only_regressions_past_threshold():
+    baseline = {"a_per_s": 100, "b_us": 10, "c_us": 10, "d_per_s": 100}
+    metrics = {"a_per_s": 70, "b_us": 11, "c_us": 5, "d_per_s": 150, "new_us": 1}
+
+    regressions = compare(metrics, baseline, 0.2)
+
+    assert [name for name, *_ in regressions] == ["a_per_s"]
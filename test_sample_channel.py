@@ -0,0 +1,56 @@
+"""Test the sample channel between acquisition and the Tk loop.
+
+Jackson Smith
+Final Project
+"""
+
+import threading
+
+from sample_channel import SampleChannel
+
+
+def test_swap_takes_everything_since_last_swap():
+    channel = SampleChannel(3, capacity=8)
+    channel.push(0.5, (1, 2), [3])
+    channel.push(0.6, [4], (5, 6))
+
+    times, values = channel.swap()
+    assert list(times) == [0.5, 0.6]
+    assert values.tolist() == [[1, 2, 3], [4, 5, 6]]
+
+    channel.push(0.7, (7, 8, 9))
+    times, values = channel.swap()
+    assert list(times) == [0.7]
+    assert len(channel.swap()[0]) == 0
+
+
+def test_full_channel_counts_overruns():
+    channel = SampleChannel(1, capacity=2)
+    assert channel.push(0, (0,))
+    assert channel.push(1, (1,))
+    assert not channel.push(2, (2,))
+
+    assert channel.overruns == 1
+    assert list(channel.swap()[0]) == [0, 1]
+    assert channel.push(3, (3,))
+
+
+def test_no_rows_lost_between_threads():
+    channel = SampleChannel(1, capacity=100_000)
+    count = 20_000
+
+    def produce():
+        for i in range(count):
+            channel.push(i, (i,))
+
+    producer = threading.Thread(target=produce)
+    producer.start()
+    received = []
+    while producer.is_alive() or len(channel):
+        times, _ = channel.swap()
+        received.extend(times.tolist())
+    producer.join()
+    received.extend(channel.swap()[0].tolist())
+
+    assert received == list(range(count))
+    assert channel.overruns == 0
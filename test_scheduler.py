@@ -0,0 +1,50 @@
+"""Test the fixed-rate scheduler.
+
+Jackson Smith
+Final Project
+"""
+
+import pytest
+from scheduler import RateScheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def make_scheduler(rate):
+    clock = FakeClock()
+    return RateScheduler(rate, spin=0, clock=clock, sleep=clock.sleep), clock
+
+
+def test_deadlines_do_not_drift():
+    scheduler, clock = make_scheduler(100)
+    deadlines = []
+    for _ in range(50):
+        deadlines.append(scheduler.wait())
+        # the loop body takes most of a period
+        clock.now += 0.009
+
+    assert deadlines == pytest.approx([i * 0.01 for i in range(50)])
+    assert scheduler.missed == 0
+    assert scheduler.stats()["achieved_rate"] == pytest.approx(100)
+
+
+def test_missed_ticks_are_skipped_not_bunched():
+    scheduler, clock = make_scheduler(100)
+    scheduler.wait()
+    clock.now += 0.035
+    late = scheduler.wait()
+    after = scheduler.wait()
+
+    assert late == pytest.approx(0.03)
+    assert after == pytest.approx(0.04)
+    assert scheduler.missed == 2
+    assert scheduler.stats()["jitter_max_us"] == pytest.approx(5000)
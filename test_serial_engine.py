@@ -0,0 +1,70 @@
+"""Test the full-duplex serial engine.
+
+Jackson Smith
+Final Project
+"""
+
+import os
+import tty
+
+import pytest
+import serial
+
+from cobs_encoder import cobs_encode, CobsStreamDecoder
+from serial_engine import SerialEngine
+
+
+@pytest.fixture
+def pty_serial():
+    master, slave = os.openpty()
+    tty.setraw(master)
+    ser = serial.Serial(os.ttyname(slave), 115200, timeout=1)
+    yield master, ser
+    ser.close()
+    os.close(master)
+    os.close(slave)
+
+
+def test_engine_receives_frames_from_one_chunk(pty_serial):
+    master, ser = pty_serial
+    engine = SerialEngine(ser)
+    engine.start()
+
+    os.write(master, cobs_encode(b"\x01\x00\x02") + cobs_encode(b"\x03"))
+
+    assert engine.receive(1) == b"\x01\x00\x02"
+    assert engine.receive(1) == b"\x03"
+    assert engine.receive(0.05) is None
+    engine.stop()
+
+
+def test_engine_writes_queued_frames(pty_serial):
+    master, ser = pty_serial
+    engine = SerialEngine(ser)
+    engine.start()
+
+    for i in range(1, 6):
+        engine.send(cobs_encode(bytes([i, 0])))
+
+    decoder = CobsStreamDecoder()
+    frames = []
+    while len(frames) < 5:
+        frames += decoder.feed(os.read(master, 1024))
+
+    assert frames == [bytes([i, 0]) for i in range(1, 6)]
+    engine.stop()
+
+
+def test_engine_reports_failed_port(pty_serial):
+    master, ser = pty_serial
+    errors = []
+    engine = SerialEngine(ser, on_error=errors.append)
+    engine.start()
+
+    # like a USB cable being pulled
+    ser.close()
+    engine.reader.join(1)
+
+    assert not engine.reader.is_alive()
+    assert len(errors) == 1
+    engine.stop()
@@ -0,0 +1,147 @@
+"""Test skipping settings the Arduino already has, and coalescing bursts.
+
+Jackson Smith
+Final Project
+"""
+
+import time
+
+import pytest
+
+from arducontroller import HEARTBEAT_TIMEOUT, ArduController, Command, motor_indices
+from shadow_state import ShadowState
+from simulator import SimulatedArduino
+
+PID = (2, 0, 0.5, 0, -100, 100, 0, 0)
+
+
+@pytest.fixture
+def sim():
+    sim = SimulatedArduino(motor_count=2)
+    sim.start()
+    yield sim
+    sim.stop()
+
+
+def test_shadow_state():
+    shadow = ShadowState()
+    assert not shadow.matches([0], {"mode": "analog"})
+
+    shadow.confirm([0, 1], {"mode": "analog", "speed": 30})
+    assert shadow.matches([0, 1], {"mode": "analog", "speed": 30})
+    assert not shadow.matches([0, 1], {"mode": "analog", "speed": 40})
+
+    shadow.forget([1], ["speed"])
+    assert shadow.matches([0], {"speed": 30})
+    assert not shadow.matches([0, 1], {"speed": 30})
+    assert shadow.get(1, "mode") == "analog"
+
+    shadow.clear()
+    assert shadow.get(0, "speed") is None
+
+
+def test_motor_indices():
+    assert motor_indices(3) == [3]
+    assert motor_indices((0, 2)) == [0, 2]
+    assert motor_indices(b"") == [0]
+    assert motor_indices(b"\x06") == [1, 2]
+
+
+def count_frames(ard):
+    """Count the frames an ArduController sends from now on.
+
+    Counted as they're handed over, since the engine counts its own
+    frames_out after writing them.
+    """
+    sent = []
+    send = ard.send
+    ard.send = lambda encoded: (sent.append(encoded), send(encoded))
+    return sent
+
+
+@pytest.mark.parametrize("options", [{}, {"pipelined": True}, {"framed": True, "pipelined": True}])
+def test_unchanged_settings_are_skipped(sim, options):
+    ard = ArduController(sim.port, **options)
+    try:
+        ard.set_pid(*PID, motor=1)
+        ard.set_position(5, motor=(0, 1))
+        sent = count_frames(ard)
+
+        ard.set_pid(*PID, motor=1)
+        assert ard.set_position(5, motor=1) == [5]
+        assert len(sent) == 0
+        assert ard.stats.skipped_writes == 2
+
+        # a different mode isn't the same setting
+        ard.set_motor(0, motor=1)
+        assert ard.set_position(5, motor=1) == [5]
+        assert len(sent) == 2
+        assert sim.motors[1].mode == "position"
+    finally:
+        ard.close()
+
+
+def test_bursts_are_coalesced(sim):
+    ard = ArduController(sim.port, write_interval=0.05)
+    try:
+        for position in range(1, 21):
+            ard.set_position(position)
+        # the first went straight out; the rest wait for the interval
+        assert sim.motors[0].setpoint == 1
+
+        time.sleep(0.1)
+        ard.request_encoder()
+        assert sim.motors[0].setpoint == 20
+        assert ard.stats.coalesced_writes == 18
+        assert ard.stats.latency[Command.SET_POSITION].count == 2
+    finally:
+        ard.close()
+
+
+def test_flush_writes_held_updates(sim):
+    ard = ArduController(sim.port, write_interval=10)
+    try:
+        ard.set_motor(30)
+        ard.set_motor(40)
+        assert sim.motors[0].speed == 30
+
+        ard.flush_writes()
+        assert sim.motors[0].speed == 40
+        # going back to what's held no longer needs a write
+        ard.set_motor(40)
+        assert ard.stats.skipped_writes == 1
+        assert not ard.held_writes
+    finally:
+        ard.close()
+
+
+def test_quiet_link_forgets_modes(sim):
+    ard = ArduController(sim.port)
+    try:
+        ard.set_motor(30)
+        # long enough for the Arduino to stop the motors
+        time.sleep(HEARTBEAT_TIMEOUT * 1.2)
+        assert sim.motors[0].mode == "stopped"
+
+        ard.set_motor(30)
+        ard.request_encoder()
+        assert sim.motors[0].mode == "analog"
+        assert ard.stats.skipped_writes == 0
+    finally:
+        ard.close()
+
+
+def test_reconnect_confirms_restored_settings(sim):
+    ard = ArduController(sim.port)
+    try:
+        ard.set_pid(*PID, motor=1)
+        sim.reset()
+        ard.ser.close()
+        ard.request_encoder()
+
+        sent = count_frames(ard)
+        ard.set_pid(*PID, motor=1)
+        assert len(sent) == 0
+        assert sim.motors[1].pid.KP == 2
+    finally:
+        ard.close()
@@ -0,0 +1,93 @@
+"""Test the firmware simulator.
+
+Jackson Smith
+Final Project
+"""
+
+import math
+
+import pytest
+from pid import PID, write_analog
+from simulator import CYCLE_DELAY, MotorPlant, SimulatedArduino
+
+
+def make_pid(*params):
+    now = [0.0]
+    pid = PID(*params, clock=lambda: now[0])
+    return pid, now
+
+
+def test_pid_proportional_and_limits():
+    pid, now = make_pid(2, 0, 0, 0, 0, 100, 0, 0)
+    now[0] = 5
+    assert pid.calculate(10, 0) == 20
+    now[0] = 10
+    assert pid.calculate(1000, 0) == 100
+
+
+def test_pid_zero_and_min_output():
+    # small outputs are zeroed; ones under min_output jump to max_output like pid.h
+    pid, now = make_pid(1, 0, 0, 3, 10, 50, 0, 0)
+    now[0] = 5
+    assert pid.calculate(2, 0) == 0
+    now[0] = 10
+    assert pid.calculate(-5, 0) == -50
+
+
+def test_pid_zero_output_under_min_output():
+    # 0 * inf is NaN on the Arduino, and the motor stops
+    pid, now = make_pid(1, 0, 0, 0, 10, 50, 0, 0)
+    now[0] = 5
+    output = pid.calculate(0, 0)
+    assert math.isnan(output)
+    assert write_analog(output) == 0
+
+
+def test_parked_motor_keeps_running():
+    sim = SimulatedArduino()
+    motor = sim.motors[0]
+    motor.pid.set_params(1, 0, 0, 0, 10, 50, 0, 0)
+    motor.mode = "position"
+    motor.setpoint = motor.encoder
+    sim.update(sim.last_update + 10 * CYCLE_DELAY)
+    sim.stop()
+
+    assert math.isnan(motor.output)
+    assert sim.encoder == motor.setpoint
+
+
+def test_pid_integrator_region_and_clamp():
+    pid, now = make_pid(0, 1, 0, 0, 0, 1000, 10, 8)
+    now[0] = 5
+    pid.calculate(5, 0)
+    assert pid.integrator == 8
+    now[0] = 10
+    pid.calculate(50, 0)
+    assert pid.integrator == 8
+
+
+def test_write_analog_truncates_and_flips():
+    assert write_analog(300.7) == -255
+    assert write_analog(-12.9) == 12
+    assert write_analog(math.nan) == 0
+
+
+def test_plant_reaches_steady_state_speed():
+    plant = MotorPlant(gain=10, time_constant=0.01, deadband=5)
+    plant.step(3, 1)
+    assert plant.position == 0
+    for _ in range(100):
+        plant.step(100, 0.01)
+    assert plant.velocity == pytest.approx(1000)
+
+
+def test_position_mode_settles():
+    sim = SimulatedArduino(plant=MotorPlant(gain=20, time_constant=0.05, deadband=0))
+    motor = sim.motors[0]
+    motor.pid.set_params(0.5, 0, 0, 0, 0, 255, 0, 0)
+    motor.mode = "position"
+    motor.setpoint = 500
+    sim.update(sim.last_update + 400 * CYCLE_DELAY)
+    sim.stop()
+
+    assert abs(sim.encoder - 500) <= 2
@@ -0,0 +1,105 @@
+"""Test the offline PID simulation and gain search.
+
+Jackson Smith
+Final Project
+"""
+
+from unittest.mock import Mock
+
+import numpy as np
+import pytest
+
+from pid import PID, write_analog
+from simulator import CYCLE_DELAY, MotorPlant
+from tuning import (
+    BASE_PARAMS,
+    PID_FIELDS,
+    PIDBatch,
+    as_kwargs,
+    grid,
+    push,
+    random_candidates,
+    search,
+    simulate,
+)
+
+
+def reference(params, plant, target, steps):
+    """Run one candidate through pid.PID and MotorPlant, like SimulatedMotor."""
+    cycle = [0]
+    pid = PID(**as_kwargs(params), clock=lambda: cycle[0] * CYCLE_DELAY * 1000.0)
+    encoders, pwms = [], []
+    for _ in range(steps):
+        cycle[0] += 1
+        pwm = write_analog(pid.calculate(float(plant.encoder), float(target)))
+        plant.step(pwm, CYCLE_DELAY)
+        encoders.append(plant.encoder)
+        pwms.append(pwm)
+    return encoders, pwms
+
+
+@pytest.mark.parametrize("target, dead_time", [(600, 0.0), (-250, 0.0), (600, 0.015)])
+def test_matches_pid_exactly(target, dead_time):
+    candidates = grid(
+        dict(BASE_PARAMS, KI=0.0005, I_region=80, I_max=40, zero_output=3, min_output=15, max_output=200),
+        KP=[0.05, 0.4, 2.0],
+        KD=[0.0, 2.0, 20.0],
+    )
+    plant = MotorPlant(dead_time=dead_time)
+    scores, (encoders, pwms) = simulate(candidates, plant, target, duration=0.6, record=True)
+
+    for i, params in enumerate(candidates):
+        expected_encoders, expected_pwms = reference(params, MotorPlant(dead_time=dead_time), target, encoders.shape[1])
+        assert encoders[i].tolist() == expected_encoders
+        assert pwms[i].tolist() == expected_pwms
+    assert np.all(np.isfinite(scores["cost"]) | np.isinf(scores["settling_time"]))
+
+
+def test_zero_error_under_min_output_matches_pid():
+    # a zero output scales up by infinity, which is NaN unless zero_output catches it
+    candidates = grid(dict(BASE_PARAMS, min_output=15, max_output=200), KP=[0.5, 2.0], zero_output=[0, 3])
+    now = [0.0]
+    batch = PIDBatch(candidates, clock=lambda: now[0])
+    pids = [PID(**as_kwargs(params), clock=lambda: now[0]) for params in candidates]
+
+    for measurement in (0.0, 0.0, 4.0, 100.0, 0.0):
+        now[0] += 5
+        outputs = batch.calculate(np.full(len(candidates), measurement), 0.0)
+        expected = [pid.calculate(measurement, 0.0) for pid in pids]
+        np.testing.assert_array_equal(outputs, expected)
+        if measurement == 0:
+            assert np.array_equal(np.isnan(outputs), candidates["zero_output"] == 0)
+
+
+def test_scores():
+    candidates = grid(KP=[0.0, 1.0])
+    scores = simulate(candidates, MotorPlant(), 500, duration=1.0)
+
+    # no gain never moves
+    assert scores[0]["settling_time"] == np.inf
+    assert scores[0]["effort"] == 0
+    # full drive into a 50 ms motor overshoots but settles
+    assert scores[1]["overshoot"] > 0
+    assert 0 < scores[1]["settling_time"] < 1.0
+    assert 0 < scores[1]["effort"] <= 1
+
+
+def test_pool_search_matches_serial():
+    candidates = random_candidates(300, seed=1, log_scale=True, KP=(0.01, 5), KD=(0.01, 5))
+    serial, serial_scores = search(candidates, MotorPlant(), 400, processes=1, duration=0.5)
+    pooled, pooled_scores = search(candidates, MotorPlant(), 400, processes=2, chunk_size=100, duration=0.5)
+
+    assert np.array_equal(serial, pooled)
+    assert np.array_equal(serial_scores, pooled_scores)
+    assert serial_scores["cost"].tolist() == sorted(serial_scores["cost"])
+
+
+def test_push_sends_set_pid():
+    ard = Mock()
+    params = grid(KP=[2.5])[0]
+    push(ard, params, motor=1)
+
+    kwargs = ard.set_pid.call_args.kwargs
+    assert kwargs.pop("motor") == 1
+    assert list(kwargs) == list(PID_FIELDS)
+    assert kwargs["KP"] == 2.5
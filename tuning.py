@@ -0,0 +1,418 @@
+"""Tune PID gains offline by simulating thousands of candidates at once.
+
+Every candidate runs the firmware's control loop against a motor model:
+PIDBatch does what pid.PID does, and MotorPlantBatch what the simulator's
+MotorPlant does, one NumPy operation per step across all candidates, so
+the results match the single-candidate classes exactly. Large searches
+are split over a process pool. The best gains can be sent straight to
+the board with push().
+
+Example usage:
+    candidates = grid(BASE_PARAMS, KP=np.linspace(0.5, 5, 40), KD=np.linspace(0, 0.5, 40))
+    ranked, scores = search(candidates, MotorPlant(), target=1000)
+    push(ard, ranked[0])
+
+Jackson Smith
+Final Project
+"""
+
+import argparse
+import itertools
+import math
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from simulator import CYCLE_DELAY, MotorPlant
+
+# set_pid's arguments, in order
+PID_FIELDS = ("KP", "KI", "KD", "zero_output", "min_output", "max_output", "I_region", "I_max")
+PID_DTYPE = np.dtype([(name, "<f8") for name in PID_FIELDS])
+
+# how well a candidate did: overshoot as a fraction of the step, seconds to
+# stay within the settling band (inf if it never does), mean |PWM| / 255,
+# and the weighted cost searches minimize
+SCORE_DTYPE = np.dtype([("overshoot", "<f8"), ("settling_time", "<f8"), ("effort", "<f8"), ("cost", "<f8")])
+
+# cost per unit of each score: a second of settling costs as much as
+# overshooting by the whole step, or ten times full drive throughout
+DEFAULT_WEIGHTS = {"settling_time": 1.0, "overshoot": 1.0, "effort": 0.1}
+
+# limits and integrator settings used when a search doesn't vary them
+BASE_PARAMS = {
+    "KP": 1.0,
+    "KI": 0.0,
+    "KD": 0.0,
+    "zero_output": 0.0,
+    "min_output": 0.0,
+    "max_output": 255.0,
+    "I_region": 50.0,
+    "I_max": 50.0,
+}
+
+# candidates per process pool task
+CHUNK_SIZE = 2048
+
+
+class PIDBatch:
+    """Many copies of pid.PID with different parameters, run in lockstep.
+
+    Every operation follows pid.PID.calculate in the same order, so each
+    copy gives the same outputs as its own pid.PID would.
+    """
+    def __init__(self, params, clock):
+        """
+        Initialize a PIDBatch.
+
+        Args:
+            params: Array of PID_DTYPE, one row per controller.
+            clock: Function returning the time in milliseconds.
+        """
+        self.params = params
+        self.clock = clock
+
+        self.prev_time = clock()
+        self.prev_measurement = np.zeros(len(params))
+        self.integrator = np.zeros(len(params))
+
+    def calculate(self, measurement, setpoint):
+        """Calculate every controller's output.
+
+        Args:
+            measurement: Current encoder counts, one per controller.
+            setpoint: Target encoder count.
+
+        Returns:
+            Array of controller outputs. A zero output below min_output is
+            NaN, as on the Arduino and from pid.PID.
+        """
+        p = self.params
+        current_time = self.clock()
+        dt = current_time - self.prev_time
+        self.prev_time = current_time
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            deriv = (measurement - self.prev_measurement) / dt
+            self.prev_measurement = measurement
+
+            error = measurement - setpoint
+            # integrate if within region
+            inside = np.abs(error) < p["I_region"]
+            integrator = np.where(inside, self.integrator + error * p["KI"] * dt, self.integrator)
+
+            # make sure integrator stays within bounds
+            over = inside & (np.abs(integrator) > p["I_max"])
+            self.integrator = np.where(over, integrator * (p["I_max"] / np.abs(integrator)), integrator)
+
+            output = p["KP"] * error + self.integrator + p["KD"] * deriv
+
+            magnitude = np.abs(output)
+            output = np.where(magnitude > p["max_output"], output * (p["max_output"] / magnitude), output)
+
+            magnitude = np.abs(output)
+            low = magnitude < p["min_output"]
+            output = np.where(low, output * (p["max_output"] / magnitude), output)
+            output = np.where(magnitude < p["zero_output"], 0.0, output)
+
+        return output
+
+
+class MotorPlantBatch:
+    """Many copies of one MotorPlant, driven with different PWM."""
+    def __init__(self, plant, count):
+        """
+        Initialize a MotorPlantBatch.
+
+        Args:
+            plant: The MotorPlant to copy, including its position and velocity.
+            count: Number of copies.
+        """
+        self.gain = plant.gain
+        self.time_constant = plant.time_constant
+        self.deadband = plant.deadband
+        self.dead_time = plant.dead_time
+
+        self.position = np.full(count, float(plant.position))
+        self.velocity = np.full(count, float(plant.velocity))
+        self.delayed = deque(np.full(count, float(pwm)) for pwm in plant.delayed)
+
+    def step(self, pwm, dt):
+        """Advance every copy, like MotorPlant.step.
+
+        Args:
+            pwm: Signed PWM applied to each copy.
+            dt: Seconds to advance.
+        """
+        if self.dead_time:
+            self.delayed.append(pwm)
+            pwm = self.delayed.popleft() if len(self.delayed) > round(self.dead_time / dt) else np.zeros_like(pwm)
+
+        drive = np.where(np.abs(pwm) <= self.deadband, 0.0, pwm)
+        target = self.gain * drive
+
+        decay = math.exp(-dt / self.time_constant)
+        new_velocity = target + (self.velocity - target) * decay
+        self.position = self.position + (target * dt + (self.velocity - target) * self.time_constant * (1 - decay))
+        self.velocity = new_velocity
+
+    @property
+    def encoder(self):
+        """Whole encoder counts."""
+        return np.floor(self.position)
+
+
+def write_analog(output, polarity=-1):
+    """Convert controller outputs to PWM, like pid.write_analog.
+
+    Args:
+        output: Array of controller outputs.
+        polarity: Motor polarity. The firmware's motor uses -1.
+
+    Returns:
+        Array of signed PWM between -255 and 255.
+    """
+    output = np.where(np.isnan(output), 0.0, output)
+    return np.clip(np.trunc(output), -255, 255) * polarity
+
+
+def simulate(params, plant, target, duration=1.0, polarity=-1, band=0.02, weights=None, record=False):
+    """Step every candidate to a setpoint and score the response.
+
+    Each candidate runs like SimulatedMotor in position mode: once per
+    CYCLE_DELAY the PID reads the encoder and drives the plant.
+
+    Args:
+        params: Array of PID_DTYPE, one row per candidate.
+        plant: MotorPlant to start every candidate from.
+        target: Setpoint, in encoder counts.
+        duration: Seconds to simulate. Default is 1.
+        polarity: Motor polarity. Default is -1, like the firmware's motor.
+        band: Settled once within this fraction of the step of the target,
+            and at least one count. Default is 0.02.
+        weights: Cost per unit of each score. Defaults to DEFAULT_WEIGHTS.
+        record: Also return the encoder counts and PWM at every step.
+
+    Returns:
+        Array of SCORE_DTYPE, one row per candidate. With record, a tuple of
+        that and (encoders, pwm) arrays shaped (candidates, steps).
+    """
+    params = np.asarray(params, dtype=PID_DTYPE)
+    count = len(params)
+    steps = round(duration / CYCLE_DELAY)
+
+    # the device clock, in whole control cycles so every dt is exact
+    cycle = [0]
+    pid = PIDBatch(params, lambda: cycle[0] * CYCLE_DELAY * 1000.0)
+    motors = MotorPlantBatch(plant, count)
+
+    step_size = abs(target - math.floor(plant.position)) or 1
+    tolerance = max(band * step_size, 1)
+    direction = 1 if target >= plant.position else -1
+
+    peak = np.full(count, -np.inf)
+    last_outside = np.full(count, -1)
+    effort = np.zeros(count)
+    if record:
+        encoders = np.empty((count, steps))
+        pwms = np.empty((count, steps))
+
+    for k in range(steps):
+        cycle[0] += 1
+        encoder = motors.encoder
+        pwm = write_analog(pid.calculate(encoder, float(target)), polarity)
+        motors.step(pwm, CYCLE_DELAY)
+
+        encoder = motors.encoder
+        peak = np.maximum(peak, (encoder - target) * direction)
+        last_outside[np.abs(encoder - target) > tolerance] = k
+        effort += np.abs(pwm)
+        if record:
+            encoders[:, k] = encoder
+            pwms[:, k] = pwm
+
+    scores = np.empty(count, dtype=SCORE_DTYPE)
+    scores["overshoot"] = np.maximum(peak, 0) / step_size
+    scores["settling_time"] = np.where(last_outside == steps - 1, np.inf, (last_outside + 1) * CYCLE_DELAY)
+    scores["effort"] = effort / (steps * 255)
+    scores["cost"] = cost(scores, weights)
+
+    if record:
+        return scores, (encoders, pwms)
+    return scores
+
+
+def cost(scores, weights=None):
+    """Weigh scores into one cost to minimize.
+
+    Args:
+        scores: Array of SCORE_DTYPE.
+        weights: Cost per unit of each score. Defaults to DEFAULT_WEIGHTS.
+
+    Returns:
+        Array of costs.
+    """
+    weights = DEFAULT_WEIGHTS if weights is None else weights
+    return sum(scores[name] * weight for name, weight in weights.items())
+
+
+def grid(base=None, **axes):
+    """Build every combination of some parameters' values.
+
+    Args:
+        base: Values for the parameters not varied. Defaults to BASE_PARAMS.
+        **axes: Parameter name to the values to try.
+
+    Returns:
+        Array of PID_DTYPE.
+    """
+    base = dict(BASE_PARAMS if base is None else base)
+    names = list(axes)
+    combos = list(itertools.product(*(np.asarray(axes[name], dtype=float) for name in names)))
+
+    params = np.empty(len(combos), dtype=PID_DTYPE)
+    for name in PID_FIELDS:
+        params[name] = base[name]
+    if combos:
+        values = np.array(combos)
+        for i, name in enumerate(names):
+            params[name] = values[:, i]
+    return params
+
+
+def random_candidates(count, base=None, seed=None, log_scale=False, **bounds):
+    """Draw parameters uniformly from ranges.
+
+    Args:
+        count: Number of candidates.
+        base: Values for the parameters not varied. Defaults to BASE_PARAMS.
+        seed: Seed, to draw the same candidates again. Default is None.
+        log_scale: Draw uniformly in log space, for ranges spanning decades.
+            Every bound must then be positive. Default is False.
+        **bounds: Parameter name to (low, high).
+
+    Returns:
+        Array of PID_DTYPE.
+    """
+    rng = np.random.default_rng(seed)
+    params = grid(base)
+    params = np.repeat(params, count)
+    for name, (low, high) in bounds.items():
+        if log_scale:
+            params[name] = np.exp(rng.uniform(math.log(low), math.log(high), count))
+        else:
+            params[name] = rng.uniform(low, high, count)
+    return params
+
+
+def _simulate_chunk(args):
+    """Run simulate() in a worker process."""
+    params, plant, target, kwargs = args
+    return simulate(params, plant, target, **kwargs)
+
+
+def search(candidates, plant, target, processes=None, chunk_size=CHUNK_SIZE, **kwargs):
+    """Simulate every candidate and rank them, best first.
+
+    Searches bigger than one chunk are spread over a process pool.
+
+    Args:
+        candidates: Array of PID_DTYPE, e.g. from grid() or random_candidates().
+        plant: MotorPlant to tune for.
+        target: Step size to tune for, in encoder counts.
+        processes: Worker processes. Defaults to one per CPU; 1 runs here.
+        chunk_size: Candidates per worker task. Default is CHUNK_SIZE.
+        **kwargs: Keyword arguments for simulate(), e.g. duration or weights.
+
+    Returns:
+        Tuple of (candidates, scores), both sorted by cost.
+    """
+    candidates = np.asarray(candidates, dtype=PID_DTYPE)
+    if processes is None:
+        processes = os.cpu_count() or 1
+
+    if processes == 1 or len(candidates) <= chunk_size:
+        scores = simulate(candidates, plant, target, **kwargs)
+    else:
+        chunks = [
+            (candidates[start:start + chunk_size], plant, target, kwargs)
+            for start in range(0, len(candidates), chunk_size)
+        ]
+        with ProcessPoolExecutor(processes) as pool:
+            scores = np.concatenate(list(pool.map(_simulate_chunk, chunks)))
+
+    order = np.argsort(scores["cost"], kind="stable")
+    return candidates[order], scores[order]
+
+
+def as_kwargs(params):
+    """Turn one candidate into keyword arguments for ArduController.set_pid.
+
+    Args:
+        params: One row of PID_DTYPE.
+
+    Returns:
+        Dictionary of parameter name to float.
+    """
+    return {name: float(params[name]) for name in PID_FIELDS}
+
+
+def push(ard, params, motor=0):
+    """Send a candidate's parameters to the board.
+
+    Args:
+        ard: An ArduController.
+        params: One row of PID_DTYPE, e.g. the first one search() returns.
+        motor: motor index, or iterable of indices. Default is 0.
+    """
+    ard.set_pid(**as_kwargs(params), motor=motor)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search for PID gains on a simulated motor.")
+    parser.add_argument("--gain", type=float, default=20.0, help="motor counts per second per PWM unit")
+    parser.add_argument("--time-constant", type=float, default=0.05, help="motor time constant in seconds")
+    parser.add_argument("--deadband", type=float, default=10, help="PWM needed to overcome friction")
+    parser.add_argument("--dead-time", type=float, default=0.0, help="seconds before PWM takes effect")
+    parser.add_argument("--log", help="fit the motor to this telemetry log instead")
+    parser.add_argument("--target", type=int, default=1000, help="step to tune for, in encoder counts")
+    parser.add_argument("--duration", type=float, default=1.0, help="seconds to simulate each step")
+    parser.add_argument("--count", type=int, default=20000, help="random candidates to try")
+    parser.add_argument("--seed", type=int, help="seed for the candidates")
+    parser.add_argument("--port", help="send the best gains to the board on this port")
+    parser.add_argument("--motor", type=int, default=0, help="motor to fit and send the gains to")
+    args = parser.parse_args()
+
+    if args.log:
+        from identification import fit_fopdt, fit_second_order, from_log
+        from recorder import TelemetryLog
+
+        run = from_log(TelemetryLog(args.log), args.motor)
+        fitted = min(fit_fopdt(*run), fit_second_order(*run), key=lambda result: result.rms_error)
+        print(f"fitted {fitted.model}: R^2 {fitted.r_squared:.4f}")
+        plant = fitted.plant()
+    else:
+        plant = MotorPlant(args.gain, args.time_constant, args.deadband, dead_time=args.dead_time)
+    candidates = random_candidates(
+        args.count, seed=args.seed, log_scale=True, KP=(0.01, 10), KI=(1e-6, 1e-2), KD=(1e-3, 10),
+    )
+    ranked, scores = search(candidates, plant, args.target, duration=args.duration)
+
+    best = as_kwargs(ranked[0])
+    print(", ".join(f"{name}={value:.6g}" for name, value in best.items()))
+    print(
+        f"overshoot {scores[0]['overshoot']:.1%}   settling {scores[0]['settling_time'] * 1000:.0f} ms"
+        f"   effort {scores[0]['effort']:.1%}"
+    )
+
+    if args.port:
+        from arducontroller import ArduController
+
+        ard = ArduController(args.port)
+        push(ard, ranked[0], args.motor)
+        ard.close()
+
+
+if __name__ == "__main__":
+    main()